@@ -0,0 +1,216 @@
+"""Top level await in Python code blocks and sessions.
+
+A top level await expression is rewritten to a call of _phm_await()
+which runs the awaitable on an event loop shared by the examples of
+the generated test file. With the phmdoctest-event-loop ini option
+set to session, all the generated test files share one event loop.
+Each thread gets its own asyncio event loop so test files run in
+--concurrent threads never drive the same loop.
+
+    result = await client.get(url)
+    result = _phm_await(client.get(url))
+
+The line numbers and the code around the await don't change. Top level
+async for and async with are not supported.
+"""
+import ast
+import asyncio
+import doctest
+import threading
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from phmdoctest.fenced import FencedBlock
+from phmdoctest.fenced import Role
+import pytest
+
+
+FILE = "file"
+SESSION = "session"
+EVENT_LOOP_CHOICES = [FILE, SESSION]
+"""Values of the phmdoctest-event-loop ini option."""
+
+EVENT_LOOP_CODE = """
+
+from pytest_phmdoctest import aio as _phm_aio
+
+_phm_event_loop = _phm_aio.module_loop()
+_phm_await = _phm_event_loop.run
+
+
+def teardown_module():
+    _phm_aio.close_module_loop(_phm_event_loop)
+"""
+"""Appended to a generated test file that has a top level await."""
+
+AWAIT_CALL = b"_phm_await("
+
+# ast.PyCF_ALLOW_TOP_LEVEL_AWAIT is new in Python 3.8.
+ALLOW_TOP_LEVEL_AWAIT = getattr(ast, "PyCF_ALLOW_TOP_LEVEL_AWAIT", 0)
+
+
+class EventLoop:
+    """Event loops created the first time an awaitable runs in each thread."""
+
+    def __init__(self) -> None:
+        self.loops: Dict[int, asyncio.AbstractEventLoop] = {}  # by thread ident
+        self.lock = threading.Lock()
+
+    def run(self, awaitable: Any) -> Any:
+        """Run the awaitable until it is done. Return its result."""
+        ident = threading.get_ident()
+        with self.lock:
+            loop = self.loops.get(ident)
+            if loop is None:
+                loop = self.loops[ident] = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(awaitable)
+
+    def close(self) -> None:
+        """Finish the asynchronous generators and close the event loops."""
+        with self.lock:
+            loops = list(self.loops.values())
+            self.loops.clear()
+        try:
+            for loop in loops:
+                try:
+                    loop.run_until_complete(loop.shutdown_asyncgens())
+                finally:
+                    loop.close()
+        finally:
+            if loops:
+                asyncio.set_event_loop(None)
+
+
+_session_loop: Optional[EventLoop] = None
+
+
+def use_session_loop(shared: bool) -> None:
+    """Share one event loop between the generated test files if shared."""
+    global _session_loop
+    _session_loop = EventLoop() if shared else None
+
+
+def configure(config) -> None:
+    """Check the phmdoctest-event-loop ini option. Share the loop if session."""
+    event_loop = config.getini("phmdoctest-event-loop").strip()
+    if event_loop not in EVENT_LOOP_CHOICES:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            f"phmdoctest-event-loop must be {' or '.join(EVENT_LOOP_CHOICES)},"
+            f" got {event_loop!r}."
+        )
+    use_session_loop(event_loop == SESSION)
+
+
+def close_session_loop() -> None:
+    """Close the event loop shared by the generated test files."""
+    global _session_loop
+    if _session_loop is not None:
+        _session_loop.close()
+        _session_loop = None
+
+
+def module_loop() -> EventLoop:
+    """Return the event loop for a generated test file."""
+    return _session_loop if _session_loop is not None else EventLoop()
+
+
+def close_module_loop(event_loop: EventLoop) -> None:
+    """Close the generated test file's event loop unless it is shared."""
+    if event_loop is not _session_loop:
+        event_loop.close()
+
+
+def find_awaits(node: ast.AST) -> List[ast.Await]:
+    """Return the await expressions outside of function definitions."""
+    found = []
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        if isinstance(child, ast.Await):
+            found.append(child)
+        found.extend(find_awaits(child))
+    return found
+
+
+def rewrite_awaits(source: str) -> str:
+    """Return the Python source with top level awaits replaced by _phm_await().
+
+    Return the source unchanged if it has none or doesn't parse.
+    """
+    if "await" not in source or not ALLOW_TOP_LEVEL_AWAIT:
+        return source
+    try:
+        tree = compile(
+            source, "<block>", "exec", flags=ast.PyCF_ONLY_AST | ALLOW_TOP_LEVEL_AWAIT
+        )
+    except SyntaxError:
+        return source
+    awaits = find_awaits(tree)
+    if not awaits:
+        return source
+    # ast column offsets count UTF-8 bytes.
+    data = source.encode("utf-8")
+    line_starts = [0]
+    for line in data.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(lineno: int, col_offset: int) -> int:
+        return line_starts[lineno - 1] + col_offset
+
+    edits: List[Tuple[int, int, bytes]] = []  # position, bytes to remove, insert
+    for node in awaits:
+        start = offset(node.lineno, node.col_offset)
+        keyword = len(b"await")
+        while data[start + keyword : start + keyword + 1] in (b" ", b"\t"):
+            keyword += 1
+        edits.append((start, keyword, AWAIT_CALL))
+        end_lineno = getattr(node, "end_lineno", None)
+        end_col_offset = getattr(node, "end_col_offset", None)
+        if end_lineno is None or end_col_offset is None:
+            return source
+        edits.append((offset(end_lineno, end_col_offset), 0, b")"))
+    for position, remove, insert in sorted(edits, reverse=True):
+        data = data[:position] + insert + data[position + remove :]
+    return data.decode("utf-8")
+
+
+def rewrite_session(contents: str) -> str:
+    """Return the Python interactive session with top level awaits rewritten."""
+    if "await" not in contents:
+        return contents
+    lines = contents.splitlines(keepends=True)
+    for example in doctest.DocTestParser().get_examples(contents):
+        rewritten = rewrite_awaits(example.source)
+        if rewritten == example.source:
+            continue
+        prompt = example.indent + 4  # ">>> " or "... "
+        for i, source_line in enumerate(rewritten.splitlines(keepends=True)):
+            line = lines[example.lineno + i]
+            if not line.endswith("\n"):
+                source_line = source_line.rstrip("\n")
+            lines[example.lineno + i] = line[:prompt] + source_line
+    return "".join(lines)
+
+
+def rewrite_blocks(blocks: List[FencedBlock]) -> bool:
+    """Rewrite the top level awaits of the Python blocks in place.
+
+    Return True if any block changed.
+    """
+    changed = False
+    for block in blocks:
+        if block.role == Role.SESSION:
+            contents = rewrite_session(block.contents)
+        elif block.role in (Role.CODE, Role.SETUP, Role.TEARDOWN):
+            contents = rewrite_awaits(block.contents)
+        else:
+            continue
+        if contents != block.contents:
+            block.contents = contents
+            changed = True
+    return changed
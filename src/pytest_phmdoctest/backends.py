@@ -0,0 +1,262 @@
+"""Where the plugin's cache entries are stored."""
+import abc
+import json
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+import uuid
+import zipfile
+
+from . import store
+
+
+DIR = "dir"
+SQLITE = "sqlite"
+SHARED = "shared"
+BACKEND_CHOICES = [DIR, SQLITE, SHARED]
+"""Values of the phmdoctest-cache-backend ini option."""
+
+SQLITE_FILENAME = "cache.sqlite3"
+
+KEY_PATTERN = re.compile(r"[0-9A-Za-z_]+")
+"""Keys allowed in an imported archive."""
+
+
+class Backend(abc.ABC):
+    """Base class for storage of text values by key.
+
+    Keys are hex digests or short names made of letters, digits, and _.
+    Subclasses implement get(), set(), keys(), and clear().
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Return the value saved for key or None."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """Save value for key."""
+
+    def contains(self, key: str) -> bool:
+        """True if a value is saved for key."""
+        return self.get(key) is not None
+
+    @abc.abstractmethod
+    def keys(self) -> Iterator[str]:
+        """Yield the keys of the saved values."""
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Remove all the saved values."""
+
+    def close(self) -> None:
+        """Release resources."""
+
+    def get_json(self, key: str, default: Any) -> Any:
+        """Return the JSON value saved for key or default."""
+        value = self.get(key)
+        if value is None:
+            return default
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+
+    def set_json(self, key: str, value: Any) -> None:
+        """Save value for key as JSON."""
+        self.set(key, json.dumps(value))
+
+
+class DirectoryBackend(Backend):
+    """Save each value in a JSON file named by its key in a local directory.
+
+    Files are written then renamed so readers never see a partial value.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        """Use directory. Create it if needed."""
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        """Return the file for key."""
+        return self.directory / (key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the value saved for key or None."""
+        try:
+            return self.path(key).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Save value for key."""
+        store.write_atomic(self.path(key), value)
+
+    def contains(self, key: str) -> bool:
+        """True if a value is saved for key."""
+        return self.path(key).exists()
+
+    def keys(self) -> Iterator[str]:
+        """Yield the keys of the saved values."""
+        for path in self.directory.glob("*.json"):
+            yield path.stem
+
+    def clear(self) -> None:
+        """Remove all the saved values."""
+        for path in self.directory.glob("*.json"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # Removed by another process.
+
+
+class SharedDirectoryBackend(DirectoryBackend):
+    """Directory that many processes and machines write at the same time.
+
+    Files are spread over subdirectories named by the first two
+    characters of the key. Each writer uses its own uniquely named
+    temporary file, flushes it to disk, and renames it into place.
+    The last rename wins. Use it only for values keyed by a hash of
+    their contents, which are the same for the same key.
+    """
+
+    def path(self, key: str) -> Path:
+        """Return the file for key."""
+        return self.directory / key[:2] / (key + ".json")
+
+    def set(self, key: str, value: str) -> None:
+        """Save value for key."""
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        unique = f"{os.getpid()}.{threading.get_ident()}.{uuid.uuid4().hex}"
+        partial = path.with_name(f"{path.name}.{unique}.tmp")
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(value)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+
+    def keys(self) -> Iterator[str]:
+        """Yield the keys of the saved values."""
+        for path in self.directory.glob("*/*.json"):
+            yield path.stem
+
+    def clear(self) -> None:
+        """Remove all the saved values."""
+        for path in self.directory.glob("*/*.json"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass  # Removed by another process.
+
+
+class SQLiteBackend(Backend):
+    """Save the values in a table in a single SQLite database file.
+
+    Suited to tens of thousands of entries. The database uses
+    write-ahead logging so readers don't block the writer.
+    """
+
+    def __init__(self, database: Path, table: str) -> None:
+        """Use table in the database file. Create them if needed."""
+        assert table.isidentifier()
+        database.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.connection: Optional[sqlite3.Connection] = sqlite3.connect(
+            str(database), timeout=30, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}"
+            " (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def execute(self, sql: str, *parameters: str) -> sqlite3.Cursor:
+        """Run an SQL statement with {table} replaced by the table name."""
+        assert self.connection is not None
+        return self.connection.execute(sql.format(table=self.table), parameters)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the value saved for key or None."""
+        row = self.execute("SELECT value FROM {table} WHERE key = ?", key).fetchone()
+        if row is None:
+            return None
+        return row[0]  # type: ignore
+
+    def set(self, key: str, value: str) -> None:
+        """Save value for key."""
+        self.execute("INSERT OR REPLACE INTO {table} VALUES (?, ?)", key, value)
+
+    def contains(self, key: str) -> bool:
+        """True if a value is saved for key."""
+        cursor = self.execute("SELECT 1 FROM {table} WHERE key = ?", key)
+        return cursor.fetchone() is not None
+
+    def keys(self) -> Iterator[str]:
+        """Yield the keys of the saved values."""
+        for row in self.execute("SELECT key FROM {table}").fetchall():
+            yield row[0]
+
+    def clear(self) -> None:
+        """Remove all the saved values."""
+        self.execute("DELETE FROM {table}")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def make_backend(kind: str, directory: Path, name: str) -> Backend:
+    """Create the backend kind for the values called name under directory."""
+    if kind == SQLITE:
+        return SQLiteBackend(directory / SQLITE_FILENAME, name)
+    if kind == SHARED:
+        return SharedDirectoryBackend(directory / name)
+    return DirectoryBackend(directory / name)
+
+
+def export_archive(archive: Path, backends: Dict[str, Backend]) -> int:
+    """Write the values in the backends to a zip archive.
+
+    Each value is saved as a member named by its backend name and key.
+    Return the number of values written.
+    """
+    count = 0
+    partial = archive.with_name(archive.name + f".{os.getpid()}.tmp")
+    with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, backend in backends.items():
+            for key in sorted(backend.keys()):
+                value = backend.get(key)
+                if value is not None:
+                    zf.writestr(f"{name}/{key}", value)
+                    count += 1
+    os.replace(partial, archive)
+    return count
+
+
+def import_archive(archive: Path, backends: Dict[str, Backend]) -> int:
+    """Add the values in a zip archive written by export_archive().
+
+    Values already in the backends are kept.
+    Return the number of values added.
+    """
+    count = 0
+    with zipfile.ZipFile(archive) as zf:
+        for member in zf.namelist():
+            name, _, key = member.partition("/")
+            backend = backends.get(name)
+            if backend is None or not KEY_PATTERN.fullmatch(key):
+                continue
+            if not backend.contains(key):
+                backend.set(key, zf.read(member).decode("utf-8"))
+                count += 1
+    return count
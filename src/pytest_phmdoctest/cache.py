@@ -0,0 +1,196 @@
+"""Persistent cache of detection results and generated test files."""
+import hashlib
+import json
+from pathlib import Path
+import sys
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+import phmdoctest
+import phmdoctest.tool
+
+from . import __version__
+from . import backends
+from . import collectors
+from . import generate
+from . import sharing
+
+
+CACHE_FORMAT = "9"
+"""Change when the layout of a cache entry changes to invalidate old entries."""
+
+CACHE_DIRNAME = "phmdoctest"
+"""Name of the plugin's directory in the pytest cache."""
+
+CHUNK_SIZE = 1024 * 1024
+"""Bytes read at a time when hashing a large Markdown file."""
+
+CacheEntry = Dict[str, Any]
+"""JSON serializable value saved for one Markdown file."""
+
+
+def cache_directory(config) -> Optional[Path]:
+    """Return the plugin's directory in the pytest cache or None if not available.
+
+    The pytest cacheprovider plugin may be disabled with -p no:cacheprovider.
+    """
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        return None
+    if collectors.PYTEST_GE_7:
+        return Path(cache.mkdir(CACHE_DIRNAME))
+    else:
+        # intended for pytest >=5 and <7
+        return Path(str(cache.makedir(CACHE_DIRNAME)))
+
+
+def distribution_version(name: str) -> str:
+    """Return the installed version of a distribution or "" if not known."""
+    try:
+        from importlib import metadata  # Python 3.8+
+
+        return metadata.version(name)
+    except ImportError:
+        pass
+    except Exception:  # metadata.PackageNotFoundError
+        return ""
+    try:
+        import pkg_resources
+
+        return pkg_resources.get_distribution(name).version
+    except Exception:
+        return ""
+
+
+def versions_fingerprint() -> str:
+    """Versions of the software that determine the generated test file.
+
+    commonmark parses the Markdown so its version matters too.
+    It has no __version__ attribute.
+    """
+    return " ".join(
+        [
+            CACHE_FORMAT,
+            __version__,
+            phmdoctest.__version__,
+            distribution_version("commonmark"),
+            sys.version,
+        ]
+    )
+
+
+def key_kwargs(kwargs: Dict[str, Any], streamed: bool) -> Dict[str, Any]:
+    """Return the phmdoctest kwargs that make the cache key.
+
+    The absolute path of the Markdown file is left out so checkouts
+    in different directories share entries. built_from is relative.
+    The line scanner used for streamed files may find different
+    blocks than the parser so it gets different keys.
+    """
+    settings = {k: v for k, v in kwargs.items() if k != "markdown_file"}
+    if streamed:
+        settings["streamed"] = True
+    return settings
+
+
+def settings_digest(versions: str, kwargs: Dict[str, Any]) -> Any:
+    """Start a hash of the versions and the phmdoctest kwargs."""
+    digest = hashlib.sha256()
+    digest.update(versions.encode("utf-8"))
+    digest.update(b"\0")
+    settings = json.dumps(kwargs, sort_keys=True, default=str)
+    digest.update(settings.encode("utf-8"))
+    digest.update(b"\0")
+    return digest
+
+
+def file_key(versions: str, markdown_path: Path, kwargs: Dict[str, Any]) -> str:
+    """Hash the versions, phmdoctest kwargs, and Markdown file read in chunks."""
+    digest = settings_digest(versions, kwargs)
+    with open(markdown_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_entry(generated: generate.Generated) -> CacheEntry:
+    """Return the cache entry for a generate.Generated result."""
+    return {
+        "has_code": generated.examples.has_code,
+        "has_session": generated.examples.has_session,
+        "test_file": generated.test_file,
+        "code_lines": list(generated.survivors.code),
+        "session_lines": list(generated.survivors.sessions),
+        "context": list(generated.context),
+        "blocks": [list(block) for block in generated.blocks],
+        "graph": [list(node) for node in generated.graph],
+    }
+
+
+def from_entry(entry: CacheEntry) -> generate.Generated:
+    """Return the generate.Generated result saved in a cache entry."""
+    return generate.Generated(
+        examples=phmdoctest.tool.PythonExamples(
+            has_code=entry["has_code"], has_session=entry["has_session"]
+        ),
+        test_file=entry["test_file"],
+        survivors=generate.Survivors(
+            code=tuple(entry["code_lines"]), sessions=tuple(entry["session_lines"])
+        ),
+        context=generate.Context(*entry["context"]),
+        blocks=tuple(generate.Block(*block) for block in entry["blocks"]),
+        graph=tuple(
+            sharing.Node(name, line, tuple(after), io)
+            for name, line, after, io in entry["graph"]
+        ),
+    )
+
+
+class GeneratedCache:
+    """Detection result and generated test file saved across pytest runs.
+
+    Entries are keyed by a hash of the Markdown file contents, the
+    phmdoctest keyword arguments for the file, and the versions
+    of Python, phmdoctest, and this plugin.
+    The Markdown file is not parsed when its entry is found.
+    Each entry is saved as JSON in a backends.Backend.
+    """
+
+    def __init__(self, backend: backends.Backend) -> None:
+        """Save the entries in backend."""
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._versions = versions_fingerprint()
+
+    def key(self, markdown: bytes, kwargs: Dict[str, Any]) -> str:
+        """Return the cache key for Markdown file contents and phmdoctest kwargs."""
+        digest = settings_digest(self._versions, kwargs)
+        digest.update(markdown)
+        return digest.hexdigest()
+
+    def key_from_file(self, markdown_path: Path, kwargs: Dict[str, Any]) -> str:
+        """Same as key() but read the Markdown file in chunks."""
+        return file_key(self._versions, markdown_path, kwargs)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry saved for key or None. Count hits and misses."""
+        entry = self.backend.get_json(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry  # type: ignore
+
+    def contains(self, key: str) -> bool:
+        """True if there is an entry for key. Does not count a hit or miss."""
+        return self.backend.contains(key)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Save entry for key. Other processes may be reading the cache."""
+        self.backend.set_json(key, entry)
+
+    def clear(self) -> None:
+        """Remove all the saved entries."""
+        self.backend.clear()
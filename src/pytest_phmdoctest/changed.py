@@ -0,0 +1,294 @@
+"""Only collect Markdown files changed since a git ref or the last run."""
+import hashlib
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import pytest
+
+from . import cache
+from . import deps
+from . import distributed
+from . import manifest
+
+
+LAST_RUN = "last-run"
+"""--phmdoctest-changed value that compares to the last run the file passed."""
+
+DEPS = "deps"
+"""--phmdoctest-changed value that also compares the project files the tests used."""
+
+STATE_KEY = "changed"
+"""pytest cache key of the Markdown file states saved when their tests passed."""
+
+DEPS_KEY = "deps"
+"""pytest cache key of the project files used by each Markdown file's tests."""
+
+FileState = List[Any]
+"""[st_mtime_ns, st_size, sha256 hex digest] of a file."""
+
+
+def file_digest(path: Path) -> str:
+    """Return the sha256 hex digest of the file read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(cache.CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compare(path: Path, recorded: Optional[FileState]) -> Tuple[bool, FileState]:
+    """Compare the file to its recorded state. Return (changed, current state).
+
+    The file is hashed only when its size matches but the
+    modification time does not, or when there is no recorded state.
+    """
+    stat = path.stat()
+    if recorded is not None and recorded[1] == stat.st_size:
+        if recorded[0] == stat.st_mtime_ns:
+            return False, recorded
+        digest = file_digest(path)
+        # Unchanged if only touched.
+        return recorded[2] != digest, [stat.st_mtime_ns, stat.st_size, digest]
+    return True, [stat.st_mtime_ns, stat.st_size, file_digest(path)]
+
+
+class ChangedFiles:
+    """Decide if a Markdown file changed since a git ref or the last run.
+
+    Compared to a git ref the changed files are listed once by git.
+    Compared to the last run a file is unchanged if its modification
+    time and size, or else its contents, are the same as recorded
+    in the pytest cache by the last run where all its tests ran
+    and none failed.
+    With DEPS a Markdown file is also changed if a project file
+    its tests used in that run changed.
+    The reports carry the Markdown file, its state, and the project
+    files used to the pytest-xdist controller, which saves them.
+    """
+
+    def __init__(self, config, ref: str) -> None:
+        self.config = config
+        self.invoke_path = Path(config.invocation_params.dir)
+        self.root = Path(str(config.rootdir))
+        self.git_changed: Optional[Set[Path]] = None
+        self.state: Dict[str, FileState] = {}
+        self.new_state: Dict[str, FileState] = {}
+        self.deps: Optional[Dict[str, Dict[str, FileState]]] = None
+        self.new_deps: Dict[str, Dict[str, FileState]] = {}
+        self.failed: Set[str] = set()
+        self.selected: Optional[Dict[str, int]] = None  # test cases by file
+        self.ran: Dict[str, int] = {}  # test cases with a teardown report
+        self.deselected: Set[str] = set()
+        self.no_test_files: Set[str] = set()
+        self.collect_failed = False
+        self.recorder: Any = None
+        if ref in (LAST_RUN, DEPS):
+            if config.phmdoctest_state is None:
+                raise pytest.UsageError(
+                    "pytest-phmdoctest plugin usage error. "
+                    f"--phmdoctest-changed={ref} needs the pytest cache."
+                )
+            self.state = config.phmdoctest_state.get_json(STATE_KEY, {})
+            if ref == DEPS:
+                self.deps = config.phmdoctest_state.get_json(DEPS_KEY, {})
+                self.recorder = deps.make_recorder(self.root)
+        else:
+            paths = manifest.git_changed_markdown_files(self.invoke_path, ref)
+            self.git_changed = set(paths)
+
+    def is_changed(self, path: Path) -> bool:
+        """True if the Markdown file should be collected."""
+        if self.git_changed is not None:
+            return path in self.git_changed
+        name = path.relative_to(self.invoke_path).as_posix()
+        changed, self.new_state[name] = compare(path, self.state.get(name))
+        if changed or self.deps is None:
+            return changed
+        return self.dependency_changed(name)
+
+    def dependency_changed(self, name: str) -> bool:
+        """True if a project file used by the Markdown file's tests changed."""
+        assert self.deps is not None
+        recorded = self.deps.get(name)
+        if recorded is None:
+            return True  # The tests never ran with DEPS.
+        for dependency, dependency_state in recorded.items():
+            try:
+                changed, _ = compare(self.root / dependency, dependency_state)
+            except OSError:
+                return True  # Removed.
+            if changed:
+                return True
+        return False
+
+    def no_tests(self, markdown_path: Path) -> None:
+        """The Markdown file has no tests so its tests use no project files."""
+        name = markdown_path.relative_to(self.invoke_path).as_posix()
+        self.no_test_files.add(name)
+        if self.recorder is not None:
+            self.new_deps[name] = {}
+
+    def markdown_name(self, item: pytest.Item) -> Optional[str]:
+        """Return the Markdown file of a generated test case or None."""
+        markdown_path = self.config.phmdoctest_outfiles.get(Path(str(item.fspath)))
+        if markdown_path is None:
+            return None
+        return markdown_path.relative_to(self.invoke_path).as_posix()
+
+    def used_files(self, files: Set[str]) -> Dict[str, FileState]:
+        """Return the state of each project file used by a test case."""
+        used = {}
+        for relative in files:
+            try:
+                _, used[relative] = compare(self.root / relative, None)
+            except OSError:
+                pass
+        return used
+
+    def start_recording(self, item: pytest.Item) -> bool:
+        """Start recording if item is a Markdown test case. Return True if started.
+
+        add_to_report() stops recording at the item's teardown report.
+        """
+        if self.recorder is None or self.markdown_name(item) is None:
+            return False
+        self.recorder.start()
+        return True
+
+    def pytest_deselected(self, items) -> None:
+        """pytest hook. Files with deselected test cases are not recorded."""
+        for item in items:
+            name = self.markdown_name(item)
+            if name is not None:
+                self.deselected.add(name)
+
+    def pytest_collection_finish(self, session) -> None:
+        """pytest hook. Count the selected test cases of each Markdown file.
+
+        Not called on the pytest-xdist controller.
+        """
+        self.selected = {}
+        for item in session.items:
+            name = self.markdown_name(item)
+            if name is not None:
+                self.selected[name] = self.selected.get(name, 0) + 1
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem) -> Any:
+        """pytest hook. Record the project files used by a Markdown test case."""
+        if not self.start_recording(item):
+            yield
+            return
+        try:
+            yield
+        finally:
+            _ = self.recorder.stop()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call) -> Any:
+        """pytest hook. Put the Markdown file in the report.
+
+        The report carries it to the pytest-xdist controller.
+        """
+        outcome = yield
+        self.add_to_report(item, outcome.get_result())
+
+    def add_to_report(self, item: pytest.Item, report: Any) -> None:
+        """Put the Markdown file in the report.
+
+        The teardown report also gets the Markdown file's state and
+        the project files the test case used. They are listed in
+        phmdoctest_used when the test case ran in another process.
+        """
+        name = self.markdown_name(item)
+        if name is None:
+            return
+        report.phmdoctest_changed = name
+        if report.when == "teardown":
+            report.phmdoctest_changed_state = self.new_state.get(name)
+            if self.recorder is not None:
+                files = self.recorder.stop()
+                used = getattr(report, "phmdoctest_used", None)
+                if used is not None:
+                    files = set(used)
+                report.phmdoctest_deps = self.used_files(files)
+
+    def pytest_runtest_logreport(self, report) -> None:
+        """pytest hook. Remember failures and the project files used."""
+        name = getattr(report, "phmdoctest_changed", None)
+        if name is None:
+            return
+        if report.failed:
+            self.failed.add(name)
+        if report.when == "teardown":
+            self.ran[name] = self.ran.get(name, 0) + 1
+            state = getattr(report, "phmdoctest_changed_state", None)
+            if state is not None:
+                self.new_state[name] = state
+            used = getattr(report, "phmdoctest_deps", None)
+            if used is not None:
+                self.new_deps.setdefault(name, {}).update(used)
+
+    def pytest_collectreport(self, report) -> None:
+        """pytest hook. Don't save anything if collecting failed."""
+        if report.failed:
+            self.collect_failed = True
+
+    def passed_files(self) -> Set[str]:
+        """Return the Markdown files whose test cases all ran and passed.
+
+        The pytest-xdist controller only sees the test cases that ran.
+        """
+        if self.selected is None:
+            ran = set(self.ran)
+        else:
+            ran = {
+                name
+                for name, count in self.selected.items()
+                if self.ran.get(name) == count
+            }
+        return (ran | self.no_test_files) - self.failed - self.deselected
+
+    def pytest_sessionfinish(self, session, exitstatus) -> None:
+        """pytest hook. Record the Markdown files whose tests all passed.
+
+        With pytest-xdist the controller saves them.
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.git_changed is not None or distributed.is_worker(self.config):
+            return
+        if self.config.option.collectonly:
+            return
+        if self.collect_failed or exitstatus not in (
+            pytest.ExitCode.OK,
+            pytest.ExitCode.TESTS_FAILED,
+            pytest.ExitCode.NO_TESTS_COLLECTED,
+        ):
+            return
+        passed_files = self.passed_files()
+        passed = {k: v for k, v in self.new_state.items() if k in passed_files}
+        if not passed:
+            return
+        state = dict(self.state)
+        state.update(passed)
+        self.config.phmdoctest_state.set_json(STATE_KEY, state)
+        new_deps = {k: v for k, v in self.new_deps.items() if k in passed_files}
+        if self.deps is not None and new_deps:
+            deps_state = dict(self.deps)
+            deps_state.update(new_deps)
+            self.config.phmdoctest_state.set_json(DEPS_KEY, deps_state)
+
+
+def configure(config) -> Optional[ChangedFiles]:
+    """Register the changed files plugin for --phmdoctest-changed REF."""
+    if config.option.phmdoctest_changed is None:
+        return None
+    changed_files = ChangedFiles(config, config.option.phmdoctest_changed)
+    config.pluginmanager.register(changed_files, "phmdoctest-changed")
+    return changed_files
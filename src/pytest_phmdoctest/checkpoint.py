@@ -0,0 +1,282 @@
+"""Fork a process for each group of examples after the setup block ran.
+
+POSIX only. The first test case of a Markdown file sets up the module
+fixtures, which runs the setup block. The process then forks a child
+for each connected group of examples in the sharing.py graph. The
+children run their test cases and write the reports to a file. The
+teardown block runs once in this process after the last test case.
+
+This uses pytest internals _pytest.runner.call_and_report() and the
+capture manager's _global_capturing. They are not part of the pytest API.
+"""
+import os
+from pathlib import Path
+import pickle
+from tempfile import TemporaryDirectory
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import pytest
+from _pytest.runner import call_and_report
+
+from . import index
+from . import isolate
+from . import sharing
+
+
+CRASHED = "pytest-phmdoctest checkpoint process exited while running the test case."
+
+POLL_SECONDS = 0.01
+"""Time between checks for forked processes that exited."""
+
+
+class FileGroups:
+    """The test cases of one Markdown file split into groups."""
+
+    def __init__(self, items: List[pytest.Item], groups: List[List[pytest.Item]]):
+        self.items = items
+        self.groups = groups
+        self.reports: Dict[str, List[Any]] = {}  # by nodeid
+        self.forked = False
+
+
+def split_items(
+    items: List[pytest.Item], groups: sharing.Groups
+) -> Optional[List[List[pytest.Item]]]:
+    """Put each test case in its group or return None if one is unknown.
+
+    Doctests not named by a group, like session_00000 which fills the
+    doctest namespace, join the group of the sessions.
+    """
+    group_of_name = {name: i for i, names in enumerate(groups) for name in names}
+    sessions = next(
+        (i for i, names in enumerate(groups) if any("session" in n for n in names)),
+        None,
+    )
+    split: List[List[pytest.Item]] = [[] for _ in groups]
+    for item in items:
+        i = group_of_name.get(index.function_name(item))
+        if i is None and hasattr(item, "dtest"):
+            i = sessions
+        if i is None:
+            return None
+        split[i].append(item)
+    return [group for group in split if group]
+
+
+def restart_capture(config) -> None:
+    """Give this forked process its own files for pytest's global capture."""
+    capman = config.pluginmanager.getplugin("capturemanager")
+    multicapture = getattr(capman, "_global_capturing", None)
+    if multicapture is not None:
+        multicapture.stop_capturing()
+        capman._global_capturing = None
+        capman.start_global_capturing()
+
+
+def run_group(config, first: pytest.Item, group: List[pytest.Item], path: Path) -> None:
+    """Run the group's test cases in a forked process. Write the reports to path.
+
+    first was set up before the fork. The module fixtures are never
+    torn down here. The project files used by the test cases are
+    recorded here and sent to this process with the teardown reports.
+    first's recording started before the fork with its setup.
+    """
+    restart_capture(config)
+    changed_files = getattr(config, "phmdoctest_changed", None)
+    with open(path, "wb") as f:
+
+        def write(report) -> None:
+            data = config.hook.pytest_report_to_serializable(
+                config=config, report=report
+            )
+            pickle.dump(data, f)
+            f.flush()
+
+        if group[0] is not first:
+            # Tear down only first's function scoped fixtures.
+            _ = call_and_report(first, "teardown", log=False, nextitem=group[0])
+        for i, item in enumerate(group):
+            # Keep the module fixtures by naming a test case in the same module.
+            nextitem = group[i + 1] if i + 1 < len(group) else first
+            if item is first:
+                passed = True
+            else:
+                if changed_files is not None:
+                    _ = changed_files.start_recording(item)
+                report = call_and_report(item, "setup", log=False)
+                write(report)
+                passed = report.passed
+            if passed:
+                write(call_and_report(item, "call", log=False))
+            write(call_and_report(item, "teardown", log=False, nextitem=nextitem))
+
+
+def read_reports(config, path: Path) -> Dict[str, List[Any]]:
+    """Return the reports a forked process wrote by nodeid."""
+    reports: Dict[str, List[Any]] = {}
+    try:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    data = pickle.load(f)
+                except EOFError:
+                    break
+                report = config.hook.pytest_report_from_serializable(
+                    config=config, data=data
+                )
+                reports.setdefault(report.nodeid, []).append(report)
+    except (OSError, pickle.UnpicklingError):
+        pass  # The process exited while writing.
+    return reports
+
+
+def fork_groups(
+    config, first: pytest.Item, groups: List[List[pytest.Item]], processes: int
+) -> Dict[str, List[Any]]:
+    """Run each group in a forked process. At most processes run at once."""
+    reports: Dict[str, List[Any]] = {}
+    with TemporaryDirectory() as name:
+        paths = [Path(name) / f"{i}.pickle" for i in range(len(groups))]
+        running: Dict[int, int] = {}  # pid to group index
+        waiting = list(range(len(groups)))
+        while waiting or running:
+            while waiting and len(running) < processes:
+                i = waiting.pop(0)
+                pid = os.fork()  # type: ignore[attr-defined]
+                if pid == 0:
+                    try:
+                        run_group(config, first, groups[i], paths[i])
+                    finally:
+                        os._exit(0)
+                running[pid] = i
+            exited = [pid for pid in running if has_exited(pid)]
+            if not exited:
+                time.sleep(POLL_SECONDS)
+            for pid in exited:
+                i = running.pop(pid)
+                reports.update(read_reports(config, paths[i]))
+    return reports
+
+
+def has_exited(pid: int) -> bool:
+    """True if the forked process exited.
+
+    Only wait for our own process. The examples may start other child
+    processes that they wait for themselves.
+    """
+    try:
+        waited, _ = os.waitpid(pid, os.WNOHANG)  # type: ignore[attr-defined]
+    except ChildProcessError:
+        return True  # Reaped by an example.
+    return waited == pid
+
+
+class CheckpointRunner:
+    """pytest plugin that forks after the setup block of each Markdown file."""
+
+    def __init__(self, config, processes: int) -> None:
+        self.config = config
+        self.processes = processes
+        self.file_of_item: Dict[str, FileGroups] = {}
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items) -> None:
+        """pytest hook. Group the test cases of Markdown files with a setup block."""
+        outfiles: Dict[Path, Path] = config.phmdoctest_outfiles
+        graphs: Dict[Path, sharing.Graph] = config.phmdoctest_graphs
+        all_groups: Dict[Path, sharing.Groups] = {}
+        by_outfile: Dict[Path, List[pytest.Item]] = {}
+        for item in items:
+            outfile = Path(str(item.fspath))
+            markdown_path = outfiles.get(outfile)
+            if markdown_path is None:
+                continue
+            if markdown_path not in all_groups:
+                all_groups[markdown_path] = sharing.group_examples(
+                    graphs.get(markdown_path, ())
+                )
+            if all_groups[markdown_path]:
+                by_outfile.setdefault(outfile, []).append(item)
+        for outfile, file_items in by_outfile.items():
+            start = items.index(file_items[0])
+            if items[start : start + len(file_items)] != file_items:
+                continue  # Reordered by another plugin.
+            if any(isolate.is_cached_pass(item) for item in file_items):
+                continue
+            groups = split_items(file_items, all_groups[outfiles[outfile]])
+            if groups is None or len(groups) < 2:
+                continue
+            file_groups = FileGroups(file_items, groups)
+            for item in file_items:
+                self.file_of_item[item.nodeid] = file_groups
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem) -> Optional[bool]:
+        """pytest hook. Log the reports of a test case run after the checkpoint."""
+        file_groups = self.file_of_item.get(item.nodeid)
+        if file_groups is None:
+            return None
+        first = file_groups.items[0]
+        if item is not first and not file_groups.forked:
+            return None  # pytest reports the setup error again.
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        if item is first:
+            reports = self.checkpoint(item, nextitem, file_groups)
+        else:
+            reports = isolate.complete_reports(
+                item, file_groups.reports.get(item.nodeid, []), CRASHED
+            )
+        if item is file_groups.items[-1] and file_groups.forked:
+            # Tear down the module fixtures. This runs the teardown block.
+            # Only the first test case was set up in this process.
+            teardown = call_and_report(first, "teardown", log=False, nextitem=nextitem)
+            teardown.nodeid = item.nodeid
+            teardown.location = item.location
+            if teardown.failed:
+                reports = [r for r in reports if r.when != "teardown"] + [teardown]
+        for report in reports:
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+    def checkpoint(
+        self,
+        first: pytest.Item,
+        nextitem: Optional[pytest.Item],
+        file_groups: FileGroups,
+    ) -> List[Any]:
+        """Set up the first test case, then fork. Return its reports."""
+        setup = call_and_report(first, "setup", log=False)
+        if not setup.passed:
+            teardown = call_and_report(first, "teardown", log=False, nextitem=nextitem)
+            return [setup, teardown]
+        file_groups.reports = fork_groups(
+            self.config, first, file_groups.groups, self.processes
+        )
+        file_groups.forked = True
+        reports = file_groups.reports.get(first.nodeid, [])
+        return isolate.complete_reports(first, [setup] + reports, CRASHED)
+
+
+def configure(config) -> Optional[CheckpointRunner]:
+    """Register the checkpoint plugin for --phmdoctest-checkpoint."""
+    if not config.option.phmdoctest_checkpoint:
+        return None
+    if not hasattr(os, "fork"):
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            "--phmdoctest-checkpoint needs os.fork()."
+        )
+    if config.phmdoctest_isolate is not None:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            "Cannot use --phmdoctest-checkpoint with "
+            f"--phmdoctest-isolate={isolate.SUBPROCESS}."
+        )
+    runner = CheckpointRunner(config, processes=os.cpu_count() or 1)
+    config.pluginmanager.register(runner, "phmdoctest-checkpoint")
+    return runner
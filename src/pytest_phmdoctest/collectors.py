@@ -1,11 +1,14 @@
 """Build pytest collectors instances per pytest versions."""
+import functools
 from packaging.version import Version
 from pathlib import Path
+from typing import Any
 from typing import Iterable
 from typing import NewType
 from typing import Optional
 from typing import Tuple
 from typing import Union
+from unittest.mock import patch
 
 import py
 import pytest
@@ -137,3 +140,82 @@ def bundled_collector(
             parent, fspath=pypath, name=name
         )  # type: BundledCollector
     return bc
+
+
+class StoreModule(Module):
+    """Module that gets the generated test module from a store."""
+
+    phmdoctest_store = None  # type: Any
+
+    def _getobj(self):  # type: ignore
+        """Override pytest non-public method that imports the test file."""
+        return self.phmdoctest_store.load(Path(str(self.fspath)))
+
+
+def store_module(parent: Collector, pathlib_path: Path, store: Any) -> Module:
+    """Create StoreModule collector for the generated test file of pathlib_path."""
+    if PYTEST_GE_7:
+        mod = StoreModule.from_parent(parent, path=pathlib_path)
+    else:
+        # intended for pytest >=5 and <7
+        pypath = py.path.local(str(pathlib_path))
+        mod = StoreModule.from_parent(parent, fspath=pypath)
+    mod.phmdoctest_store = store
+    return mod
+
+
+@functools.lru_cache(maxsize=None)
+def store_doctest_module_class() -> Any:
+    """Return a DoctestModule subclass that gets the module from a store.
+
+    On pytest 8 and later DoctestModule is a Module and collect() gets
+    the module from _getobj(). Older DoctestModule.collect() calls the
+    non-public pytest function import_path(). It is replaced while
+    collecting.
+    """
+    import _pytest.doctest
+    from _pytest.doctest import DoctestModule
+
+    class StoreDoctestModule(DoctestModule):  # type: ignore
+        """DoctestModule that gets the generated test module from a store."""
+
+        phmdoctest_store = None  # type: Any
+
+        def _getobj(self):  # type: ignore
+            """Override pytest non-public method that imports the test file."""
+            return self.phmdoctest_store.load(Path(str(self.fspath)))
+
+        def collect(self):  # type: ignore
+            """Override parent. Collect doctests from the store's module."""
+            if not hasattr(_pytest.doctest, "import_path"):
+                return list(super().collect())
+            module = self._getobj()
+
+            def import_path(*args: Any, **kwargs: Any) -> Any:
+                return module
+
+            with patch.object(_pytest.doctest, "import_path", import_path):
+                return list(super().collect())
+
+    return StoreDoctestModule
+
+
+def store_doctest_module(
+    parent: Collector, pathlib_path: Path, store: Any
+) -> Optional["DoctestModule"]:
+    """Create DoctestModule collector for the generated test file of pathlib_path.
+
+    Return None if the DoctestModule class can't be used this way.
+    """
+    try:
+        doctest_module_class = store_doctest_module_class()
+        if PYTEST_GE_7:
+            docmod = doctest_module_class.from_parent(parent, path=pathlib_path)
+        else:
+            # intended for pytest >=5 and <7
+            pypath = py.path.local(str(pathlib_path))
+            docmod = doctest_module_class.from_parent(parent, fspath=pypath)
+    except (TypeError, AttributeError, ModuleNotFoundError, ImportError):
+        return None
+    docmod.phmdoctest_store = store
+    return docmod  # type: ignore
@@ -0,0 +1,161 @@
+"""Record the project source files each Markdown file's tests use."""
+import builtins
+from pathlib import Path
+import sys
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Set
+
+
+TOOL_IDS = (3, 4)
+"""sys.monitoring tool ids not reserved for debuggers, coverage, and profilers."""
+
+
+def project_file(root: Path, filename: Optional[str]) -> Optional[str]:
+    """Return filename relative to root if it is a project .py file, or None.
+
+    Files outside root, installed packages, and files in hidden
+    directories like .pytest_cache and .venv are not project files.
+    """
+    if not filename or not filename.endswith(".py"):
+        return None
+    try:
+        relative = Path(filename).resolve().relative_to(root)
+    except (OSError, ValueError):
+        return None
+    if any(part.startswith(".") for part in relative.parts):
+        return None
+    if "site-packages" in relative.parts or "dist-packages" in relative.parts:
+        return None
+    return relative.as_posix()
+
+
+class MonitoringRecorder:
+    """Record the files of the functions called using sys.monitoring.
+
+    Python 3.12 and later. Each code object reports its first call
+    and is then disabled to keep the overhead low. start() enables
+    all code objects again.
+    """
+
+    def __init__(self, root: Path, tool_id: int) -> None:
+        self.root = root
+        self.filenames: Set[str] = set()
+        self.tool_id: Optional[int] = tool_id
+
+    def on_start(self, code: Any, instruction_offset: int) -> Any:
+        """sys.monitoring PY_START callback."""
+        self.filenames.add(code.co_filename)
+        return sys.monitoring.DISABLE  # type: ignore
+
+    def start(self) -> None:
+        """Start recording."""
+        self.filenames = set()
+        if self.tool_id is None:
+            return
+        monitoring = sys.monitoring  # type: ignore
+        monitoring.register_callback(
+            self.tool_id, monitoring.events.PY_START, self.on_start
+        )
+        monitoring.restart_events()
+        monitoring.set_events(self.tool_id, monitoring.events.PY_START)
+
+    def stop(self) -> Set[str]:
+        """Stop recording. Return the project files used."""
+        if self.tool_id is not None:
+            monitoring = sys.monitoring  # type: ignore
+            monitoring.set_events(self.tool_id, 0)
+            monitoring.register_callback(self.tool_id, monitoring.events.PY_START, None)
+        return self.project_files(self.filenames)
+
+    def project_files(self, filenames: Set[str]) -> Set[str]:
+        """Keep the project files."""
+        files = set()
+        for filename in filenames:
+            relative = project_file(self.root, filename)
+            if relative is not None:
+                files.add(relative)
+        return files
+
+    def close(self) -> None:
+        """Give up the sys.monitoring tool id."""
+        if self.tool_id is not None:
+            sys.monitoring.free_tool_id(self.tool_id)  # type: ignore
+            self.tool_id = None
+
+
+class ImportRecorder:
+    """Record the modules imported by import statements that run.
+
+    For Python before 3.12. Replaces builtins.__import__ while recording.
+    Submodules of an imported module that are already imported
+    are included since the module may use them.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.names: Set[str] = set()
+        self.saved_import: Optional[Callable[..., Any]] = None
+
+    def recording_import(
+        self,
+        name: str,
+        globals: Any = None,
+        locals: Any = None,
+        fromlist: Any = (),
+        level: int = 0,
+    ) -> Any:
+        """Replacement for builtins.__import__."""
+        assert self.saved_import is not None
+        module = self.saved_import(name, globals, locals, fromlist, level)
+        if level == 0:
+            self.names.add(name)
+        elif fromlist:
+            self.names.add(module.__name__)
+        for item in fromlist or ():
+            self.names.add(f"{module.__name__}.{item}")
+        return module
+
+    def start(self) -> None:
+        """Start recording."""
+        self.names = set()
+        self.saved_import = builtins.__import__
+        builtins.__import__ = self.recording_import
+
+    def stop(self) -> Set[str]:
+        """Stop recording. Return the project files used."""
+        if self.saved_import is not None:
+            builtins.__import__ = self.saved_import
+            self.saved_import = None
+        prefixes = tuple(name + "." for name in self.names)
+        files = set()
+        for name, module in list(sys.modules.items()):
+            if name in self.names or name.startswith(prefixes):
+                filename = getattr(module, "__file__", None)
+                relative = project_file(self.root, filename)
+                if relative is not None:
+                    files.add(relative)
+        return files
+
+    def close(self) -> None:
+        """Nothing to release."""
+
+
+def claim_tool_id() -> Optional[int]:
+    """Claim a free sys.monitoring tool id. Return None if they are all in use."""
+    monitoring = sys.monitoring  # type: ignore
+    for tool_id in TOOL_IDS:
+        if monitoring.get_tool(tool_id) is None:
+            monitoring.use_tool_id(tool_id, "pytest-phmdoctest")
+            return tool_id
+    return None
+
+
+def make_recorder(root: Path) -> Any:
+    """Use sys.monitoring if a tool id is free, otherwise the import hook."""
+    if hasattr(sys, "monitoring"):
+        tool_id = claim_tool_id()
+        if tool_id is not None:
+            return MonitoringRecorder(root, tool_id)
+    return ImportRecorder(root)
@@ -0,0 +1,56 @@
+"""Generate once on the pytest-xdist controller and share with the workers."""
+from pathlib import Path
+from typing import Optional
+
+SHARED_DIR = "phmdoctest_shared_dir"
+"""Key in the xdist workerinput dict for the shared cache directory."""
+
+
+def is_worker(config) -> bool:
+    """True if running in a pytest-xdist worker process."""
+    return hasattr(config, "workerinput")
+
+
+def is_controller(config) -> bool:
+    """True if pytest-xdist is distributing tests to worker processes.
+
+    The dsession plugin is registered by xdist's pytest_configure()
+    when -n or --dist is given.
+    """
+    return config.pluginmanager.getplugin("dsession") is not None
+
+
+def shared_directory(config) -> Optional[Path]:
+    """Return the cache directory the controller shared with this worker or None."""
+    directory = getattr(config, "workerinput", {}).get(SHARED_DIR)
+    if directory is None:
+        return None
+    return Path(directory)
+
+
+class ControllerPlugin:
+    """Tell each worker where the controller saved the generated test files.
+
+    Registered only when pytest-xdist is installed since pytest
+    rejects the unknown pytest_configure_node hook otherwise.
+    """
+
+    def __init__(self) -> None:
+        self.directory: Optional[Path] = None
+
+    def pytest_configure_node(self, node) -> None:
+        """pytest-xdist hook called before a worker is started."""
+        if self.directory is not None:
+            node.workerinput[SHARED_DIR] = str(self.directory)
+
+
+def configure(config) -> Optional[ControllerPlugin]:
+    """Register the controller plugin if pytest-xdist may start workers.
+
+    The controller tells the workers where it put the generated test files.
+    """
+    if not config.pluginmanager.hasplugin("xdist") or is_worker(config):
+        return None
+    controller = ControllerPlugin()
+    config.pluginmanager.register(controller, "phmdoctest-controller")
+    return controller
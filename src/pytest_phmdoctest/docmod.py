@@ -1,6 +1,5 @@
 """Collect Python interactive sessions and possibly Python code/output."""
 from pathlib import Path
-import re
 import textwrap
 from typing import Optional
 
@@ -8,6 +7,8 @@ import pytest
 
 import phmdoctest.tool
 from . import collectors
+from . import generate
+from . import store
 
 
 def failing_test_case(built_from: str) -> str:
@@ -46,9 +47,11 @@ def failing_test_case(built_from: str) -> str:
 def collect(
     markdown_examples: phmdoctest.tool.PythonExamples,
     built_from: str,
+    survivors: generate.Survivors,
     parent: pytest.Collector,
     outfile_path: Path,
     collector_name: str,
+    test_store: store.Store,
 ) -> Optional[collectors.PluginCollector]:
     """Return a collector for one or both code/expected output and Python doctests.
 
@@ -58,6 +61,8 @@ def collect(
     2. We collect Python interactive sessions by collecting the
        generated test file with DoctestModule.
     3. We don't collect Python interactive sessions if --phmdoctest.
+    4. survivors tells which examples became test cases after
+       skip directives and --skip were applied.
 
     There may not be any of Python code with expected output or
     Python interactive sessions in the generated test file.
@@ -76,61 +81,42 @@ def collect(
     ) and markdown_examples.has_session
 
     if markdown_examples.has_code and not do_sessions:
-        return collectors.module(parent, outfile_path)
+        return test_store.module(parent, outfile_path)
 
-    docmod = collectors.doctest_module(parent, outfile_path)
-    if docmod is None:
+    docmod = test_store.doctest_module(parent, outfile_path)
+    if docmod is None and survivors.sessions:
         # We can't build a DoctestModule to test the Python interactive
-        # sessions (doctests) which might be in the test file.
-        # It is possible Python interactive sessions in the Markdown
-        # have been skipped by phmdoctest directives or the --skip
-        # command line option.
-        # Note that phmdoctest.tool.detect_python_examples()
-        # used earlier does not consider phmdoctest directives or skips.
-        # So we look in the generated test file for any ">>>"
-        # substrings within raw triple quoted strings and assume they are
-        # intended as a docstring for a doctest.
-        # If we don't find any then we silently ignore that we can't build a
+        # sessions (doctests) in the test file.
+        # Python interactive sessions in the Markdown may all have been
+        # skipped by phmdoctest directives or the --skip command line
+        # option. In that case we silently ignore that we can't build a
         # DoctestModule.
         #
-        # Note: This hueristic could break if a future version of phmdoctest
-        # generates doctests differently.
-        # It is also possible that a user puts a raw triple quoted string
-        # containing ">>>" in a Python code block. It would look like a
-        # doctest here.
-        #
-        # If we have a doctest to collect, append a failing test case
-        # with error message to the test file.
+        # Otherwise append a failing test case with error message to the
+        # test file.
         # Note the test case is a pytest test function and so
         # we return a Module that collects it and any other pytest
         # functions in the generated test file.
-        test_file = outfile_path.read_text(encoding="utf-8")
-        pattern = r'r""".*?"""'  # raw triple quoted string
-        raw_triple_quoted = re.findall(
-            pattern=pattern, string=test_file, flags=re.DOTALL
-        )
-        if any(">>>" in docstring for docstring in raw_triple_quoted):
-            extended_test_file = test_file + failing_test_case(built_from)
-            _ = outfile_path.write_text(extended_test_file, encoding="utf-8")
-            return collectors.module(parent, outfile_path)
-        # We get here if docmod is None (failed) and skipped all markdown
-        # doctests in the generated test file.
+        test_file = test_store.read(outfile_path)
+        extended_test_file = test_file + failing_test_case(built_from)
+        test_store.save(outfile_path, extended_test_file)
+        return test_store.module(parent, outfile_path)
 
     if docmod and markdown_examples.has_code:
-        mod = collectors.module(parent, outfile_path)
+        mod = test_store.module(parent, outfile_path)
         bc = collectors.bundled_collector(parent, outfile_path, collector_name)
         bc.add_collectibles(docmod, mod)
         return bc
     elif docmod:
         return docmod
     elif markdown_examples.has_code:
-        return collectors.module(parent, outfile_path)
+        return test_store.module(parent, outfile_path)
     else:
         # Nothing to do.
         # We get here if:
         # 1. Failed to make docmod, but did not return the failing
-        #    test case since there were no doctests in docstrings
-        #    in the generated test file.
+        #    test case since no Python interactive sessions survived
+        #    the skips.
         # AND
         # 2. There were no code/expected output examples.
         return None
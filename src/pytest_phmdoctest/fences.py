@@ -0,0 +1,159 @@
+"""Find Python fenced code blocks in Markdown files without a full parse."""
+import mmap
+import os
+from pathlib import Path
+import re
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+import commonmark.common  # type: ignore
+
+
+PYTHON_FENCE = re.compile(rb"(?:```|~~~)[ \t]*(?:py|&)")
+"""Bytes that may open a fenced code block with a Python info string.
+
+phmdoctest recognizes Python code and session blocks by an info string
+that starts with "py". The info string follows the fence after optional
+spaces and tabs. An info string that starts with an HTML entity
+reference might decode to "py" so it matches too.
+The pattern is not anchored to the start of a line so that
+fences in block quotes and list items are found.
+It may match bytes that are not a fence. That only costs a parse.
+"""
+
+
+def may_have_python(markdown_path: Path) -> bool:
+    """Return False if the file certainly has no Python fenced code blocks.
+
+    The file is memory mapped and searched without decoding it.
+    """
+    with open(markdown_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False  # An empty file can't be memory mapped.
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            # Some file systems don't support memory mapping.
+            return PYTHON_FENCE.search(f.read()) is not None
+        with data:
+            return PYTHON_FENCE.search(data) is not None  # type: ignore
+
+
+FENCE_OPEN = re.compile(r"^( {0,3})(`{3,}|~{3,})(.*)$")
+FENCE_CLOSE = re.compile(r"^ {0,3}(`{3,}|~{3,})[ \t]*$")
+COMMENT_OPEN = re.compile(r"^ {0,3}<!--")
+
+
+class CommentNode:
+    """The fields of a commonmark HTML comment block node used by phmdoctest."""
+
+    t = "html_block"
+    html_block_type = 2
+
+    def __init__(self, literal: str, line: int, prv: Optional["CommentNode"]) -> None:
+        self.literal = literal
+        self.sourcepos = [[line, 1], [line, 1]]
+        self.prv = prv
+
+
+class FenceNode:
+    """The fields of a commonmark fenced code block node used by phmdoctest."""
+
+    t = "code_block"
+    is_fenced = True
+
+    def __init__(self, info: str, line: int, prv: Optional[CommentNode]) -> None:
+        self.info = info
+        self.literal = ""
+        self.sourcepos = [[line, 1], [line, 1]]
+        self.prv = prv
+
+
+def stream_fenced_nodes(lines: Iterable[str]) -> Iterator[FenceNode]:
+    """Yield the fenced code blocks phmdoctest might use in file order.
+
+    A memory bounded substitute for phmdoctest.tool.fenced_block_nodes()
+    for very large Markdown files. Only the current block is held.
+    Blocks with an info string starting with "py" are yielded
+    with their contents.
+    The block after one of them is yielded since it may be the
+    expected output. Its contents are kept if it has no info string.
+    Other blocks can't change the generated test file and are dropped.
+
+    This is a line scanner, not a full CommonMark parser.
+    It finds fences indented up to 3 spaces, including those in
+    list items indented that much.
+    Fences in block quotes and fences indented 4 or more spaces
+    are not found.
+    HTML comments directly before a fence are linked by the prv
+    attribute so that phmdoctest directives are found.
+    """
+    comment: Optional[CommentNode] = None
+    comment_lines: List[str] = []
+    comment_line = 0
+    fence: Optional[FenceNode] = None
+    fence_indent = 0
+    fence_marker = ""
+    keep = False
+    after_python = False
+    content: List[str] = []
+    line_number = 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip("\n")
+        if fence is not None:
+            match = FENCE_CLOSE.match(line)
+            if (
+                match
+                and match.group(1)[0] == fence_marker[0]
+                and len(match.group(1)) >= len(fence_marker)
+            ):
+                fence.literal = "".join(content)
+                content = []
+                if fence.info.startswith("py") or after_python:
+                    yield fence
+                after_python = fence.info.startswith("py")
+                fence = None
+            elif keep:
+                content.append(remove_indent(line, fence_indent) + "\n")
+            continue
+        if comment_lines:
+            comment_lines.append(line)
+            if "-->" in line:
+                comment = CommentNode("\n".join(comment_lines), comment_line, comment)
+                comment_lines = []
+            continue
+        match = FENCE_OPEN.match(line)
+        if match and not (match.group(2)[0] == "`" and "`" in match.group(3)):
+            info = commonmark.common.unescape_string(match.group(3).strip())
+            fence = FenceNode(info, line_number, comment)
+            fence_indent = len(match.group(1))
+            fence_marker = match.group(2)
+            keep = info.startswith("py") or (not info and after_python)
+            comment = None
+            continue
+        if COMMENT_OPEN.match(line):
+            if "-->" in line:
+                comment = CommentNode(line, line_number, comment)
+            else:
+                comment_lines = [line]
+                comment_line = line_number
+            continue
+        if line.strip():
+            # Some other block separates the comments from the next fence.
+            comment = None
+    if fence is not None:
+        # An unclosed fence ends at the end of the document.
+        fence.literal = "".join(content)
+        if fence.info.startswith("py") or after_python:
+            yield fence
+
+
+def remove_indent(line: str, indent: int) -> str:
+    """Remove up to indent leading spaces from a fenced code block line."""
+    stripped = line.lstrip(" ")
+    removed = len(line) - len(stripped)
+    if removed > indent:
+        return line[indent:]
+    return stripped
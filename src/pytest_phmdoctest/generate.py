@@ -0,0 +1,291 @@
+"""Detect Python examples and generate the test file from a single parse."""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import commonmark  # type: ignore
+import commonmark.node  # type: ignore
+
+import phmdoctest.cases
+import phmdoctest.fenced
+import phmdoctest.fillrole
+import phmdoctest.tool
+from phmdoctest.direct import Directive
+from phmdoctest.direct import Marker
+from phmdoctest.entryargs import Args
+from phmdoctest.fenced import FencedBlock
+from phmdoctest.fenced import Role
+
+from . import aio
+from . import fences
+from . import settings
+from . import sharing
+
+
+class Survivors(NamedTuple):
+    """Markdown line numbers of the examples that became test cases.
+
+    Examples removed by skip directives, --skip, or chosen as setup or
+    teardown are not included.
+    """
+
+    code: Tuple[int, ...]
+    sessions: Tuple[int, ...]
+
+
+NO_SURVIVORS = Survivors(code=(), sessions=())
+
+
+class Context(NamedTuple):
+    """What a test case depends on besides its own example."""
+
+    digest: str  # hash of the setup and teardown code and the settings
+    shares_names: bool  # True if examples share names with later examples
+
+
+NO_CONTEXT = Context(digest="", shares_names=False)
+
+
+class Block(NamedTuple):
+    """A fenced code block phmdoctest gave a role, for the block index."""
+
+    kind: str  # code, output, session, setup, teardown, skip-code, ...
+    line: int  # first line of the contents
+    end_line: int  # last line of the contents
+    digest: str  # hash of the contents
+    test_name: str  # generated test function name or empty string
+
+
+class Generated(NamedTuple):
+    """Result of processing one Markdown file."""
+
+    examples: phmdoctest.tool.PythonExamples
+    test_file: str  # empty string when there are no Python examples
+    survivors: Survivors
+    context: Context
+    blocks: Tuple[Block, ...]
+    graph: sharing.Graph  # name dependencies between the examples
+
+
+TEST_FUNCTION_PATTERN = re.compile(r"^def (\w+)\(", flags=re.MULTILINE)
+
+
+def decode(markdown: bytes) -> str:
+    """Decode Markdown file contents the way open(..., "r") would."""
+    text = markdown.decode("utf-8")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def fenced_block_nodes(text: str) -> List[commonmark.node.Node]:
+    """Get the fenced code blocks in Markdown text as commonmark nodes.
+
+    Same as phmdoctest.tool.fenced_block_nodes() but takes the text.
+    """
+    nodes = []
+    ast = commonmark.Parser().parse(text)
+    for node, _ in ast.walker():
+        if node.t == "code_block" and node.is_fenced:
+            nodes.append(node)
+    return nodes
+
+
+def configure_block_roles(args: Args, nodes: List[Any]) -> List[FencedBlock]:
+    """Pair up code and output blocks, apply skips, setup, and teardown.
+
+    Same steps as phmdoctest.main._configure_block_roles() after
+    the Markdown file is parsed.
+    """
+    blocks = phmdoctest.fenced.convert_nodes(nodes)
+    phmdoctest.fillrole.identify_code_output_session_blocks(blocks)
+    phmdoctest.fillrole.del_problem_blocks(blocks)
+    code_and_session_blocks = [b for b in blocks if b.role in [Role.CODE, Role.SESSION]]
+    phmdoctest.fillrole.apply_skips(args, code_and_session_blocks)
+    phmdoctest.fillrole.find_and_designate_setup(args.setup, code_and_session_blocks)
+    phmdoctest.fillrole.find_and_designate_teardown(
+        args.teardown, code_and_session_blocks
+    )
+    return blocks
+
+
+def add_stable_labels(blocks: List[FencedBlock]) -> None:
+    """Label each example that has no label directive with a hash of its contents.
+
+    phmdoctest names the test functions, and so pytest node IDs, after
+    the labels. Editing other parts of the Markdown file does not change them.
+    """
+    counts: Dict[str, int] = {}
+    for block in blocks:
+        if block.role == Role.CODE:
+            prefix = "test_code_"
+        elif block.role == Role.SESSION:
+            prefix = "session_"
+        else:
+            continue
+        if phmdoctest.cases.get_label_name(block):
+            continue
+        digest = hashlib.sha256(block.contents.encode("utf-8")).hexdigest()
+        label = prefix + digest[:12]
+        counts[label] = counts.get(label, 0) + 1
+        if counts[label] > 1:
+            # Number repeated examples in file order.
+            label += f"_{counts[label]}"
+        block.directives.append(
+            Directive(type=Marker.LABEL, value=label, line=block.line, literal="")
+        )
+
+
+def make_args(kwargs: Dict[str, Any]) -> Args:
+    """Fill in phmdoctest Args from the keyword arguments for testfile()."""
+    return Args(
+        markdown_file=str(kwargs["markdown_file"]),
+        outfile="",
+        skips=kwargs.get("skips") or [],
+        is_report=False,
+        fail_nocode=bool(kwargs.get("fail_nocode")),
+        setup=kwargs.get("setup"),
+        teardown=kwargs.get("teardown"),
+        setup_doctest=bool(kwargs.get("setup_doctest")),
+        built_from=kwargs.get("built_from", ""),
+    )
+
+
+def generate(text: str, kwargs: Dict[str, Any]) -> Generated:
+    """Detect Python examples and generate the test file from Markdown text.
+
+    The text is parsed once. The results are the same as calling
+    phmdoctest.tool.detect_python_examples() and then
+    phmdoctest.main.testfile(**kwargs).
+    """
+    return generate_from_nodes(fenced_block_nodes(text), kwargs)
+
+
+def generate_streamed(markdown_path: Path, kwargs: Dict[str, Any]) -> Generated:
+    """Detect Python examples and generate the test file reading line by line.
+
+    For very large Markdown files. See fences.stream_fenced_nodes().
+    """
+    with open(markdown_path, "r", encoding="utf-8") as fp:
+        nodes = list(fences.stream_fenced_nodes(fp))
+    return generate_from_nodes(nodes, kwargs)
+
+
+def generate_from_nodes(nodes: List[Any], kwargs: Dict[str, Any]) -> Generated:
+    """Detect Python examples and generate the test file from fenced block nodes."""
+    examples = phmdoctest.tool.PythonExamples(
+        has_code=any(phmdoctest.fillrole.is_python_block(node) for node in nodes),
+        has_session=any(phmdoctest.fillrole.is_doctest_block(node) for node in nodes),
+    )
+    if not (examples.has_code or examples.has_session):
+        return Generated(
+            examples=examples,
+            test_file="",
+            survivors=NO_SURVIVORS,
+            context=NO_CONTEXT,
+            blocks=(),
+            graph=(),
+        )
+    # Checking here for a line with a parse error in the
+    # phmdoctest-collect section.
+    if "ini-error" in kwargs:
+        test_file = settings.error_file(kwargs["built_from"], kwargs["ini-error"])
+        return Generated(
+            examples=examples,
+            test_file=test_file,
+            survivors=NO_SURVIVORS,
+            context=NO_CONTEXT,
+            blocks=(),
+            graph=(),
+        )
+    args = make_args(kwargs)
+    blocks = configure_block_roles(args, nodes)
+    if kwargs.get("stable_ids"):
+        add_stable_labels(blocks)
+    has_await = aio.rewrite_blocks(blocks)
+    test_file = phmdoctest.cases.build_test_cases(args, blocks)
+    # Name the test functions before the event loop code adds a function.
+    described = describe_blocks(blocks, test_file)
+    if has_await:
+        test_file += aio.EVENT_LOOP_CODE
+    survivors = Survivors(
+        code=tuple(b.line for b in blocks if b.role == Role.CODE),
+        sessions=tuple(b.line for b in blocks if b.role == Role.SESSION),
+    )
+    test_names = {b.line: b.test_name for b in described if b.test_name}
+    return Generated(
+        examples=examples,
+        test_file=test_file,
+        survivors=survivors,
+        context=make_context(blocks, kwargs),
+        blocks=described,
+        graph=sharing.dependency_graph(blocks, test_names),
+    )
+
+
+def describe_blocks(blocks: List[FencedBlock], test_file: str) -> Tuple[Block, ...]:
+    """Describe the blocks with a role and name the test function of each example.
+
+    phmdoctest writes a top level function for each code and session
+    block in Markdown order after any fixtures.
+    """
+    examples = [b for b in blocks if b.role in (Role.CODE, Role.SESSION)]
+    names: List[str] = []
+    if examples:
+        names = TEST_FUNCTION_PATTERN.findall(test_file)[-len(examples) :]
+    test_names = {id(block): name for block, name in zip(examples, names)}
+    described = []
+    for block in blocks:
+        if block.role == Role.UNKNOWN:
+            continue
+        digest = hashlib.sha256(block.contents.encode("utf-8")).hexdigest()
+        described.append(
+            Block(
+                kind=block.role.value,
+                line=block.line,
+                end_line=block.line + max(block.contents.count("\n") - 1, 0),
+                digest=digest,
+                test_name=test_names.get(id(block), ""),
+            )
+        )
+    return tuple(described)
+
+
+def make_context(blocks: List[FencedBlock], kwargs: Dict[str, Any]) -> Context:
+    """Hash the setup and teardown blocks and the settings for the test cases."""
+    digest = hashlib.sha256()
+    # The absolute path differs between checkouts. built_from is relative.
+    settings = {k: v for k, v in kwargs.items() if k != "markdown_file"}
+    settings_text = json.dumps(settings, sort_keys=True, default=str)
+    digest.update(settings_text.encode("utf-8"))
+    for block in blocks:
+        if block.role in (Role.SETUP, Role.TEARDOWN):
+            digest.update(b"\0" + block.role.name.encode("utf-8") + b"\0")
+            digest.update(block.contents.encode("utf-8"))
+    shares_names = any(b.has_names_directive() for b in blocks if b.role == Role.CODE)
+    return Context(digest=digest.hexdigest(), shares_names=shares_names)
+
+
+def generate_file(
+    markdown_path: Path, kwargs: Dict[str, Any], stream_threshold: Optional[int]
+) -> Generated:
+    """Read the Markdown file, detect Python examples, and generate the test file.
+
+    Files larger than stream_threshold bytes are read line by line.
+    This is a top level function so that a process pool can call it.
+    """
+    if use_streaming(markdown_path, stream_threshold):
+        return generate_streamed(markdown_path, kwargs)
+    return generate(decode(markdown_path.read_bytes()), kwargs)
+
+
+def use_streaming(markdown_path: Path, stream_threshold: Optional[int]) -> bool:
+    """True if the Markdown file is larger than stream_threshold bytes."""
+    if stream_threshold is None:
+        return False
+    return markdown_path.stat().st_size > stream_threshold
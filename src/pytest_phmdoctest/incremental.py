@@ -0,0 +1,146 @@
+"""Incremental --phmdoctest-generate. Only write test files that changed."""
+import json
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from . import cache
+from . import generate
+from . import sharing
+from . import store
+
+
+MANIFEST_NAME = ".phmdoctest-generate.json"
+"""Name of the file in DIR that lists the generated test files."""
+
+
+class GenerateManifest:
+    """The test files generated in DIR and the Markdown they came from.
+
+    Each entry maps a generated file name to the Markdown file path,
+    relative to the invocation directory, a hash of the Markdown
+    file contents, phmdoctest settings, and software versions, and
+    the context and dependency graph of the generated test file.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        """Load the manifest saved in directory if there is one."""
+        self.directory = directory
+        self.path = directory / MANIFEST_NAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.changed = False
+        self.collected: Set[str] = set()  # test files of this run's Markdown
+        self._versions = cache.versions_fingerprint()
+        try:
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    def exists(self) -> bool:
+        """True if a manifest was saved in directory by an earlier run."""
+        return self.path.exists()
+
+    def source_hash(self, markdown_path: Path, kwargs: Dict[str, Any]) -> str:
+        """Hash the Markdown file contents, phmdoctest kwargs, and versions."""
+        return cache.file_key(self._versions, markdown_path, kwargs)
+
+    def is_current(self, name: str, markdown: str, source: str) -> bool:
+        """True if the test file name was generated from the same source."""
+        self.collected.add(name)
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        if entry.get("markdown") != markdown or entry.get("source") != source:
+            return False
+        if "context" not in entry or "graph" not in entry:
+            return False
+        return (self.directory / name).exists()
+
+    def recorded(self, name: str) -> Tuple[generate.Context, sharing.Graph]:
+        """Return the context and dependency graph saved for the test file."""
+        entry = self.entries[name]
+        graph = tuple(
+            sharing.Node(node_name, line, tuple(after), io)
+            for node_name, line, after, io in entry["graph"]
+        )
+        return generate.Context(*entry["context"]), graph
+
+    def write(
+        self, name: str, markdown: str, source: str, generated: generate.Generated
+    ) -> None:
+        """Write the test file if it changed. Record where it came from."""
+        self.collected.add(name)
+        test_file = generated.test_file
+        path = self.directory / name
+        try:
+            unchanged = path.read_text(encoding="utf-8") == test_file
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            store.write_atomic(path, test_file)
+        entry = {
+            "markdown": markdown,
+            "source": source,
+            "context": list(generated.context),
+            "graph": [list(node) for node in generated.graph],
+        }
+        if self.entries.get(name) != entry:
+            self.entries[name] = entry
+            self.changed = True
+
+    def keep(self, name: str) -> None:
+        """Keep the test file of a Markdown file collected without generating."""
+        self.collected.add(name)
+
+    def discard(self, name: str) -> None:
+        """Remove the test file name if this manifest generated it."""
+        if self.entries.pop(name, None) is not None:
+            self.changed = True
+            try:
+                (self.directory / name).unlink()
+            except OSError:
+                pass
+
+    def remove_orphans(self, invoke_path: Path) -> List[str]:
+        """Remove the test files whose Markdown file no longer exists.
+
+        Return the names of the removed test files.
+        """
+        removed = []
+        for name, entry in list(self.entries.items()):
+            if not (invoke_path / entry["markdown"]).exists():
+                self.discard(name)
+                removed.append(name)
+        return removed
+
+    def stale(self, invoke_path: Path, searched: List[Path]) -> List[str]:
+        """Return the test files whose Markdown file was not collected this run.
+
+        Only Markdown files in the searched paths count.
+        """
+        names = []
+        for name, entry in self.entries.items():
+            if name in self.collected:
+                continue
+            markdown = invoke_path / entry["markdown"]
+            if any(path == markdown or path in markdown.parents for path in searched):
+                names.append(name)
+        return names
+
+    def save(self) -> None:
+        """Save the manifest if it changed."""
+        if self.changed:
+            text = json.dumps(self.entries, indent=2, sort_keys=True)
+            store.write_atomic(self.path, text + "\n")
+            self.changed = False
+
+
+def configure(config, directory: Path) -> Optional[GenerateManifest]:
+    """Load the manifest in DIR for --phmdoctest-incremental."""
+    if not config.option.phmdoctest_incremental:
+        return None
+    return GenerateManifest(directory)
@@ -0,0 +1,306 @@
+"""SQLite index of the Python fenced code blocks and their last test results.
+
+Query it from the command line:
+    python -m pytest_phmdoctest.index FILE slowest
+"""
+import argparse
+from pathlib import Path
+import sqlite3
+import sys
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import pytest
+
+from . import distributed
+from . import generate
+from . import results
+
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS blocks (
+    markdown TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    collect_line TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    last_status TEXT,
+    last_duration REAL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    flips INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    PRIMARY KEY (markdown, line)
+)"""
+
+DESCRIPTION_COLUMNS = (
+    "line",
+    "end_line",
+    "kind",
+    "digest",
+    "collect_line",
+    "test_name",
+)
+"""Columns that come from the Markdown file and the phmdoctest-collect line."""
+
+HISTORY_COLUMNS = (
+    "last_status",
+    "last_duration",
+    "runs",
+    "failures",
+    "flips",
+    "updated",
+)
+"""Columns that come from running the test cases."""
+
+UPDATE_STATUS = """\
+UPDATE blocks SET
+    flips = flips + (
+        COALESCE(last_status, '') IN ('passed', 'failed')
+        AND :status IN ('passed', 'failed')
+        AND last_status != :status
+    ),
+    failures = failures + (:status = 'failed'),
+    runs = runs + 1,
+    last_status = :status,
+    last_duration = :duration,
+    updated = :updated
+WHERE markdown = :markdown AND line = :line"""
+
+BlockId = Tuple[str, int]
+"""Markdown file relative to the invocation directory and the block's line."""
+
+
+def connect(database: Path) -> sqlite3.Connection:
+    """Open the index database. Create the table if needed."""
+    connection = sqlite3.connect(str(database), timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(SCHEMA)
+    return connection
+
+
+def function_name(item: pytest.Item) -> str:
+    """Return the generated function name of a test case."""
+    # Doctest items are named module.function.
+    return item.name.rpartition(".")[2]
+
+
+class BlockIndex:
+    """Keep the index database up to date with the Markdown files and test results.
+
+    Rows for a Markdown file are replaced only when its blocks or its
+    phmdoctest-collect line changed. A block that moved keeps its test
+    history. Generated test files in the cache mean unchanged Markdown
+    files are not parsed again. Rows of Markdown files that no longer
+    exist are deleted.
+    """
+
+    def __init__(self, config, database: Path) -> None:
+        self.config = config
+        self.database = database
+        self.files: Dict[str, Tuple[str, Tuple[generate.Block, ...]]] = {}
+        self.block_ids: Dict[str, BlockId] = {}
+        self.statuses: List[Dict[str, Any]] = []
+
+    def add_file(
+        self, markdown: str, collect_line: str, blocks: Tuple[generate.Block, ...]
+    ) -> None:
+        """Remember the blocks of a collected Markdown file."""
+        self.files[markdown] = (collect_line, blocks)
+
+    def pytest_collection_modifyitems(self, session, config, items) -> None:
+        """pytest hook. Find the block of each Markdown test case."""
+        outfiles: Dict[Path, Path] = config.phmdoctest_outfiles
+        invoke_path = Path(config.invocation_params.dir)
+        lines: Dict[str, Dict[str, int]] = {}
+        for markdown, (_, blocks) in self.files.items():
+            lines[markdown] = {b.test_name: b.line for b in blocks if b.test_name}
+        for item in items:
+            markdown_path = outfiles.get(Path(str(item.fspath)))
+            if markdown_path is None:
+                continue
+            markdown = markdown_path.relative_to(invoke_path).as_posix()
+            line = lines.get(markdown, {}).get(function_name(item))
+            if line is not None:
+                self.block_ids[item.nodeid] = (markdown, line)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call) -> Any:
+        """pytest hook. Put the block in the report.
+
+        The report carries it to the pytest-xdist controller.
+        """
+        outcome = yield
+        self.add_to_report(item, outcome.get_result())
+
+    def add_to_report(self, item: pytest.Item, report: Any) -> None:
+        """Put the test case's block in the report."""
+        block_id = self.block_ids.get(item.nodeid)
+        if block_id is not None:
+            report.phmdoctest_block = list(block_id)
+
+    def pytest_runtest_logreport(self, report) -> None:
+        """pytest hook. Remember the outcome and duration of the test case."""
+        block_id = getattr(report, "phmdoctest_block", None)
+        if block_id is None or distributed.is_worker(self.config):
+            return
+        if report.when == "call":
+            status = report.outcome
+        elif report.when == "setup" and not report.passed:
+            status = "error" if report.failed else "skipped"
+        else:
+            return
+        if status == "skipped" and results.SKIP_REASON in str(report.longrepr):
+            return  # Not run because it passed before.
+        self.statuses.append(
+            dict(
+                markdown=block_id[0],
+                line=block_id[1],
+                status=status,
+                duration=report.duration,
+                updated=time.time(),
+            )
+        )
+
+    def pytest_sessionfinish(self, session) -> None:
+        """pytest hook. Write the changed files and the test results.
+
+        With pytest-xdist the controller deletes the removed files.
+        """
+        remove = not distributed.is_worker(self.config) and self.database.exists()
+        if not self.files and not self.statuses and not remove:
+            return
+        connection = connect(self.database)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for markdown, (collect_line, blocks) in self.files.items():
+                update_file(connection, markdown, collect_line, blocks)
+            connection.executemany(UPDATE_STATUS, self.statuses)
+            if remove:
+                remove_missing(connection, Path(self.config.invocation_params.dir))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+
+def update_file(
+    connection: sqlite3.Connection,
+    markdown: str,
+    collect_line: str,
+    blocks: Tuple[generate.Block, ...],
+) -> None:
+    """Replace the rows of a Markdown file if its blocks changed."""
+    columns = ", ".join(DESCRIPTION_COLUMNS + HISTORY_COLUMNS)
+    rows = connection.execute(
+        f"SELECT {columns} FROM blocks WHERE markdown = ? ORDER BY line", (markdown,)
+    ).fetchall()
+    size = len(DESCRIPTION_COLUMNS)
+    described = [
+        (b.line, b.end_line, b.kind, b.digest, collect_line, b.test_name)
+        for b in blocks
+    ]
+    if [tuple(row[:size]) for row in rows] == described:
+        return
+    # Carry the test history over to blocks with the same contents.
+    history = {row[3]: tuple(row[size:]) for row in rows}
+    no_history = (None, None, 0, 0, 0, None)
+    connection.execute("DELETE FROM blocks WHERE markdown = ?", (markdown,))
+    connection.executemany(
+        f"INSERT INTO blocks (markdown, {columns}) VALUES "
+        f"({', '.join('?' * (len(DESCRIPTION_COLUMNS + HISTORY_COLUMNS) + 1))})",
+        [
+            (markdown,) + description + history.get(description[3], no_history)
+            for description in described
+        ],
+    )
+
+
+def remove_missing(connection: sqlite3.Connection, invoke_path: Path) -> None:
+    """Delete the rows of Markdown files that no longer exist."""
+    names = [
+        row[0] for row in connection.execute("SELECT DISTINCT markdown FROM blocks")
+    ]
+    missing = [(name,) for name in names if not (invoke_path / name).exists()]
+    connection.executemany("DELETE FROM blocks WHERE markdown = ?", missing)
+
+
+def configure(config) -> Optional[BlockIndex]:
+    """Register the block index plugin for --phmdoctest-index FILE."""
+    if config.option.phmdoctest_index is None:
+        return None
+    database = config.invocation_params.dir / config.option.phmdoctest_index
+    block_index = BlockIndex(config, database)
+    config.pluginmanager.register(block_index, "phmdoctest-index")
+    return block_index
+
+
+QUERIES = {
+    "slowest": (
+        "SELECT markdown, line, kind, last_status, last_duration FROM blocks"
+        " WHERE last_duration IS NOT NULL ORDER BY last_duration DESC LIMIT ?"
+    ),
+    "flaky": (
+        "SELECT markdown, line, kind, flips, failures, runs FROM blocks"
+        " WHERE flips > 0 ORDER BY flips DESC, failures DESC LIMIT ?"
+    ),
+    "failing": (
+        "SELECT markdown, line, kind, last_status, collect_line FROM blocks"
+        " WHERE last_status IN ('failed', 'error') ORDER BY markdown, line LIMIT ?"
+    ),
+}
+"""Canned queries for the command line. The parameter is the row limit."""
+
+
+def format_rows(cursor: sqlite3.Cursor) -> List[str]:
+    """Return the header and rows as tab separated lines."""
+    header = [column[0] for column in cursor.description]
+    lines = ["\t".join(header)]
+    for row in cursor.fetchall():
+        lines.append("\t".join("" if value is None else str(value) for value in row))
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Print the result of a query of the index database."""
+    parser = argparse.ArgumentParser(
+        prog="python -m pytest_phmdoctest.index",
+        description="Query the index written by pytest --phmdoctest-index.",
+    )
+    parser.add_argument("database", type=Path, help="the index file")
+    parser.add_argument(
+        "query",
+        choices=sorted(QUERIES) + ["sql"],
+        help="a canned query or sql to run the SQL statement",
+    )
+    parser.add_argument("sql", nargs="?", default="", help="SQL statement")
+    parser.add_argument("-n", type=int, default=20, help="number of rows (default 20)")
+    args = parser.parse_args(argv)
+    if not args.database.exists():
+        parser.error(f"{args.database} does not exist.")
+    if args.query == "sql" and not args.sql:
+        parser.error("sql needs an SQL statement.")
+    connection = connect(args.database)
+    try:
+        if args.query == "sql":
+            cursor = connection.execute(args.sql)
+        else:
+            cursor = connection.execute(QUERIES[args.query], (args.n,))
+        if cursor.description is not None:
+            print("\n".join(format_rows(cursor)))
+    except sqlite3.Error as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
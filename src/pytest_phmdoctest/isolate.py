@@ -0,0 +1,502 @@
+"""Run the generated test files in a pool of reusable worker processes.
+
+Each worker runs pytest on one generated test file at a time and sends
+back the reports. Test cases leak less state into later files and
+Markdown files run in parallel. A worker is replaced after it ran
+max_files files or its resident memory grew past max_rss bytes.
+
+The workers are forked from a forkserver process that imported the
+phmdoctest-preimport modules and pytest once. Where there is no
+forkserver they are spawned and import them when they start.
+
+The worker uses the rootdir, ini file, -p plugins and -o overrides of
+this pytest run. The generated test file is written to a temporary
+directory next to the Markdown file so the same conftest.py files apply.
+"""
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import multiprocessing
+import os
+from pathlib import Path
+import queue
+import sys
+from tempfile import TemporaryDirectory
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import pytest
+
+from . import deps
+from . import results
+from . import settings
+from . import store
+
+
+NONE = "none"
+SUBPROCESS = "subprocess"
+ISOLATE_CHOICES = [NONE, SUBPROCESS]
+"""Values of the --phmdoctest-isolate option."""
+
+CRASHED = "pytest-phmdoctest isolate worker process exited while running"
+
+REPORT = "report"
+DONE = "done"
+"""Kinds of message a worker sends back."""
+
+
+class Job(NamedTuple):
+    """A generated test file for a worker to run."""
+
+    name: str  # module name of the generated test file
+    source: str  # the generated test file
+    test_names: Tuple[str, ...]  # names of the test cases to run
+    doctests: bool  # True to collect the Python interactive sessions
+    directory: str  # where the Markdown file's conftest.py files apply
+    record_deps: bool  # True to report the project files the test cases use
+
+
+class Ran(NamedTuple):
+    """The serialized reports of a job and why the rest are missing."""
+
+    reports: List[Dict[str, Any]]
+    error: str  # empty string when the worker finished the job
+
+
+def resident_memory() -> int:
+    """Return this process's resident memory in bytes or 0 if unknown."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak rather than current. ru_maxrss is bytes on macOS, KiB elsewhere.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ReportSender:
+    """pytest plugin used in a worker. Send each report as soon as it is made.
+
+    The reports made before a test case ends the worker process
+    are not lost. With record_deps the teardown report lists the
+    project files the test case used.
+    """
+
+    def __init__(self, connection: Any, record_deps: bool) -> None:
+        self.connection = connection
+        self.record_deps = record_deps
+        self.config: Any = None
+        self.recorder: Any = None
+
+    def pytest_configure(self, config) -> None:
+        """pytest hook. Keep config for the serialization hook."""
+        self.config = config
+        if self.record_deps:
+            self.recorder = deps.make_recorder(Path(str(config.rootdir)))
+
+    def pytest_unconfigure(self) -> None:
+        """pytest hook. Release the recorder."""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def send(self, report) -> None:
+        """Send the report."""
+        data = self.config.hook.pytest_report_to_serializable(
+            config=self.config, report=report
+        )
+        self.connection.send((REPORT, data))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem) -> Any:
+        """pytest hook. Record the project files used by the test case."""
+        if self.recorder is None:
+            yield
+            return
+        self.recorder.start()
+        try:
+            yield
+        finally:
+            _ = self.recorder.stop()
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call) -> Any:
+        """pytest hook. Put the project files used in the teardown report."""
+        outcome = yield
+        if self.recorder is not None and call.when == "teardown":
+            outcome.get_result().phmdoctest_used = sorted(self.recorder.stop())
+
+    def pytest_runtest_logreport(self, report) -> None:
+        """pytest hook. Send the test case report."""
+        self.send(report)
+
+    def pytest_collectreport(self, report) -> None:
+        """pytest hook. Send the report if the test file could not be collected."""
+        if report.failed:
+            self.send(report)
+
+
+def worker_args(config) -> List[str]:
+    """Return the pytest options for a worker to run like this pytest run.
+
+    The ini file's addopts are dropped so the worker doesn't run
+    the plugin's options again.
+    """
+    args = [f"--rootdir={config.rootdir}"]
+    inipath = getattr(config, "inipath", None) or getattr(config, "inifile", None)
+    if inipath:
+        args.extend(["-c", str(inipath)])
+    for name in getattr(config.option, "plugins", None) or []:
+        args.extend(["-p", name])
+    for override in getattr(config.option, "override_ini", None) or []:
+        args.extend(["-o", override])
+    args.extend(["-o", "addopts=", "-p", "no:cacheprovider", "-q"])
+    return args
+
+
+def run_job(job: Job, options: List[str], connection: Any) -> None:
+    """Run pytest on the generated test file in this process. Send the reports."""
+    with TemporaryDirectory(prefix=".phmdoctest-isolate-", dir=job.directory) as name:
+        path = Path(name) / (job.name + ".py")
+        store.write_atomic(path, job.source)
+        args = [f"{path}::{name}" for name in job.test_names]
+        args.extend(options)
+        if job.doctests:
+            args.append("--doctest-modules")
+        _ = pytest.main(args, plugins=[ReportSender(connection, job.record_deps)])
+    # The next job may use the same module name.
+    _ = sys.modules.pop(job.name, None)
+
+
+def worker_context(preimports: List[str]) -> Any:
+    """Return the multiprocessing context that starts the workers.
+
+    The forkserver imports this module and the preimports once.
+    The preload only applies if the forkserver is not running yet.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__] + preimports)
+    return context
+
+
+def worker_main(connection: Any, preimports: List[str], options: List[str]) -> None:
+    """Import any preimports not inherited then run jobs on connection until None.
+
+    pytest terminal output goes to the null device.
+    PYTEST_ADDOPTS is dropped like the ini file's addopts.
+    """
+    for name in preimports:
+        try:
+            _ = importlib.import_module(name)
+        except ImportError:
+            pass  # The test case that imports it reports the error.
+    sys.dont_write_bytecode = True
+    _ = os.environ.pop("PYTEST_ADDOPTS", None)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    with TemporaryDirectory() as name:
+        directory = Path(name)
+        if "-c" not in options:
+            # This pytest run has no ini file. Don't look for one.
+            (directory / "pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+            options = ["-c", str(directory / "pytest.ini")] + options
+        while True:
+            job = connection.recv()
+            if job is None:
+                break
+            run_job(job, options, connection)
+            connection.send((DONE, resident_memory()))
+    connection.close()
+
+
+class Worker:
+    """A worker process and the number of files it ran."""
+
+    def __init__(self, context: Any, preimports: List[str], options: List[str]) -> None:
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(child_connection, preimports, options),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+        self.files = 0
+
+    def run(self, job: Job) -> Tuple[Ran, int]:
+        """Send the job. Return the reports and the worker's resident memory.
+
+        The error is set if the worker process exited.
+        """
+        reports = []
+        try:
+            self.connection.send(job)
+            while True:
+                kind, data = self.connection.recv()
+                if kind == DONE:
+                    break
+                reports.append(data)
+        except (EOFError, OSError):
+            return Ran(reports=reports, error=f"{CRASHED} {job.name}."), 0
+        self.files += 1
+        return Ran(reports=reports, error=""), data
+
+    def close(self) -> None:
+        """Tell the worker process to exit. Kill it if it doesn't."""
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class WorkerPool:
+    """Reusable worker processes. At most size of them run at once."""
+
+    def __init__(
+        self,
+        size: int,
+        max_files: int,
+        max_rss: int,
+        preimports: List[str],
+        options: List[str],
+    ) -> None:
+        self.size = size
+        self.max_files = max_files
+        self.max_rss = max_rss
+        self.preimports = preimports
+        self.options = options
+        self.context = worker_context(preimports)
+        self.idle: "queue.Queue[Worker]" = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=size)
+        self.started = 0
+        self.recycled = 0
+
+    def submit(self, job: Job) -> "Future[Ran]":
+        """Run the job on a worker. The future's result is the reports."""
+        return self.executor.submit(self.run, job)
+
+    def run(self, job: Job) -> Ran:
+        """Run the job on an idle worker or a new one. Recycle the worker."""
+        try:
+            worker = self.idle.get_nowait()
+        except queue.Empty:
+            worker = Worker(self.context, self.preimports, self.options)
+            self.started += 1
+        ran, rss = worker.run(job)
+        if ran.error:
+            worker.close()
+        elif (self.max_files and worker.files >= self.max_files) or (
+            self.max_rss and rss > self.max_rss
+        ):
+            worker.close()
+            self.recycled += 1
+        else:
+            self.idle.put(worker)
+        return ran
+
+    def close(self) -> None:
+        """Wait for the running jobs. Stop the workers."""
+        self.executor.shutdown(wait=True)
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+def is_cached_pass(item: pytest.Item) -> bool:
+    """True if --phmdoctest-cache-results marked the test case to be skipped."""
+    marker = item.get_closest_marker("skip")
+    return marker is not None and marker.kwargs.get("reason") == results.SKIP_REASON
+
+
+class IsolatedRunner:
+    """pytest plugin that runs the Markdown test cases in worker processes.
+
+    The reports from the workers are logged for the test cases collected
+    here so they look like test cases run in this process.
+    """
+
+    def __init__(
+        self, config, size: int, max_files: int, max_rss: int, preimports: List[str]
+    ) -> None:
+        self.config = config
+        self.pool = WorkerPool(
+            size, max_files, max_rss, preimports, worker_args(config)
+        )
+        self.jobs: Dict[Path, Job] = {}
+        self.job_of_item: Dict[str, Path] = {}
+        self.futures: Dict[Path, "Future[Ran]"] = {}
+        self.received: Dict[Path, Received] = {}
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items) -> None:
+        """pytest hook. Make a job for each generated test file."""
+        outfiles: Dict[Path, Path] = config.phmdoctest_outfiles
+        groups: Dict[Path, List[pytest.Item]] = {}
+        for item in items:
+            outfile = Path(str(item.fspath))
+            if outfile not in outfiles or is_cached_pass(item):
+                continue
+            groups.setdefault(outfile, []).append(item)
+        for outfile, group in groups.items():
+            self.jobs[outfile] = Job(
+                name=module_name(config, outfile),
+                source=generated_source(config, outfile),
+                test_names=tuple(item.name for item in group),
+                doctests=any(hasattr(item, "dtest") for item in group),
+                directory=str(outfiles[outfile].parent),
+                record_deps=getattr(config.phmdoctest_changed, "recorder", None)
+                is not None,
+            )
+            for item in group:
+                self.job_of_item[item.nodeid] = outfile
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem) -> Optional[bool]:
+        """pytest hook. Log the reports from the worker that ran the test case."""
+        outfile = self.job_of_item.get(item.nodeid)
+        if outfile is None:
+            return None
+        if not self.futures:
+            # Start all the jobs the first time so the files run in parallel.
+            for path, job in self.jobs.items():
+                self.futures[path] = self.pool.submit(job)
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for report in self.item_reports(item, outfile):
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+    def item_reports(self, item: pytest.Item, outfile: Path) -> List[Any]:
+        """Return the reports for the test case with its nodeid and location."""
+        if outfile not in self.received:
+            self.received[outfile] = self.receive(outfile)
+        received = self.received[outfile]
+        reports = received.reports.get(item.name, [])
+        for report in reports:
+            report.nodeid = item.nodeid
+            report.location = item.location
+        message = received.error or "The worker did not run the test case."
+        reports = complete_reports(item, reports, message)
+        for report in reports:
+            add_report_data(self.config, item, report)
+        return reports
+
+    def receive(self, outfile: Path) -> "Received":
+        """Wait for a job to finish. Return its reports by test case name."""
+        ran = self.futures[outfile].result()
+        reports: Dict[str, List[Any]] = {}
+        for entry in ran.reports:
+            report = self.config.hook.pytest_report_from_serializable(
+                config=self.config, data=entry
+            )
+            if isinstance(report, pytest.CollectReport):
+                return Received(reports={}, error=str(report.longrepr))
+            name = report.nodeid.rpartition("::")[2]
+            reports.setdefault(name, []).append(report)
+        return Received(reports=reports, error=ran.error)
+
+    def pytest_unconfigure(self) -> None:
+        """pytest hook. Stop the worker processes."""
+        for future in self.futures.values():
+            _ = future.cancel()  # Not started when pytest stopped early.
+        self.pool.close()
+
+
+def configure(config) -> Optional[IsolatedRunner]:
+    """Register the worker pool plugin for --phmdoctest-isolate=subprocess."""
+    if config.option.phmdoctest_isolate != SUBPROCESS:
+        return None
+    if config.option.phmdoctest_isolate_workers < 0:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            "--phmdoctest-isolate-workers must be 0 or more."
+        )
+    max_files = settings.ini_number(config, "phmdoctest-isolate-max-files", "a count")
+    max_rss = settings.ini_number(config, "phmdoctest-isolate-max-rss", "megabytes")
+    runner = IsolatedRunner(
+        config,
+        size=config.option.phmdoctest_isolate_workers or os.cpu_count() or 1,
+        max_files=max_files or 0,
+        max_rss=(max_rss or 0) * 1024 * 1024,
+        preimports=[name for name, _ in config.phmdoctest_preimported],
+    )
+    config.pluginmanager.register(runner, "phmdoctest-isolate")
+    return runner
+
+
+class Received(NamedTuple):
+    """The reports of a finished job or why there are none."""
+
+    reports: Dict[str, List[Any]]  # by test case name
+    error: str  # why reports are missing or empty string
+
+
+def make_report(item: pytest.Item, outcome: str, longrepr: Any, when: str) -> Any:
+    """Return a report for a test case phase the worker did not report."""
+    return pytest.TestReport(
+        nodeid=item.nodeid,
+        location=item.location,
+        keywords={},
+        outcome=outcome,  # type: ignore
+        longrepr=longrepr,
+        when=when,  # type: ignore
+    )
+
+
+def complete_reports(item: pytest.Item, reports: List[Any], message: str) -> List[Any]:
+    """Add reports for the phases missing when the worker stopped early.
+
+    The missing phase fails with message.
+    """
+    phases = {report.when for report in reports}
+    if "teardown" in phases:
+        return reports
+    if "setup" not in phases:
+        return [
+            make_report(item, "failed", message, "setup"),
+            make_report(item, "passed", None, "teardown"),
+        ]
+    missing = []
+    if "call" not in phases and all(report.passed for report in reports):
+        missing.append(make_report(item, "failed", message, "call"))
+        missing.append(make_report(item, "passed", None, "teardown"))
+    else:
+        missing.append(make_report(item, "failed", message, "teardown"))
+    return reports + missing
+
+
+def add_report_data(config, item: pytest.Item, report: Any) -> None:
+    """Add what the plugin's makereport hooks add to reports made here."""
+    for name in ("phmdoctest_results", "phmdoctest_index", "phmdoctest_changed"):
+        plugin = getattr(config, name, None)
+        if plugin is not None:
+            plugin.add_to_report(item, report)
+
+
+def module_name(config, outfile: Path) -> str:
+    """Return the module name of a generated test file."""
+    test_store = config.phmdoctest_store
+    return getattr(test_store, "names", {}).get(outfile, outfile.stem)  # type: ignore
+
+
+def generated_source(config, outfile: Path) -> str:
+    """Return the contents of a generated test file."""
+    if outfile.suffix == ".py":
+        return outfile.read_text(encoding="utf-8")
+    return config.phmdoctest_store.read(outfile)  # type: ignore
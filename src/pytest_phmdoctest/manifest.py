@@ -0,0 +1,109 @@
+"""Get the Markdown files to collect from a list instead of a directory walk."""
+from pathlib import Path
+import subprocess
+from typing import List
+from typing import Optional
+from typing import Set
+
+import pytest
+
+
+def read_manifest(manifest_path: Path, invoke_path: Path) -> List[Path]:
+    """Return the Markdown file paths listed in the file at manifest_path.
+
+    The manifest has one path per line. Relative paths are relative to
+    the directory where pytest is invoked. Blank lines and lines
+    that start with # are ignored.
+    """
+    try:
+        text = manifest_path.read_text(encoding="utf-8")
+    except OSError as exc:
+        raise pytest.UsageError(
+            f"pytest-phmdoctest plugin usage error. Can't read manifest. {exc}"
+        )
+    paths = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            paths.append(invoke_path / line)
+    return paths
+
+
+def git_markdown_files(invoke_path: Path) -> List[Path]:
+    """Return the Markdown files tracked by git in and below invoke_path.
+
+    Tracked files that were deleted from the working tree are left out.
+    """
+    return run_git(invoke_path, ["ls-files", "-z", "--", "*.md"], "git ls-files")
+
+
+def git_changed_markdown_files(invoke_path: Path, ref: str) -> List[Path]:
+    """Return the Markdown files in and below invoke_path changed since git ref.
+
+    Files changed in the working tree or index compared to ref and
+    untracked files that are not ignored are returned.
+    Deleted files are left out.
+    """
+    changed = run_git(
+        invoke_path,
+        ["diff", "--name-only", "--relative", "-z", ref, "--", "*.md"],
+        "git diff",
+    )
+    untracked = run_git(
+        invoke_path,
+        ["ls-files", "-z", "--others", "--exclude-standard", "--", "*.md"],
+        "git ls-files",
+    )
+    seen = set(changed)
+    return changed + [path for path in untracked if path not in seen]
+
+
+def run_git(invoke_path: Path, args: List[str], description: str) -> List[Path]:
+    """Run git with args in invoke_path. Return the existing files it lists."""
+    try:
+        completed = subprocess.run(
+            ["git"] + args,
+            cwd=str(invoke_path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            f"Can't list Markdown files with {description}. {exc}"
+        )
+    names = completed.stdout.decode("utf-8").split("\0")
+    paths = [invoke_path / name for name in names if name]
+    return [path for path in paths if path.is_file()]
+
+
+def configure(config) -> Optional[Set[Path]]:
+    """Add the listed Markdown files to the pytest command line arguments.
+
+    pytest collects command line arguments without searching directories.
+    Markdown files found in directories are ignored by pytest_ignore_collect().
+    When pytest searches the invocation directory, because there are no
+    command line arguments or testpaths, its Python test files are still
+    collected.
+    Return the listed files or None if there is no list.
+    """
+    if not (config.option.phmdoctest_manifest or config.option.phmdoctest_git):
+        return None
+    invoke_path = Path(config.invocation_params.dir)
+    paths = []
+    if config.option.phmdoctest_manifest:
+        manifest_path: Path = config.option.phmdoctest_manifest
+        if not manifest_path.is_absolute():
+            manifest_path = invoke_path / manifest_path
+        paths.extend(read_manifest(manifest_path, invoke_path))
+    if config.option.phmdoctest_git:
+        paths.extend(git_markdown_files(invoke_path))
+    config.phmdoctest_manifest_collected = set()
+    existing = set(config.args)
+    for path in paths:
+        arg = str(path)
+        if arg not in existing:
+            config.args.append(arg)
+            existing.add(arg)
+    return set(paths)
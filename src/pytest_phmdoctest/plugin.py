@@ -1,21 +1,57 @@
 """pytest-phmdoctest plugin implementation."""
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Any
+from typing import Dict
 from typing import Optional
+import zipfile
 
 import py
 import pytest
 
-import phmdoctest.main
 import phmdoctest.tool
+from . import aio
+from . import backends
+from . import cache
+from . import changed
+from . import checkpoint
 from . import docmod
 from . import collectors
+from . import distributed
+from . import fences
+from . import generate
+from . import incremental
+from . import index
+from . import isolate
+from . import manifest
+from . import pregenerate
+from . import preimport
+from . import results
 from . import settings
+from . import sharing
+from . import store
+from . import threads
 
 
 PHMDOCTEST = "--phmdoctest"
 DOCMOD = "--phmdoctest-docmod"
 GENERATE = "--phmdoctest-generate"
+CACHE_CLEAR = "--phmdoctest-cache-clear"
+MANIFEST = "--phmdoctest-manifest"
+GIT = "--phmdoctest-git"
+MODULES = "--phmdoctest-modules"
+JOBS = "--phmdoctest-jobs"
+INCREMENTAL = "--phmdoctest-incremental"
+CHANGED = "--phmdoctest-changed"
+CACHE_RESULTS = "--phmdoctest-cache-results"
+CACHE_EXPORT = "--phmdoctest-cache-export"
+CACHE_IMPORT = "--phmdoctest-cache-import"
+INDEX = "--phmdoctest-index"
+ISOLATE = "--phmdoctest-isolate"
+ISOLATE_WORKERS = "--phmdoctest-isolate-workers"
+CHECKPOINT = "--phmdoctest-checkpoint"
+GRAPH = "--phmdoctest-graph"
 
 
 def as_dest(opt: str) -> str:
@@ -48,6 +84,143 @@ def pytest_addoption(parser):
         metavar="DIR",
         help="Or write pytest files generated from Python and doctest examples to DIR.",
     )
+    group.addoption(
+        CACHE_CLEAR,
+        action="store_true",
+        dest=as_dest(opt=CACHE_CLEAR),
+        help="Remove test files generated by earlier runs from the pytest cache.",
+    )
+    group.addoption(
+        MANIFEST,
+        action="store",
+        dest=as_dest(opt=MANIFEST),
+        default=None,
+        type=Path,
+        metavar="FILE",
+        help="Only collect the Markdown files listed one per line in FILE.",
+    )
+    group.addoption(
+        GIT,
+        action="store_true",
+        dest=as_dest(opt=GIT),
+        help="Only collect the Markdown files listed by git ls-files.",
+    )
+    group.addoption(
+        MODULES,
+        action="store",
+        dest=as_dest(opt=MODULES),
+        default=store.TEMPDIR,
+        choices=store.MODULES_CHOICES,
+        help=(
+            "Where --phmdoctest and --phmdoctest-docmod keep generated test files."
+            " tempdir is the default."
+        ),
+    )
+    group.addoption(
+        JOBS,
+        action="store",
+        dest=as_dest(opt=JOBS),
+        default=1,
+        type=int,
+        metavar="N",
+        help="Generate test files in N processes before collection. 0 means 1 per CPU.",
+    )
+    group.addoption(
+        INCREMENTAL,
+        action="store_true",
+        dest=as_dest(opt=INCREMENTAL),
+        help=(
+            f"With {GENERATE} only write test files that changed"
+            " and only remove those whose Markdown file is gone."
+        ),
+    )
+    group.addoption(
+        CHANGED,
+        action="store",
+        dest=as_dest(opt=CHANGED),
+        default=None,
+        metavar="REF",
+        help=(
+            "Only collect Markdown files changed since git REF."
+            f" REF={changed.LAST_RUN} means since the file last passed."
+            f" REF={changed.DEPS} also checks the project files the tests used."
+        ),
+    )
+    group.addoption(
+        CACHE_RESULTS,
+        action="store_true",
+        dest=as_dest(opt=CACHE_RESULTS),
+        help=(
+            "Skip Markdown examples that passed before when the example,"
+            " setup, teardown, settings, and installed packages are unchanged."
+        ),
+    )
+    group.addoption(
+        CACHE_EXPORT,
+        action="store",
+        dest=as_dest(opt=CACHE_EXPORT),
+        default=None,
+        type=Path,
+        metavar="FILE",
+        help="Write the plugin's cache entries to the zip archive FILE at exit.",
+    )
+    group.addoption(
+        CACHE_IMPORT,
+        action="store",
+        dest=as_dest(opt=CACHE_IMPORT),
+        default=None,
+        type=Path,
+        metavar="FILE",
+        help="Add the cache entries in the zip archive FILE before collection.",
+    )
+    group.addoption(
+        INDEX,
+        action="store",
+        dest=as_dest(opt=INDEX),
+        default=None,
+        type=Path,
+        metavar="FILE",
+        help=(
+            "Update the SQLite database FILE with each Python fenced code block"
+            " and its last test result. Query it with"
+            " python -m pytest_phmdoctest.index."
+        ),
+    )
+    group.addoption(
+        ISOLATE,
+        action="store",
+        dest=as_dest(opt=ISOLATE),
+        default=isolate.NONE,
+        choices=isolate.ISOLATE_CHOICES,
+        help=(
+            "subprocess runs the Markdown test cases in a pool of"
+            " worker processes. Default is none."
+        ),
+    )
+    group.addoption(
+        ISOLATE_WORKERS,
+        action="store",
+        dest=as_dest(opt=ISOLATE_WORKERS),
+        default=0,
+        type=int,
+        metavar="N",
+        help=f"Number of {ISOLATE} worker processes. 0 means 1 per CPU.",
+    )
+    group.addoption(
+        CHECKPOINT,
+        action="store_true",
+        dest=as_dest(opt=CHECKPOINT),
+        help=(
+            "POSIX only. After a Markdown file's setup block runs, fork a"
+            " process for each group of examples that share no names."
+        ),
+    )
+    group.addoption(
+        GRAPH,
+        action="store_true",
+        dest=as_dest(opt=GRAPH),
+        help="Show the name dependencies between the examples of each Markdown file.",
+    )
     parser.addini(
         "phmdoctest-collect",
         type="linelist",
@@ -56,6 +229,104 @@ def pytest_addoption(parser):
             " When this section exists, only glob matches are collected."
         ),
     )
+    parser.addini(
+        "phmdoctest-ignore",
+        type="linelist",
+        help=(
+            "each line is a glob. Matching Markdown files are not collected"
+            " and matching directories are not searched."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-prune",
+        type="bool",
+        default=False,
+        help=(
+            "don't search directories where no phmdoctest-collect glob can match."
+            " Python test files there are not collected either."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-stable-ids",
+        type="bool",
+        default=False,
+        help=(
+            "name test cases after a hash of the example instead of line numbers"
+            " so --lf, --ff, and --sw find them after the Markdown is edited."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-cache-backend",
+        type="string",
+        default=backends.DIR,
+        help=(
+            "where the plugin saves cache entries: dir, sqlite, or shared."
+            " dir and sqlite are in the pytest cache."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-shared-cache-dir",
+        type="string",
+        default="",
+        help="directory used by phmdoctest-cache-backend = shared.",
+    )
+    parser.addini(
+        "phmdoctest-preimport",
+        type="linelist",
+        help=(
+            "each line is a module imported once before the Markdown"
+            " test cases run. Worker processes import them too."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-event-loop",
+        type="string",
+        default=aio.FILE,
+        help=(
+            f"{' or '.join(aio.EVENT_LOOP_CHOICES)}. Run the top level awaits"
+            " on an event loop for each Markdown file or one for all of them."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-isolate-max-files",
+        type="string",
+        default="",
+        help="replace an isolate worker process after it ran this many files.",
+    )
+    parser.addini(
+        "phmdoctest-concurrent-threads",
+        type="string",
+        default="",
+        help=(
+            "a count. Threads that run the Markdown files marked --concurrent."
+            " Empty or 0 means the ThreadPoolExecutor default."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-isolate-max-rss",
+        type="string",
+        default="",
+        help=(
+            "megabytes. Replace an isolate worker process when its"
+            " resident memory is larger."
+        ),
+    )
+    parser.addini(
+        "phmdoctest-stream-threshold",
+        type="string",
+        default="",
+        help=(
+            "size in bytes. Larger Markdown files are read line by line"
+            " to limit memory use."
+        ),
+    )
+
+
+def stream_threshold(config) -> Optional[int]:
+    """Size in bytes above which Markdown files are read line by line or None."""
+    return settings.ini_number(
+        config, "phmdoctest-stream-threshold", "a number of bytes"
+    )
 
 
 def with_stem(path: Path, stem: str) -> Path:
@@ -79,6 +350,61 @@ def purge_markdown_from(target_dir: Path) -> None:
 
 def pytest_configure(config):
     """pytest initialization hook. Adds attributes to caller's config."""
+    check_options(config)
+    # Generated test file paths mapped to their Markdown file paths.
+    config.phmdoctest_outfiles = {}
+    # Markdown file paths mapped to generate.Context.
+    config.phmdoctest_contexts = {}
+    # Markdown file paths mapped to sharing.Graph.
+    config.phmdoctest_graphs = {}
+    # Markdown file paths matched by a --concurrent phmdoctest-collect line.
+    config.phmdoctest_concurrent = set()
+    # The feature plugins. Each module registers its own.
+    config.phmdoctest_manifest = None
+    config.phmdoctest_changed = None
+    config.phmdoctest_results = None
+    config.phmdoctest_preimported = []
+    config.phmdoctest_isolate = None
+    config.phmdoctest_checkpoint = None
+    config.phmdoctest_threads = None
+    config.phmdoctest_index = None
+    if (
+        config.option.phmdoctest
+        or config.option.phmdoctest_generate
+        or config.option.phmdoctest_docmod
+    ):
+        # Ini-file collect section allowed in all modes.
+        config.phmdoctest_file_settings = settings.FileSettings(config)
+        config.phmdoctest_stream_threshold = stream_threshold(config)
+        # Results from the --phmdoctest-jobs process pool keyed by Markdown path.
+        config.phmdoctest_pregenerated = {}
+        if config.option.phmdoctest_jobs < 0:
+            raise pytest.UsageError(
+                "pytest-phmdoctest plugin usage error. " f"{JOBS} must be 0 or more."
+            )
+        configure_cache(config)
+        config.phmdoctest_controller = distributed.configure(config)
+        config.phmdoctest_manifest = manifest.configure(config)
+        config.phmdoctest_results = results.configure(config)
+        config.phmdoctest_preimported = preimport.configure(config)
+        aio.configure(config)
+        config.phmdoctest_isolate = isolate.configure(config)
+        config.phmdoctest_checkpoint = checkpoint.configure(config)
+        config.phmdoctest_threads = threads.configure(config)
+        config.phmdoctest_index = index.configure(config)
+        config.phmdoctest_changed = changed.configure(config)
+
+    # Place to keep generated test files needed in non-generate modes.
+    if config.option.phmdoctest or config.option.phmdoctest_docmod:
+        config.phmdoctest_store = store.make_store(
+            config.option.phmdoctest_modules, cache.cache_directory(config)
+        )
+    if config.option.phmdoctest_generate is not None:
+        configure_generate(config)
+
+
+def check_options(config) -> None:
+    """Raise a usage error for options that can't be used together."""
     # Only one option allowed:
     if (
         (config.option.phmdoctest and config.option.phmdoctest_generate)
@@ -90,41 +416,135 @@ def pytest_configure(config):
             f"Cannot use more than one of {PHMDOCTEST}, {GENERATE}, "
             f"{DOCMOD} option at the same time."
         )
-    # Ini-file collect section allowed in all modes.
-    if (
-        config.option.phmdoctest
-        or config.option.phmdoctest_generate
-        or config.option.phmdoctest_docmod
-    ):
-        config.phmdoctest_file_settings = settings.FileSettings(config)
-    # Temporary directory needed in non-generate modes.
-    if config.option.phmdoctest or config.option.phmdoctest_docmod:
-        config.phmdoctest_temporary_dir = None
-
-    # For generate mode:
-    # Create directory DIR for writing generated pytest files.
-    # 1. The FILENAME.py files found in DIR are renamed to noFILENAME.sav.
-    # 2. If a noFILENAME.sav already exists it is not modified.
-    # 3. Markdown (*.md) files are renamed to *_md.sav.
-    # 4. Files in DIR with other extensions are not modified.
-    #
-    # This results in 2 important outcomes:
-    # 1. The FILENAME.py files remaining in DIR after plugin collection are
-    #    generated test_FILENAME.py files from the current pytest invocation.
-    # 2. A FILENAME.py pre-existing in DIR is only renamed and not deleted.
-    #    This allows for recovery of FILENAME.py files when DIR gets pointed
-    #    by mistake to a directory with Python source files.
-    if config.option.phmdoctest_generate is not None:
-        p: Path = config.option.phmdoctest_generate
-        if p.is_absolute():
-            generate_dir = p
+    if config.option.phmdoctest_incremental and not config.option.phmdoctest_generate:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            f"{INCREMENTAL} requires {GENERATE}."
+        )
+
+
+def configure_generate(config) -> None:
+    """Create directory DIR for writing generated pytest files.
+
+    1. The FILENAME.py files found in DIR are renamed to noFILENAME.sav.
+    2. If a noFILENAME.sav already exists it is not modified.
+    3. Markdown (*.md) files are renamed to *_md.sav.
+    4. Files in DIR with other extensions are not modified.
+
+    This results in 2 important outcomes:
+    1. The FILENAME.py files remaining in DIR after plugin collection are
+       generated test_FILENAME.py files from the current pytest invocation.
+    2. A FILENAME.py pre-existing in DIR is only renamed and not deleted.
+       This allows for recovery of FILENAME.py files when DIR gets pointed
+       by mistake to a directory with Python source files.
+    """
+    p: Path = config.option.phmdoctest_generate
+    if p.is_absolute():
+        generate_dir = p
+    else:
+        generate_dir = config.invocation_params.dir / p
+    config.phmdoctest_filesystem_dir = Path(generate_dir)
+    generate_manifest = incremental.configure(config, Path(generate_dir))
+    config.phmdoctest_generate_manifest = generate_manifest
+    # With pytest-xdist only the controller cleans DIR.
+    if not distributed.is_worker(config):
+        if generate_manifest is not None and generate_manifest.exists():
+            # Keep the test files. Remove those whose Markdown file is gone.
+            _ = generate_manifest.remove_orphans(config.invocation_params.dir)
+            generate_manifest.save()
         else:
-            generate_dir = config.invocation_params.dir / p
-        config.phmdoctest_filesystem_dir = Path(generate_dir)
-        phmdoctest.tool.wipe_testfile_directory(generate_dir)
+            # The first incremental run cleans DIR the same way.
+            phmdoctest.tool.wipe_testfile_directory(generate_dir)
         purge_markdown_from(generate_dir)
 
 
+def configure_cache(config) -> None:
+    """Create the cache backends. Clear or import entries.
+
+    Detection results and generated test files are saved in the
+    pytest cache. Unchanged Markdown files are not parsed again.
+    The other saved state goes in a second backend.
+    """
+    config.phmdoctest_cache = None
+    config.phmdoctest_state = None
+    config.phmdoctest_cache_dir = None
+    kind = config.getini("phmdoctest-cache-backend").strip() or backends.DIR
+    if kind not in backends.BACKEND_CHOICES:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            f"phmdoctest-cache-backend must be one of {backends.BACKEND_CHOICES}, "
+            f"got {kind!r}."
+        )
+    config.phmdoctest_cache_backend = kind
+    if kind == backends.SHARED:
+        shared = config.getini("phmdoctest-shared-cache-dir").strip()
+        if not shared:
+            raise pytest.UsageError(
+                "pytest-phmdoctest plugin usage error. "
+                "phmdoctest-cache-backend = shared needs phmdoctest-shared-cache-dir."
+            )
+        cache_dir: Optional[Path] = Path(str(config.rootdir)) / shared
+    else:
+        cache_dir = cache.cache_directory(config)
+    if distributed.is_worker(config):
+        # The pytest-xdist controller already generated the test files.
+        cache_dir = distributed.shared_directory(config) or cache_dir
+    if cache_dir is None:
+        return
+    set_cache_directory(config, cache_dir)
+    if distributed.is_worker(config):
+        return
+    if config.option.phmdoctest_cache_clear:
+        config.phmdoctest_cache.clear()
+    if config.option.phmdoctest_cache_import is not None:
+        archive = config.invocation_params.dir / config.option.phmdoctest_cache_import
+        try:
+            count = backends.import_archive(archive, cache_backends(config))
+        except (OSError, ValueError, zipfile.BadZipFile) as exc:
+            raise pytest.UsageError(
+                "pytest-phmdoctest plugin usage error. "
+                f"Can't read cache archive. {exc}"
+            )
+        config.phmdoctest_import_summary = (
+            f"phmdoctest cache import: {count} entries added"
+        )
+
+
+def set_cache_directory(config, cache_dir: Path) -> None:
+    """Use backends under cache_dir for the generated test files and state."""
+    kind = config.phmdoctest_cache_backend
+    config.phmdoctest_cache_dir = cache_dir
+    config.phmdoctest_cache = cache.GeneratedCache(
+        backends.make_backend(kind, cache_dir, "generated")
+    )
+    if kind == backends.SHARED:
+        # The shared directory only gets entries keyed by their contents.
+        # The state of this checkout's runs stays in the pytest cache.
+        state_dir = cache.cache_directory(config)
+        if state_dir is not None:
+            config.phmdoctest_state = backends.make_backend(
+                backends.DIR, state_dir, "state"
+            )
+    else:
+        config.phmdoctest_state = backends.make_backend(kind, cache_dir, "state")
+
+
+def cache_backends(config) -> Dict[str, backends.Backend]:
+    """The backends by name for export and import."""
+    named = {"generated": config.phmdoctest_cache.backend}
+    if config.phmdoctest_state is not None:
+        named["state"] = config.phmdoctest_state
+    return named
+
+
+def pytest_report_header(config) -> Optional[str]:
+    """pytest hook. Show how long each phmdoctest-preimport module took."""
+    timings = getattr(config, "phmdoctest_preimported", None)
+    if not timings:
+        return None
+    return preimport.report_header(timings)
+
+
 # Please be aware that mypy says error: All conditional function variants
 # must have identical signatures.
 if collectors.PYTEST_GE_7:
@@ -146,6 +566,115 @@ else:
         return pathy_collect_file(pathy, parent)
 
 
+if collectors.PYTEST_GE_7:
+
+    def pytest_ignore_collect(collection_path: Path, config) -> Optional[bool]:
+        """pytest collection hook for pytest version 7.x."""
+        pathy = collectors.Pathy(collection_path)
+        return pathy_ignore_collect(pathy, config)
+
+else:
+
+    def pytest_ignore_collect(path: py.path.local, config) -> Optional[bool]:
+        """pytest collection hook for pytest version 6.2.x."""
+        pathy = collectors.Pathy(path)
+        return pathy_ignore_collect(pathy, config)
+
+
+def jobs_count(config) -> int:
+    """Number of processes for --phmdoctest-jobs."""
+    jobs: int = config.option.phmdoctest_jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+
+def pytest_sessionstart(session) -> None:
+    """pytest hook. With pytest-xdist generate once on the controller.
+
+    The test files are saved in a cache directory shared with the workers.
+    Runs before pytest-xdist starts the workers in its trylast
+    pytest_sessionstart().
+    """
+    config = session.config
+    if not (
+        config.option.phmdoctest
+        or config.option.phmdoctest_generate
+        or config.option.phmdoctest_docmod
+    ):
+        return None
+    if distributed.is_worker(config) or not distributed.is_controller(config):
+        return None
+    if config.phmdoctest_cache is None:
+        # No pytest cache. Share a temporary directory instead.
+        config.phmdoctest_shared_tempdir = TemporaryDirectory()
+        set_cache_directory(config, Path(config.phmdoctest_shared_tempdir.name))
+    config.phmdoctest_controller.directory = config.phmdoctest_cache_dir
+    jobs = jobs_count(config)
+    count = pregenerate.fill_cache(config, jobs)
+    config.phmdoctest_jobs_summary = (
+        f"phmdoctest xdist controller: {jobs} processes generated {count} files"
+    )
+    return None
+
+
+def pytest_collection(session) -> None:
+    """pytest collection hook. Generate test files in a process pool."""
+    config = session.config
+    if not (
+        config.option.phmdoctest
+        or config.option.phmdoctest_generate
+        or config.option.phmdoctest_docmod
+    ):
+        return None
+    if distributed.is_worker(config) or distributed.is_controller(config):
+        return None  # Generated by pytest_sessionstart() on the controller.
+    jobs = jobs_count(config)
+    if jobs > 1:
+        config.phmdoctest_pregenerated = pregenerate.pregenerate(config, jobs)
+        config.phmdoctest_jobs_summary = (
+            f"phmdoctest jobs: {jobs} processes generated "
+            f"{len(config.phmdoctest_pregenerated)} files"
+        )
+    return None
+
+
+def pathy_ignore_collect(pathy: collectors.Pathy, config) -> Optional[bool]:
+    """pytest collection hook implementation. Return True to prune the path.
+
+    Return None rather than False so that other plugins and pytest's
+    own --ignore options still get to decide.
+    pytest does not call this hook for paths given on the command line.
+    """
+    if not (
+        config.option.phmdoctest
+        or config.option.phmdoctest_generate
+        or config.option.phmdoctest_docmod
+    ):
+        return None
+    file_settings: settings.FileSettings = config.phmdoctest_file_settings
+    path = pathy.as_path
+    if pathy.extension == ".md":
+        if config.phmdoctest_manifest is not None:
+            # Only collect Markdown files from the manifest.
+            # They are command line arguments and don't get here.
+            return True
+        if file_settings.is_ignored(path):
+            return True
+        if file_settings.prune and file_settings.exists():
+            if file_settings.match_glob(path) is None:
+                return True
+        return None
+    if file_settings.ignore_matcher is None and not file_settings.prune:
+        return None  # Avoid the is_dir() system call.
+    if path.is_dir():
+        if file_settings.is_ignored(path):
+            return True
+        if file_settings.prune and not file_settings.may_contain_match(path):
+            return True
+    return None
+
+
 def pathy_collect_file(
     markdown: collectors.Pathy, parent: pytest.Collector
 ) -> Optional[collectors.PluginCollector]:
@@ -158,30 +687,69 @@ def pathy_collect_file(
     ) and markdown.extension == ".md":
         collect_path = markdown.as_path
         invoke_path = Path(config.invocation_params.dir)
-        markdown_examples = phmdoctest.tool.detect_python_examples(collect_path)
+
+        # A listed file is also found when pytest searches a directory
+        # given on the command line. Collect it only once.
+        if config.phmdoctest_manifest is not None:
+            if collect_path in config.phmdoctest_manifest_collected:
+                return collectors.empty_collector(parent, markdown, collect_path.name)
+            config.phmdoctest_manifest_collected.add(collect_path)
+
+        generate_manifest: Optional[incremental.GenerateManifest] = getattr(
+            config, "phmdoctest_generate_manifest", None
+        )
+
+        # Reject unchanged Markdown files before reading them.
+        changed_files: Optional[changed.ChangedFiles] = config.phmdoctest_changed
+        if changed_files is not None and not changed_files.is_changed(collect_path):
+            if generate_manifest is not None:
+                generate_manifest.keep(
+                    generated_file_name(collect_path.relative_to(invoke_path))
+                )
+            return collectors.empty_collector(parent, markdown, collect_path.name)
+
+        kwargs = settings.collect_kwargs(config, collect_path)
+        if kwargs is None:
+            return collectors.empty_collector(parent, markdown, collect_path.name)
+        relative_path = collect_path.relative_to(invoke_path)
+
+        if generate_manifest is not None:
+            # Skip generating when the Markdown file and settings are unchanged.
+            generated_name = generated_file_name(relative_path)
+            markdown_name = relative_path.as_posix()
+            source = generate_manifest.source_hash(collect_path, kwargs)
+            if generate_manifest.is_current(generated_name, markdown_name, source):
+                context, graph = generate_manifest.recorded(generated_name)
+                outfile_path = config.phmdoctest_filesystem_dir / generated_name
+                register_outfile(
+                    config, outfile_path, collect_path, kwargs, context, graph
+                )
+                return collectors.empty_collector(parent, markdown, collect_path.name)
+
+        generated = detect_and_generate(config, kwargs)
+        markdown_examples = generated.examples
+        test_file = generated.test_file
+        block_index: Optional[index.BlockIndex] = config.phmdoctest_index
+        if block_index is not None:
+            file_settings: settings.FileSettings = config.phmdoctest_file_settings
+            block_index.add_file(
+                relative_path.as_posix(),
+                file_settings.collect_line(collect_path),
+                generated.blocks,
+            )
 
         # Don't try collecting a .md file with no
         # Python highlighted fenced code blocks.
         if not (markdown_examples.has_code or markdown_examples.has_session):
+            if generate_manifest is not None:
+                generate_manifest.discard(generated_name)
+            if changed_files is not None:
+                changed_files.no_tests(collect_path)
             # The empty collector avoids a pytest error when individual
             # .md files are specified on the command line.
             # The error shows up as a Usage error in pytest's debug log.
             return collectors.empty_collector(parent, markdown, collect_path.name)
 
-        # If the ini file has a phmdoctest-collect section then
-        # generate a test file if and only if the Markdown file matches a
-        # glob in the section.
-        # User may add options to the section.
-        if config.phmdoctest_file_settings.exists():
-            kwargs = config.phmdoctest_file_settings.match_glob(collect_path)
-            if kwargs is None:
-                return collectors.empty_collector(parent, markdown, collect_path.name)
-        else:
-            kwargs = {}  # use defaults.
-        kwargs["markdown_file"] = collect_path
-        relative_path = collect_path.relative_to(invoke_path)
-        kwargs["built_from"] = relative_path.as_posix()
-
         # 1. Name given to the collector which collects
         #    a Module and DoctestModule.
         #    It is a flattened version of the Markdown file.
@@ -191,22 +759,32 @@ def pathy_collect_file(
         # Set the destination for the generated Python test file.
         generated_path = Path(my_collector_name).with_suffix(".py")
 
-        if config.option.phmdoctest_generate:
-            prefixed = "test_" + generated_path.stem
-            prefixed_path = with_stem(generated_path, prefixed)
-            outfile_path = config.phmdoctest_filesystem_dir / prefixed_path
-        else:
-            # The other modes generate to the temp dir.
-            if config.phmdoctest_temporary_dir is None:
-                config.phmdoctest_temporary_dir = TemporaryDirectory()
-            outfile_path = Path(config.phmdoctest_temporary_dir.name) / generated_path
-
-        # Checking here for a line with a parse error in the phmdoctest-collect section.
-        if "ini-error" in kwargs:
-            test_file = settings.error_file(kwargs["built_from"], kwargs["ini-error"])
+        if generate_manifest is not None:
+            generate_manifest.write(generated_name, markdown_name, source, generated)
+            outfile_path = config.phmdoctest_filesystem_dir / generated_name
+        elif config.option.phmdoctest_generate:
+            outfile_path = config.phmdoctest_filesystem_dir / generated_file_name(
+                relative_path
+            )
+            if distributed.is_worker(config):
+                # Every pytest-xdist worker collects the Markdown file.
+                write_if_changed(outfile_path, test_file)
+            else:
+                _ = outfile_path.write_text(test_file, encoding="utf-8")
         else:
-            test_file = phmdoctest.main.testfile(**kwargs)
-        _ = outfile_path.write_text(test_file, encoding="utf-8")
+            # The other modes keep the test file in the store.
+            test_store: store.Store = config.phmdoctest_store
+            outfile_path = test_store.path(collect_path, generated_path.stem)
+            test_store.save(outfile_path, test_file)
+
+        register_outfile(
+            config,
+            outfile_path,
+            collect_path,
+            kwargs,
+            generated.context,
+            generated.graph,
+        )
 
         if config.option.phmdoctest_generate:
             # Don't collect here.
@@ -225,9 +803,11 @@ def pathy_collect_file(
             plugin_collector = docmod.collect(
                 markdown_examples=markdown_examples,
                 built_from=kwargs["built_from"],
+                survivors=generated.survivors,
                 parent=parent,
                 outfile_path=outfile_path,
                 collector_name=my_collector_name,
+                test_store=config.phmdoctest_store,
             )
             if plugin_collector:
                 return plugin_collector
@@ -236,11 +816,183 @@ def pathy_collect_file(
     return None
 
 
+def register_outfile(
+    config,
+    outfile_path: Path,
+    collect_path: Path,
+    kwargs: Dict[str, Any],
+    context: generate.Context,
+    graph: sharing.Graph,
+) -> None:
+    """Record the test file generated from the Markdown file."""
+    config.phmdoctest_outfiles[outfile_path] = collect_path
+    config.phmdoctest_contexts[collect_path] = context
+    config.phmdoctest_graphs[collect_path] = graph
+    if kwargs.get("concurrent"):
+        config.phmdoctest_concurrent.add(collect_path)
+
+
+def generated_file_name(relative_path: Path) -> str:
+    """Name of the file --phmdoctest-generate writes for the Markdown file."""
+    flattened = "__".join(relative_path.parts)
+    return "test_" + Path(flattened).with_suffix(".py").name
+
+
+def write_if_changed(path: Path, text: str) -> None:
+    """Write the file unless another process already wrote the same text."""
+    try:
+        if path.read_text(encoding="utf-8") == text:
+            return
+    except OSError:
+        pass
+    store.write_atomic(path, text)
+
+
+def detect_and_generate(config, kwargs: Dict[str, Any]) -> generate.Generated:
+    """Detect Python examples and generate the test file. Use the cache if we can.
+
+    The test file is the empty string when the Markdown file has
+    no Python examples.
+    """
+    markdown_file: Path = kwargs["markdown_file"]
+    # Most Markdown files have no Python examples. Reject them by
+    # searching the raw bytes for a Python fence before parsing or hashing.
+    if not fences.may_have_python(markdown_file):
+        no_examples = phmdoctest.tool.PythonExamples(has_code=False, has_session=False)
+        return generate.Generated(
+            examples=no_examples,
+            test_file="",
+            survivors=generate.NO_SURVIVORS,
+            context=generate.NO_CONTEXT,
+            blocks=(),
+            graph=(),
+        )
+    # Read very large Markdown files line by line to limit memory use.
+    streamed = generate.use_streaming(markdown_file, config.phmdoctest_stream_threshold)
+    if not streamed:
+        markdown = markdown_file.read_bytes()
+    generated_cache: Optional[cache.GeneratedCache] = config.phmdoctest_cache
+    if generated_cache is not None:
+        key_kwargs = cache.key_kwargs(kwargs, streamed)
+        if streamed:
+            key = generated_cache.key_from_file(markdown_file, key_kwargs)
+        else:
+            key = generated_cache.key(markdown, key_kwargs)
+        entry = generated_cache.get(key)
+        if entry is not None:
+            return cache.from_entry(entry)
+
+    # Use the result from the --phmdoctest-jobs process pool if there is one.
+    generated = config.phmdoctest_pregenerated.pop(markdown_file, None)
+    if generated is None:
+        # Parse the Markdown once for both detection and generation.
+        if streamed:
+            generated = generate.generate_streamed(markdown_file, kwargs)
+        else:
+            generated = generate.generate(generate.decode(markdown), kwargs)
+
+    if generated_cache is not None:
+        generated_cache.set(key, cache.make_entry(generated))
+    return generated
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(session, config, items) -> None:
+    """pytest hook. Drop incremental test files of Markdown files not collected.
+
+    A pytest-xdist worker only deselects them. The next run without
+    pytest-xdist removes them from DIR.
+    """
+    generate_manifest: Optional[incremental.GenerateManifest] = getattr(
+        config, "phmdoctest_generate_manifest", None
+    )
+    if generate_manifest is None:
+        return
+    invoke_path = Path(config.invocation_params.dir)
+    searched = [
+        Path(os.path.abspath(invoke_path / arg.split("::")[0])) for arg in config.args
+    ]
+    stale = generate_manifest.stale(invoke_path, searched)
+    if not stale:
+        return
+    stale_paths = {config.phmdoctest_filesystem_dir / name for name in stale}
+    deselected = [item for item in items if Path(str(item.fspath)) in stale_paths]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if item not in deselected]
+    if not distributed.is_worker(config):
+        for name in stale:
+            generate_manifest.discard(name)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """pytest reporting hook. Show the process pool and cache counters."""
+    jobs_summary = getattr(config, "phmdoctest_jobs_summary", None)
+    if jobs_summary is not None and config.option.verbose > 0:
+        terminalreporter.write_line(jobs_summary)
+    result_cache = getattr(config, "phmdoctest_results", None)
+    if result_cache is not None and result_cache.skipped:
+        terminalreporter.write_line(
+            f"phmdoctest cached passes: {result_cache.skipped} skipped"
+        )
+    runner: Optional[isolate.IsolatedRunner] = getattr(
+        config, "phmdoctest_isolate", None
+    )
+    if runner is not None and config.option.verbose > 0:
+        terminalreporter.write_line(
+            f"phmdoctest isolate: {runner.pool.started} worker processes started, "
+            f"{runner.pool.recycled} recycled"
+        )
+    import_summary = getattr(config, "phmdoctest_import_summary", None)
+    if import_summary is not None and config.option.verbose > 0:
+        terminalreporter.write_line(import_summary)
+    if getattr(config.option, "phmdoctest_graph", False):
+        show_graphs(terminalreporter, config)
+    generated_cache = getattr(config, "phmdoctest_cache", None)
+    if generated_cache is not None and config.option.verbose > 0:
+        if generated_cache.hits or generated_cache.misses:
+            terminalreporter.write_line(
+                f"phmdoctest cache: {generated_cache.hits} hits, "
+                f"{generated_cache.misses} misses"
+            )
+
+
+def show_graphs(terminalreporter, config) -> None:
+    """Show the dependency graph and groups of each collected Markdown file."""
+    graphs: Dict[Path, sharing.Graph] = getattr(config, "phmdoctest_graphs", {})
+    if not graphs:
+        return
+    terminalreporter.write_sep("=", "phmdoctest graph")
+    invoke_path = Path(config.invocation_params.dir)
+    for markdown_path in sorted(graphs):
+        graph = graphs[markdown_path]
+        groups = len(sharing.group_examples(graph)) or (1 if graph else 0)
+        try:
+            name = markdown_path.relative_to(invoke_path).as_posix()
+        except ValueError:
+            name = markdown_path.as_posix()
+        terminalreporter.write_line(f"{name}: {len(graph)} examples, {groups} groups")
+        for line in sharing.format_graph(graph):
+            terminalreporter.write_line(line)
+
+
 def pytest_unconfigure(config):
     """pytest hook called before test process exits.  Cleanup the temporary dir."""
-    # If we raised a UsageError in pytest_configure(), config.phmdoctest_temporary_dir
+    # If we raised a UsageError in pytest_configure(), config.phmdoctest_store
     # won't exist.
-    if hasattr(config, "phmdoctest_temporary_dir"):
-        if config.phmdoctest_temporary_dir is not None:
-            config.phmdoctest_temporary_dir.cleanup()
-            config.phmdoctest_temporary_dir = None
+    if hasattr(config, "phmdoctest_store"):
+        config.phmdoctest_store.close()
+    aio.close_session_loop()
+    generate_manifest = getattr(config, "phmdoctest_generate_manifest", None)
+    if generate_manifest is not None:
+        generate_manifest.save()
+    if getattr(config, "phmdoctest_cache", None) is not None:
+        export_path = config.option.phmdoctest_cache_export
+        if export_path is not None and not distributed.is_worker(config):
+            archive = config.invocation_params.dir / export_path
+            _ = backends.export_archive(archive, cache_backends(config))
+        config.phmdoctest_cache.backend.close()
+        if config.phmdoctest_state is not None:
+            config.phmdoctest_state.close()
+    if hasattr(config, "phmdoctest_shared_tempdir"):
+        config.phmdoctest_shared_tempdir.cleanup()
@@ -0,0 +1,164 @@
+"""Generate test files for the Markdown files in a process pool before collection."""
+from concurrent.futures import ProcessPoolExecutor
+import fnmatch
+import os
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import cache
+from . import fences
+from . import generate
+from . import settings
+
+
+def find_markdown_files(config) -> List[Path]:
+    """Find the Markdown files pytest is likely to collect.
+
+    Search the command line arguments the way pytest collection does,
+    approximately. The ignore and prune settings, norecursedirs, --ignore,
+    and --ignore-glob are applied. A file found here that pytest does
+    not collect only costs some work. A file missed here is generated
+    when it is collected.
+    """
+    if config.phmdoctest_manifest is not None:
+        return sorted(config.phmdoctest_manifest)
+    invoke_path = Path(config.invocation_params.dir)
+    found: List[Path] = []
+    for arg in config.args:
+        path = invoke_path / arg.split("::")[0]
+        if path.is_file():
+            if path.suffix == ".md":
+                found.append(path)
+        elif path.is_dir():
+            found.extend(walk(config, path))
+    return found
+
+
+def walk(config, directory: Path) -> Iterator[Path]:
+    """Yield the Markdown files in directory and its subdirectories."""
+    file_settings: settings.FileSettings = config.phmdoctest_file_settings
+    norecursedirs = config.getini("norecursedirs")
+    ignore_paths = [Path(p).resolve() for p in config.getoption("ignore") or []]
+    ignore_globs = config.getoption("ignore_glob") or []
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        path = Path(entry.path)
+        if path in ignore_paths:
+            continue
+        if any(fnmatch.fnmatch(entry.path, glob) for glob in ignore_globs):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if any(fnmatch.fnmatch(entry.name, pat) for pat in norecursedirs):
+                continue
+            if file_settings.is_ignored(path):
+                continue
+            if file_settings.prune and not file_settings.may_contain_match(path):
+                continue
+            yield from walk(config, path)
+        elif entry.name.endswith(".md") and entry.is_file():
+            if not file_settings.is_ignored(path):
+                yield path
+
+
+class Work(NamedTuple):
+    """A Markdown file to generate and the cache key for its result."""
+
+    path: Path
+    kwargs: Dict[str, Any]
+    key: Optional[str]  # None when there is no cache
+
+
+def find_work(config) -> List[Work]:
+    """Return the Markdown files that need generating.
+
+    Files rejected by the pre-filter, files not selected by the
+    phmdoctest-collect section, and files found in the cache are left out.
+    """
+    generated_cache: Optional[cache.GeneratedCache] = config.phmdoctest_cache
+    threshold: Optional[int] = config.phmdoctest_stream_threshold
+    work: List[Work] = []
+    for path in find_markdown_files(config):
+        try:
+            kwargs = settings.collect_kwargs(config, path)
+        except ValueError:
+            continue  # Outside the invocation directory.
+        if kwargs is None:
+            continue
+        if config.phmdoctest_changed is not None:
+            if not config.phmdoctest_changed.is_changed(path):
+                continue
+        if not fences.may_have_python(path):
+            continue
+        key = None
+        if generated_cache is not None:
+            streamed = generate.use_streaming(path, threshold)
+            key_kwargs = cache.key_kwargs(kwargs, streamed)
+            key = generated_cache.key_from_file(path, key_kwargs)
+            if generated_cache.contains(key):
+                continue
+        work.append(Work(path, kwargs, key))
+    return work
+
+
+def run(
+    work: List[Work], jobs: int, stream_threshold: Optional[int]
+) -> Dict[Path, generate.Generated]:
+    """Generate the test files using jobs worker processes.
+
+    When jobs is 1 generate in this process.
+    If generating a file raises an exception it is left out so that
+    the exception is raised again when the file is collected.
+    """
+    results: Dict[Path, generate.Generated] = {}
+    if not work:
+        return results
+    if jobs == 1:
+        for item in work:
+            try:
+                results[item.path] = generate.generate_file(
+                    item.path, item.kwargs, stream_threshold
+                )
+            except Exception:
+                pass
+        return results
+    with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as executor:
+        futures = {
+            item.path: executor.submit(
+                generate.generate_file, item.path, item.kwargs, stream_threshold
+            )
+            for item in work
+        }
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception:
+                pass
+    return results
+
+
+def pregenerate(config, jobs: int) -> Dict[Path, generate.Generated]:
+    """Generate test files for Markdown files using jobs worker processes."""
+    return run(find_work(config), jobs, config.phmdoctest_stream_threshold)
+
+
+def fill_cache(config, jobs: int) -> int:
+    """Generate test files using jobs worker processes and save them in the cache.
+
+    Return the number of files generated.
+    """
+    generated_cache: cache.GeneratedCache = config.phmdoctest_cache
+    work = find_work(config)
+    results = run(work, jobs, config.phmdoctest_stream_threshold)
+    for item in work:
+        generated = results.get(item.path)
+        if generated is not None and item.key is not None:
+            generated_cache.set(item.key, cache.make_entry(generated))
+    return len(results)
@@ -0,0 +1,37 @@
+"""Import heavy modules listed in the phmdoctest-preimport ini option.
+
+Otherwise the first example to import a heavy module is charged the time.
+"""
+import importlib
+import time
+from typing import List
+from typing import Tuple
+
+import pytest
+
+
+def preimport(names: List[str]) -> List[Tuple[str, float]]:
+    """Import the modules. Return each name and the seconds its import took."""
+    timings = []
+    for name in names:
+        start = time.perf_counter()
+        try:
+            _ = importlib.import_module(name)
+        except ImportError as exc:
+            raise pytest.UsageError(
+                "pytest-phmdoctest plugin usage error. "
+                f"phmdoctest-preimport can't import {name}. {exc}"
+            )
+        timings.append((name, time.perf_counter() - start))
+    return timings
+
+
+def configure(config) -> List[Tuple[str, float]]:
+    """Import the phmdoctest-preimport modules. Return the import times."""
+    return preimport(config.getini("phmdoctest-preimport"))
+
+
+def report_header(timings: List[Tuple[str, float]]) -> str:
+    """Return the pytest header line that shows the import times."""
+    shown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings)
+    return f"phmdoctest preimport: {shown}"
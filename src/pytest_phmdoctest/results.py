@@ -0,0 +1,159 @@
+"""Skip Markdown test cases that passed before and have not changed."""
+import hashlib
+import inspect
+import os
+from pathlib import Path
+import sys
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import pytest
+
+from . import distributed
+from . import generate
+
+
+RESULTS_KEY = "results"
+"""pytest cache key of the result keys of test cases that passed."""
+
+SKIP_REASON = "phmdoctest cached pass"
+
+
+def environment_fingerprint() -> str:
+    """Describe the interpreter and the installed distributions."""
+    distributions = set()
+    for entry in sys.path:
+        try:
+            names = os.listdir(entry or ".")
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith((".dist-info", ".egg-info")):
+                distributions.add(name)
+    return "\n".join([sys.version] + sorted(distributions))
+
+
+def example_source(item: pytest.Item) -> Optional[str]:
+    """Return the generated source of a test case or None if not found."""
+    dtest = getattr(item, "dtest", None)
+    if dtest is not None:
+        return f"{dtest.name}\n{dtest.docstring}"
+    obj = getattr(item, "obj", None)
+    if obj is None:
+        return None
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return None
+
+
+class ResultCache:
+    """Remember test cases that passed and skip them while nothing changed.
+
+    A test case's result key is a hash of its generated source, which holds
+    the example and expected output, the context of its Markdown file, and
+    an environment fingerprint. The context covers the setup and teardown
+    blocks and the phmdoctest-collect settings.
+    When examples in a Markdown file share names all of its test cases
+    run unless every one of them has a cached pass.
+    """
+
+    def __init__(self, config) -> None:
+        self.config = config
+        self.passed: Dict[str, str] = config.phmdoctest_state.get_json(RESULTS_KEY, {})
+        self.new: Dict[str, Optional[str]] = {}
+        self.keys: Dict[str, str] = {}
+        self.environment = environment_fingerprint()
+        self.skipped = 0
+
+    def result_key(self, item: pytest.Item, context: generate.Context) -> Optional[str]:
+        """Return the result key for the test case or None if it can't be made."""
+        source = example_source(item)
+        if source is None:
+            return None
+        digest = hashlib.sha256()
+        for part in (self.environment, context.digest, item.nodeid, source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def pytest_collection_modifyitems(self, session, config, items) -> None:
+        """pytest hook. Mark the test cases with a cached pass to be skipped."""
+        outfiles: Dict[Path, Path] = config.phmdoctest_outfiles
+        contexts: Dict[Path, generate.Context] = config.phmdoctest_contexts
+        groups: Dict[Path, List[pytest.Item]] = {}
+        for item in items:
+            markdown_path = outfiles.get(Path(str(item.fspath)))
+            if markdown_path is None or markdown_path not in contexts:
+                continue
+            key = self.result_key(item, contexts[markdown_path])
+            if key is None:
+                continue
+            self.keys[item.nodeid] = key
+            groups.setdefault(markdown_path, []).append(item)
+        for markdown_path, group in groups.items():
+            cached = [
+                item
+                for item in group
+                if self.passed.get(item.nodeid) == self.keys[item.nodeid]
+            ]
+            if contexts[markdown_path].shares_names and len(cached) < len(group):
+                continue  # Run them all.
+            for item in cached:
+                item.add_marker(pytest.mark.skip(reason=SKIP_REASON))
+                self.skipped += 1
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call) -> Any:
+        """pytest hook. Put the result key in the report.
+
+        The report carries it to the pytest-xdist controller.
+        """
+        outcome = yield
+        self.add_to_report(item, outcome.get_result())
+
+    def add_to_report(self, item: pytest.Item, report: Any) -> None:
+        """Put the test case's result key in the report."""
+        key = self.keys.get(item.nodeid)
+        if key is not None:
+            report.phmdoctest_result_key = key
+
+    def pytest_runtest_logreport(self, report) -> None:
+        """pytest hook. Remember a pass. Forget a test case that failed."""
+        if report.failed:
+            self.new[report.nodeid] = None
+        elif report.when == "call" and report.passed:
+            key = getattr(report, "phmdoctest_result_key", None)
+            if key is not None:
+                self.new[report.nodeid] = key
+
+    def pytest_sessionfinish(self, session) -> None:
+        """pytest hook. Save the passes in the pytest cache.
+
+        With pytest-xdist the controller saves them.
+        """
+        if not self.new or distributed.is_worker(self.config):
+            return
+        passed = dict(self.passed)
+        for nodeid, key in self.new.items():
+            if key is None:
+                _ = passed.pop(nodeid, None)
+            else:
+                passed[nodeid] = key
+        self.config.phmdoctest_state.set_json(RESULTS_KEY, passed)
+
+
+def configure(config) -> Optional[ResultCache]:
+    """Register the result cache plugin for --phmdoctest-cache-results."""
+    if not config.option.phmdoctest_cache_results:
+        return None
+    if config.phmdoctest_state is None:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            "--phmdoctest-cache-results needs the pytest cache."
+        )
+    result_cache = ResultCache(config)
+    config.pluginmanager.register(result_cache, "phmdoctest-results")
+    return result_cache
@@ -1,13 +1,20 @@
 """Parse and implement pytest registered ini-file options."""
 from argparse import ArgumentParser
+from argparse import SUPPRESS
+import os
 from pathlib import Path
+from pathlib import PurePosixPath
 import re
 import textwrap
+from typing import Any
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Pattern
 from typing import Union
 
+import pytest
+
 
 def error_file(built_from: str, message: str) -> str:
     """Return string containing test file. Test fails, prints message to stdout."""
@@ -79,6 +86,9 @@ def make_collect_parser() -> NoExitArgParser:
         "--teardown", "-d", default=None, action="store", metavar="TEXT"
     )
     parser.add_argument("--setup-doctest", default=None, action="store_true")
+    # The following options are used by the plugin.
+    # SUPPRESS leaves them out of the keyword arguments when not given.
+    parser.add_argument("--concurrent", default=SUPPRESS, action="store_true")
     return parser
 
 
@@ -138,6 +148,139 @@ def parse_collect_line(parser: NoExitArgParser, line: str) -> ArgDict:
     return vars(args_namespace)
 
 
+def translate_segment(segment: str) -> str:
+    """Return regular expression for one path component of a Path.glob() pattern.
+
+    Same wildcards as the fnmatch module except they never match a "/".
+    """
+    pieces = []
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "*":
+            pieces.append("[^/]*")
+        elif c == "?":
+            pieces.append("[^/]")
+        elif c == "[":
+            # Look for the end of the character set like fnmatch.translate().
+            j = i
+            if j < n and segment[j] == "!":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                pieces.append("\\[")
+            else:
+                chars = segment[i:j].replace("\\", "\\\\")
+                i = j + 1
+                negate = chars.startswith("!")
+                if negate:
+                    chars = chars[1:]
+                # Escape characters that could look like a nested set
+                # or set operation to the re module.
+                chars = re.sub(r"([\[&~|^])", r"\\\1", chars)
+                if negate:
+                    chars = "^/" + chars
+                pieces.append("[" + chars + "]")
+        else:
+            pieces.append(re.escape(c))
+    return "".join(pieces)
+
+
+def translate_glob(glob: str) -> str:
+    """Return regular expression matching the relative paths that Path.glob() finds.
+
+    The expression is matched against a relative path with "/" separators.
+    A "**" component matches zero or more directories.
+    A pattern ending with "**" only finds directories so it never matches.
+    An absolute pattern is not supported by Path.glob() and never matches.
+    """
+    parts = PurePosixPath(glob).parts
+    if not parts or parts[0] == "/" or parts[-1] == "**":
+        return "(?!)"
+    pieces = []
+    for part in parts[:-1]:
+        if part == "**":
+            pieces.append("(?:[^/]+/)*")
+        else:
+            pieces.append(translate_segment(part) + "/")
+    pieces.append(translate_segment(parts[-1]))
+    return "".join(pieces)
+
+
+def translate_directory_glob(glob: str) -> str:
+    """Return regular expression matching directories that may contain a match.
+
+    The expression is matched against "/" followed by the relative path
+    of the directory. It matches if some path below the directory
+    could match the glob.
+    """
+    parts = PurePosixPath(glob).parts
+    if not parts or parts[0] == "/" or parts[-1] == "**":
+        return "(?!)"
+    expression = ""
+    # Work from the end. The file name component is never a directory.
+    for part in reversed(parts[:-1]):
+        if part == "**":
+            # Any directory below may contain a match.
+            expression = "(?:/.*)?"
+        else:
+            expression = "(?:/" + translate_segment(part) + expression + ")?"
+    return expression
+
+
+def compile_flags() -> int:
+    """Return re module flags for matching paths."""
+    flags = re.DOTALL
+    if os.path.normcase("A") == "a":
+        flags |= re.IGNORECASE  # Path.glob() is not case sensitive on Windows.
+    return flags
+
+
+def compile_globs(args: List[ArgDict]) -> Pattern[str]:
+    """Combine the globs of the phmdoctest-collect lines into one expression.
+
+    Each line becomes an alternative in a named group gN where N
+    is the index of the line. The alternatives are tried in file order
+    so the name of the matching group identifies the first matching line.
+    A line with a parse error matches any path.
+    """
+    alternatives = []
+    for index, argdict in enumerate(args):
+        if "ini-error" in argdict:
+            expression = ".*"
+        else:
+            expression = translate_glob(str(argdict["file_glob"]))
+        alternatives.append("(?P<g{}>{})".format(index, expression))
+    return re.compile("|".join(alternatives), compile_flags())
+
+
+def compile_directory_globs(args: List[ArgDict]) -> Pattern[str]:
+    """Combine into one expression the directories that may contain a glob match.
+
+    A line with a parse error matches any directory.
+    """
+    alternatives = []
+    for argdict in args:
+        if "ini-error" in argdict:
+            alternatives.append(".*")
+        else:
+            alternatives.append(translate_directory_glob(str(argdict["file_glob"])))
+    return re.compile("|".join(alternatives), compile_flags())
+
+
+def compile_ignore_globs(globs: List[str]) -> Optional[Pattern[str]]:
+    """Combine the phmdoctest-ignore globs into one expression or None."""
+    if not globs:
+        return None
+    alternatives = [translate_glob(glob) for glob in globs]
+    return re.compile("|".join(alternatives), compile_flags())
+
+
 class FileSettings:
     """Check if path is selected by a configuration setting.
 
@@ -183,6 +326,9 @@ class FileSettings:
         Caution: The globals are set at pytest Session scope and are visible
         to all tests in the test suite run by the plugin and regular
         python test files run by --doctest-modules.
+    --concurrent
+        The Markdown file is safe to run in a thread at the same time
+        as other Markdown files. Used by the plugin, not phmdoctest.
 
     Use modified Python ArgumentParser to process the line.
     Create a keyword args dict to pass to phmdoctest.main.testfile().
@@ -204,6 +350,16 @@ class FileSettings:
             parser = make_collect_parser()
             for line in self.section:
                 self.args.append(parse_collect_line(parser, line))
+        self.matcher = compile_globs(self.args)
+        self.directory_matcher = compile_directory_globs(self.args)
+        self.ignore_matcher = compile_ignore_globs(config.getini("phmdoctest-ignore"))
+        self.prune = bool(config.getini("phmdoctest-prune"))
+        # Index of the first line with a parse error. It is the result for
+        # paths outside of the invocation directory.
+        self.first_error = next(
+            (i for i, argdict in enumerate(self.args) if "ini-error" in argdict),
+            None,
+        )
 
     def exists(self) -> bool:
         """True if we found settings in a config file or ini file section."""
@@ -219,14 +375,104 @@ class FileSettings:
         time. It remains silent until the line's file_glob is needed by
         pytest_collect_file(). The error text is saved in the
         ArgDict with key "ini-error".
+
+        The globs were compiled by __init__() so the file system is not
+        searched here.
         """
-        for argdict in self.args:
-            if "ini-error" in argdict:
-                return argdict
-
-            glob: str = argdict["file_glob"]
-            if collect_path in self.invoke_path.glob(glob):
-                kwargs = argdict.copy()
-                kwargs.pop("file_glob")
-                return kwargs
+        try:
+            relative_path = collect_path.relative_to(self.invoke_path)
+        except ValueError:
+            # Path.glob() never finds a file outside the invocation directory.
+            if self.first_error is not None:
+                return self.args[self.first_error]
+            return None
+        match = self.matcher.fullmatch(relative_path.as_posix())
+        if match is None:
+            return None
+        argdict = self.args[int(str(match.lastgroup)[1:])]
+        if "ini-error" in argdict:
+            return argdict
+        kwargs = argdict.copy()
+        kwargs.pop("file_glob")
+        return kwargs
+
+    def collect_line(self, collect_path: Path) -> str:
+        """Return the phmdoctest-collect line whose glob matches collect_path.
+
+        Return the empty string if there is none.
+        """
+        try:
+            relative_path = collect_path.relative_to(self.invoke_path)
+        except ValueError:
+            return ""
+        match = self.matcher.fullmatch(relative_path.as_posix())
+        if match is None:
+            return ""
+        return str(self.section[int(str(match.lastgroup)[1:])]).strip()
+
+    def is_ignored(self, path: Path) -> bool:
+        """True if path matches a glob in the phmdoctest-ignore section."""
+        if self.ignore_matcher is None:
+            return False
+        try:
+            relative_path = path.relative_to(self.invoke_path)
+        except ValueError:
+            return False
+        return self.ignore_matcher.fullmatch(relative_path.as_posix()) is not None
+
+    def may_contain_match(self, directory: Path) -> bool:
+        """False if no file below directory can match a phmdoctest-collect glob."""
+        if not self.exists():
+            return True
+        try:
+            relative_path = directory.relative_to(self.invoke_path)
+        except ValueError:
+            return True
+        if not relative_path.parts:
+            return True
+        dirname = "/" + relative_path.as_posix()
+        return self.directory_matcher.fullmatch(dirname) is not None
+
+
+def collect_kwargs(config, collect_path: Path) -> Optional[Dict[str, Any]]:
+    """Return the phmdoctest keyword arguments for a Markdown file.
+
+    Return None if the file should not be collected.
+    Raises ValueError if collect_path is not in the invocation directory.
+    """
+    # If the ini file has a phmdoctest-collect section then
+    # generate a test file if and only if the Markdown file matches a
+    # glob in the section.
+    # User may add options to the section.
+    file_settings: FileSettings = config.phmdoctest_file_settings
+    if file_settings.exists():
+        argdict = file_settings.match_glob(collect_path)
+        if argdict is None:
+            return None
+        kwargs: Dict[str, Any] = dict(argdict)
+    else:
+        kwargs = {}  # use defaults.
+    kwargs["markdown_file"] = collect_path
+    invoke_path = Path(config.invocation_params.dir)
+    relative_path = collect_path.relative_to(invoke_path)
+    kwargs["built_from"] = relative_path.as_posix()
+    if config.getini("phmdoctest-stable-ids"):
+        kwargs["stable_ids"] = True
+    return kwargs
+
+
+def ini_number(config, name: str, description: str) -> Optional[int]:
+    """Return the value of a whole number ini option or None if not set."""
+    value = config.getini(name).strip()
+    if not value:
         return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise pytest.UsageError(
+            "pytest-phmdoctest plugin usage error. "
+            f"{name} must be {description}, got {value!r}."
+        )
+    return number
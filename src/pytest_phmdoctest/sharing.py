@@ -0,0 +1,292 @@
+"""Dependency graph of the examples from the names each one defines and uses.
+
+Names flow between the generated test functions only through the setup
+block's module globals and the names shared by the share-names
+directive. An example depends on an earlier one if either writes a
+shared name the other refers to. Examples in different connected
+components of the graph can run in separate processes.
+
+Imported modules are shared through sys.modules whatever name an
+example gives them. An example that calls or changes something it
+imported, or the setup block imported, is treated as doing I/O.
+"""
+import ast
+import builtins
+import doctest
+from typing import AbstractSet
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from phmdoctest.fenced import FencedBlock
+from phmdoctest.fenced import Role
+
+
+Groups = Tuple[Tuple[str, ...], ...]
+"""Test function names of the examples in each group in Markdown order."""
+
+IO_MODULES = frozenset(
+    [
+        "asyncio",
+        "builtins",
+        "ctypes",
+        "glob",
+        "importlib",
+        "io",
+        "multiprocessing",
+        "os",
+        "pathlib",
+        "shelve",
+        "shutil",
+        "signal",
+        "socket",
+        "sqlite3",
+        "subprocess",
+        "sys",
+        "tempfile",
+        "threading",
+        "urllib",
+    ]
+)
+"""Modules whose use the analysis can't see through."""
+
+IO_BUILTINS = frozenset(
+    ["__import__", "compile", "eval", "exec", "globals", "input", "open", "vars"]
+)
+"""Built-in functions whose use the analysis can't see through."""
+
+PURE_BUILTINS = frozenset(
+    [
+        "abs",
+        "all",
+        "any",
+        "bool",
+        "dict",
+        "enumerate",
+        "float",
+        "format",
+        "frozenset",
+        "hash",
+        "id",
+        "int",
+        "isinstance",
+        "len",
+        "list",
+        "max",
+        "min",
+        "print",
+        "range",
+        "repr",
+        "round",
+        "set",
+        "sorted",
+        "str",
+        "sum",
+        "tuple",
+        "type",
+        "zip",
+    ]
+)
+"""Built-in functions that don't change their arguments."""
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+
+class Names(NamedTuple):
+    """Shared names an example refers to and may change."""
+
+    refs: Set[str]
+    writes: Set[str]
+    io: bool  # True if it does I/O or changes state the analysis can't see
+    imports: Set[str]  # names bound by import statements
+
+
+class Node(NamedTuple):
+    """An example in the dependency graph."""
+
+    test_name: str
+    line: int
+    after: Tuple[int, ...]  # lines of the earlier examples it depends on
+    io: bool  # runs in order with the other io examples
+
+
+Graph = Tuple[Node, ...]
+"""Examples of a Markdown file in Markdown order."""
+
+
+def python_source(block: FencedBlock) -> str:
+    """Return the Python code of a code block or a session's examples."""
+    if block.role == Role.SESSION:
+        examples = doctest.DocTestParser().get_examples(block.contents)
+        return "".join(example.source for example in examples)
+    return block.contents
+
+
+def root_name(node: ast.AST) -> Optional[str]:
+    """Return the name at the start of an expression like a.b[1].c()."""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def analyze(source: str, modules: AbstractSet[str] = frozenset()) -> Names:
+    """Return the names the Python source refers to and may change.
+
+    A name may change when it is assigned, deleted, imported, has an
+    attribute or item assigned, has a method called, or is passed to
+    a function. Calling or changing a name bound by an import here
+    or in modules counts as I/O. Raises SyntaxError.
+    """
+    refs: Set[str] = set()
+    writes: Set[str] = set()
+    imports: Set[str] = set()
+    mutated: Set[str] = set()  # may change without being bound
+    called: Set[str] = set()
+    io = False
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Name):
+            refs.add(node.id)
+            if not isinstance(node.ctx, ast.Load):
+                writes.add(node.id)
+            io = io or node.id in IO_BUILTINS
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            refs.add(node.name)
+            writes.add(node.name)
+        elif isinstance(node, ast.alias):
+            name = (node.asname or node.name).split(".")[0]
+            refs.add(name)
+            writes.add(name)
+            imports.add(name)
+            io = io or node.name.split(".")[0] in IO_MODULES
+        elif isinstance(node, ast.ImportFrom):
+            io = io or (node.module or "").split(".")[0] in IO_MODULES
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            refs.update(node.names)
+            writes.update(node.names)
+        elif isinstance(node, (ast.Attribute, ast.Subscript)):
+            if not isinstance(node.ctx, ast.Load):
+                mutated.add(root_name(node) or "")
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute):
+                mutated.add(root_name(node.func) or "")
+            else:
+                called.add(root_name(node.func) or "")
+            if not (isinstance(node.func, ast.Name) and node.func.id in PURE_BUILTINS):
+                arguments = node.args + [keyword.value for keyword in node.keywords]
+                mutated.update(root_name(argument) or "" for argument in arguments)
+    io = io or bool(refs & IO_MODULES)
+    # Module state like random.seed() is shared through sys.modules.
+    io = io or bool((mutated | called) & (imports | modules))
+    writes.update(mutated)
+    writes.discard("")
+    return Names(
+        refs=refs - BUILTIN_NAMES,
+        writes=writes - BUILTIN_NAMES,
+        io=io,
+        imports=imports,
+    )
+
+
+def dependency_graph(blocks: List[FencedBlock], test_names: Dict[int, str]) -> Graph:
+    """Return the examples and the earlier examples each one depends on.
+
+    test_names maps the block line to its generated test function name.
+    Python interactive sessions run in order. So do examples that
+    do I/O. An example that doesn't parse depends on every other.
+    """
+    examples = [b for b in blocks if b.role in (Role.CODE, Role.SESSION)]
+    setup = [b for b in blocks if b.role == Role.SETUP]
+    shared: Optional[Set[str]] = set()
+    modules: Set[str] = set()  # shared names bound by import statements
+    if setup:
+        try:
+            setup_names = analyze(setup[0].contents)
+            shared = setup_names.writes
+            modules.update(setup_names.imports)
+        except SyntaxError:
+            shared = None  # unknown
+    analyzed: List[Optional[Names]] = []
+    for block in examples:
+        try:
+            names = analyze(python_source(block), modules)
+        except SyntaxError:
+            names = None
+        if shared is not None and names is not None and block.has_names_directive():
+            shared.update(names.writes)
+            modules.update(names.imports)
+        analyzed.append(names)
+    nodes = []
+    for j, block in enumerate(examples):
+        after = tuple(
+            examples[i].line
+            for i in range(j)
+            if depends(analyzed[i], analyzed[j], shared)
+            or (examples[i].role == block.role == Role.SESSION)
+        )
+        names = analyzed[j]
+        nodes.append(
+            Node(
+                test_name=test_names[block.line],
+                line=block.line,
+                after=after,
+                io=names is None or names.io,
+            )
+        )
+    return tuple(nodes)
+
+
+def depends(
+    earlier: Optional[Names], later: Optional[Names], shared: Optional[Set[str]]
+) -> bool:
+    """True if the later example must run after the earlier one."""
+    if earlier is None or later is None or shared is None:
+        return True
+    if earlier.io and later.io:
+        return True
+    return bool(
+        (earlier.writes & later.refs & shared) or (later.writes & earlier.refs & shared)
+    )
+
+
+def group_examples(graph: Graph) -> Groups:
+    """Return the connected components of the dependency graph.
+
+    The examples in different groups may run in separate processes.
+    Return an empty tuple when everything must run together.
+    """
+    if len(graph) < 2:
+        return ()
+    # Union find over the examples.
+    parent = {node.line: node.line for node in graph}
+
+    def find(line: int) -> int:
+        while parent[line] != line:
+            parent[line] = parent[parent[line]]
+            line = parent[line]
+        return line
+
+    for node in graph:
+        for line in node.after:
+            parent[find(node.line)] = find(line)
+    groups: Dict[int, List[str]] = {}
+    for node in graph:
+        groups.setdefault(find(node.line), []).append(node.test_name)
+    if len(groups) < 2:
+        return ()
+    return tuple(tuple(names) for names in groups.values())
+
+
+def format_graph(graph: Graph) -> List[str]:
+    """Return a line for each example naming the examples it runs after."""
+    lines = []
+    for node in graph:
+        line = f"  line {node.line} {node.test_name}"
+        if node.after:
+            line += " after " + ", ".join(str(after) for after in node.after)
+        if node.io:
+            line += " [io]"
+        lines.append(line)
+    return lines
@@ -0,0 +1,291 @@
+"""Where generated test files are kept and how pytest imports them."""
+import abc
+import hashlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import linecache
+import os
+from pathlib import Path
+import shutil
+import sys
+from tempfile import TemporaryDirectory
+import time
+from types import ModuleType
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Union
+
+from pytest import Collector
+from pytest import Module
+
+from . import collectors
+
+
+TEMPDIR = "tempdir"
+MEMORY = "memory"
+CACHE = "cache"
+MODULES_CHOICES = [TEMPDIR, MEMORY, CACHE]
+"""Values of the --phmdoctest-modules option."""
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """Write then rename so other processes never see a partial file."""
+    partial = path.with_name(path.name + f".{os.getpid()}.tmp")
+    _ = partial.write_text(text, encoding="utf-8")
+    os.replace(partial, path)
+
+
+class TempDirStore:
+    """Write generated test files to a temporary directory.
+
+    pytest imports them from there. The directory is created when
+    the first file is saved and removed by close().
+    """
+
+    def __init__(self) -> None:
+        self.temporary_dir: Optional[TemporaryDirectory] = None
+
+    def path(self, collect_path: Path, name: str) -> Path:
+        """Return the path pytest collects for the Markdown file."""
+        if self.temporary_dir is None:
+            self.temporary_dir = TemporaryDirectory()
+        return Path(self.temporary_dir.name) / (name + ".py")
+
+    def save(self, path: Path, test_file: str) -> None:
+        """Save the generated test file."""
+        _ = path.write_text(test_file, encoding="utf-8")
+
+    def read(self, path: Path) -> str:
+        """Return the generated test file saved at path."""
+        return path.read_text(encoding="utf-8")
+
+    def module(self, parent: Collector, path: Path) -> Module:
+        """Create Module collector for the test file at path."""
+        return collectors.module(parent, path)
+
+    def doctest_module(
+        self, parent: Collector, path: Path
+    ) -> Optional["collectors.DoctestModule"]:
+        """Create DoctestModule collector for the test file at path."""
+        return collectors.doctest_module(parent, path)
+
+    def close(self) -> None:
+        """Remove the temporary directory."""
+        if self.temporary_dir is not None:
+            self.temporary_dir.cleanup()
+            self.temporary_dir = None
+
+
+class GeneratedLoader(importlib.abc.Loader):
+    """Import loader that executes a generated test file held in a string."""
+
+    def __init__(self, source: str, filename: str) -> None:
+        self.source = source
+        self.filename = filename
+
+    def create_module(self, spec: Any) -> None:
+        """Use the default module creation."""
+        return None
+
+    def exec_module(self, module: ModuleType) -> None:
+        """Execute the generated source in the module's namespace."""
+        code = compile(self.source, self.filename, "exec", dont_inherit=True)
+        exec(code, module.__dict__)
+
+    def get_source(self, fullname: str) -> str:
+        """Return the generated source. Used by linecache and doctest."""
+        return self.source
+
+
+class LoaderStore(abc.ABC):
+    """Base class for stores that import generated test files themselves.
+
+    The collectors and modules use the Markdown file path so
+    nodeids name the Markdown file. Subclasses implement spec().
+    """
+
+    def __init__(self) -> None:
+        self.names: Dict[Path, str] = {}
+        self.sources: Dict[Path, str] = {}
+        self.modules: Dict[Path, ModuleType] = {}
+
+    def path(self, collect_path: Path, name: str) -> Path:
+        """Return the path pytest collects for the Markdown file."""
+        self.names[collect_path] = name
+        return collect_path
+
+    def save(self, path: Path, test_file: str) -> None:
+        """Save the generated test file."""
+        self.sources[path] = test_file
+        _ = self.modules.pop(path, None)
+
+    def read(self, path: Path) -> str:
+        """Return the generated test file saved for path."""
+        return self.sources[path]
+
+    def load(self, path: Path) -> ModuleType:
+        """Return the module for the generated test file. Import it once."""
+        module = self.modules.get(path)
+        if module is not None:
+            return module
+        spec = self.spec(path)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[spec.name]
+            raise
+        self.modules[path] = module
+        return module
+
+    @abc.abstractmethod
+    def spec(self, path: Path) -> Optional[importlib.machinery.ModuleSpec]:
+        """Return the import spec for the generated test file."""
+
+    def module(self, parent: Collector, path: Path) -> Module:
+        """Create Module collector for the generated test file."""
+        return collectors.store_module(parent, path, self)
+
+    def doctest_module(
+        self, parent: Collector, path: Path
+    ) -> Optional["collectors.DoctestModule"]:
+        """Create DoctestModule collector for the generated test file."""
+        return collectors.store_doctest_module(parent, path, self)
+
+    def close(self) -> None:
+        """Forget the generated test files."""
+        self.names.clear()
+        self.sources.clear()
+        self.modules.clear()
+
+
+class MemoryStore(LoaderStore):
+    """Keep generated test files in memory and import them with a loader.
+
+    Tracebacks name the Markdown file.
+    The line numbers are line numbers in the generated test file.
+    """
+
+    def spec(self, path: Path) -> Optional[importlib.machinery.ModuleSpec]:
+        """Return the import spec for the generated test file.
+
+        The source is put in linecache under the Markdown file name
+        so that tracebacks and doctest show the generated lines.
+        """
+        filename = str(path)
+        source = self.sources[path]
+        linecache.cache[filename] = (
+            len(source),
+            None,  # Tells linecache.checkcache() to keep the entry.
+            source.splitlines(keepends=True),
+            filename,
+        )
+        loader = GeneratedLoader(source, filename)
+        spec = importlib.util.spec_from_loader(
+            self.names[path], loader, origin=filename
+        )
+        assert spec is not None
+        spec.has_location = True
+        return spec
+
+    def close(self) -> None:
+        """Forget the generated test files."""
+        for path in self.sources:
+            _ = linecache.cache.pop(str(path), None)
+        super().close()
+
+
+def assertion_rewrite_hook() -> Any:
+    """Return pytest's assertion rewriting import hook or None.
+
+    The hook is not installed when pytest is run with --assert=plain.
+    AssertionRewritingHook is not part of the pytest API.
+    """
+    try:
+        from _pytest.assertion.rewrite import AssertionRewritingHook
+    except ImportError:
+        return None
+    for finder in sys.meta_path:
+        if isinstance(finder, AssertionRewritingHook):
+            return finder
+    return None
+
+
+class CacheStore(LoaderStore):
+    """Write generated test files to the pytest cache and import them from there.
+
+    Each file is saved in a directory named by a hash of its contents
+    so it is only written when the Markdown file or settings change.
+    Python reuses the bytecode in __pycache__ next to an unchanged file.
+    Directories not used for MAX_AGE_DAYS are removed by close().
+    """
+
+    MAX_AGE_DAYS = 7
+
+    def __init__(self, directory: Path) -> None:
+        super().__init__()
+        self.directory = directory / "modules"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.files: Dict[Path, Path] = {}
+
+    def save(self, path: Path, test_file: str) -> None:
+        """Save the generated test file unless the same one is already saved."""
+        super().save(path, test_file)
+        name = self.names[path]
+        digest = hashlib.sha256((name + "\0" + test_file).encode("utf-8"))
+        entry = self.directory / digest.hexdigest()
+        file = entry / (name + ".py")
+        if not file.exists():
+            entry.mkdir(exist_ok=True)
+            write_atomic(file, test_file)
+        else:
+            os.utime(entry)  # Mark the entry as recently used.
+        self.files[path] = file
+
+    def spec(self, path: Path) -> Optional[importlib.machinery.ModuleSpec]:
+        """Return the import spec for the generated test file in the cache.
+
+        Use pytest's assertion rewriting import hook if it is installed.
+        It saves the rewritten bytecode in __pycache__ too.
+        """
+        name = self.names[path]
+        file = self.files[path]
+        hook = assertion_rewrite_hook()
+        if hook is not None:
+            hook.mark_rewrite(name)
+            spec = hook.find_spec(name, [str(file.parent)])
+            if spec is not None:
+                return spec  # type: ignore
+        return importlib.util.spec_from_file_location(name, str(file))
+
+    def close(self) -> None:
+        """Remove entries not used recently. Forget the generated test files."""
+        oldest = time.time() - self.MAX_AGE_DAYS * 24 * 60 * 60
+        for entry in self.directory.iterdir():
+            try:
+                if entry.stat().st_mtime < oldest:
+                    shutil.rmtree(entry, ignore_errors=True)
+            except OSError:
+                pass  # Removed by another process.
+        self.files.clear()
+        super().close()
+
+
+Store = Union[TempDirStore, MemoryStore, CacheStore]
+"""Keeps generated test files for the --phmdoctest and --phmdoctest-docmod modes."""
+
+
+def make_store(modules: str, cache_dir: Optional[Path]) -> Store:
+    """Create the store selected by the --phmdoctest-modules option.
+
+    Use the temporary directory for cache if the pytest cache is not available.
+    """
+    if modules == MEMORY:
+        return MemoryStore()
+    if modules == CACHE and cache_dir is not None:
+        return CacheStore(cache_dir)
+    return TempDirStore()
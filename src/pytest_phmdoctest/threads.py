@@ -0,0 +1,207 @@
+"""Run the Markdown files marked --concurrent in a pool of threads.
+
+Each file's test cases run in order in one thread. The files run at the
+same time. print() writes to a buffer for the running thread so the
+expected output comparison still works. The reports are logged after
+all the threads finish, in the order pytest collected the test cases.
+
+Only test functions whose one fixture is capsys run in a thread. They
+are called directly, so pytest's runtest setup, call, and teardown hooks
+don't run for them. Python interactive sessions and examples that use
+the setup and teardown blocks run as usual.
+
+With --phmdoctest-changed=deps the files run one at a time as usual.
+The recorder of the project files used is process wide so it can't
+tell which thread's test case used a file.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import io
+from pathlib import Path
+import sys
+import threading
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+
+import pytest
+
+from . import settings
+
+
+ALLOWED_FIXTURES = frozenset(["capsys", "request"])
+"""Fixtures the thread pool can provide."""
+
+
+class Captured(NamedTuple):
+    """Same fields as the result of capsys.readouterr()."""
+
+    out: str
+    err: str
+
+
+class ThreadStream:
+    """Writes go to the running thread's buffer or the wrapped stream."""
+
+    def __init__(self, stream: Any, local: threading.local, name: str) -> None:
+        self.stream = stream
+        self.local = local
+        self.name = name
+
+    def write(self, text: str) -> int:
+        """Write text to the thread's buffer if it has one."""
+        buffer = getattr(self.local, self.name, None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self) -> None:
+        """Flush the wrapped stream."""
+        if getattr(self.local, self.name, None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.stream, name)
+
+
+class ThreadCapture:
+    """Stands in for the capsys fixture in a thread."""
+
+    def __init__(self, local: threading.local) -> None:
+        self.local = local
+
+    def __enter__(self) -> "ThreadCapture":
+        self.local.stdout = io.StringIO()
+        self.local.stderr = io.StringIO()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.local.stdout = None
+        self.local.stderr = None
+
+    def readouterr(self) -> Captured:
+        """Return and reset the text written so far."""
+        captured = Captured(
+            out=self.local.stdout.getvalue(), err=self.local.stderr.getvalue()
+        )
+        self.local.stdout = io.StringIO()
+        self.local.stderr = io.StringIO()
+        return captured
+
+
+class Called(NamedTuple):
+    """Results of calling a test function in a thread."""
+
+    setup: pytest.CallInfo
+    call: pytest.CallInfo
+    teardown: pytest.CallInfo
+    output: Captured  # what the test function didn't read with capsys
+
+
+def can_run(item: pytest.Item) -> bool:
+    """True if the test case can be called directly in a thread."""
+    return (
+        isinstance(item, pytest.Function)
+        and set(item.fixturenames) <= ALLOWED_FIXTURES
+        and not list(item.iter_markers())
+    )
+
+
+def call_function(item: pytest.Function, local: threading.local) -> Called:
+    """Call the test function with the running thread's capture."""
+    with ThreadCapture(local) as capture:
+        setup = pytest.CallInfo.from_call(lambda: None, when="setup")
+        if "capsys" in item.fixturenames:
+            call = pytest.CallInfo.from_call(
+                lambda: item.obj(capsys=capture), when="call"
+            )
+        else:
+            call = pytest.CallInfo.from_call(lambda: item.obj(), when="call")
+        output = capture.readouterr()
+        teardown = pytest.CallInfo.from_call(lambda: None, when="teardown")
+    return Called(setup=setup, call=call, teardown=teardown, output=output)
+
+
+class ThreadRunner:
+    """pytest plugin that runs the --concurrent Markdown files in threads."""
+
+    def __init__(self, config, threads: Optional[int]) -> None:
+        self.config = config
+        self.threads = threads
+        self.files: Dict[Path, List[pytest.Function]] = {}
+        self.nodeids: Set[str] = set()
+        self.called: Dict[str, Called] = {}  # by nodeid
+        self.started = False
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, session, config, items) -> None:
+        """pytest hook. Find the test cases of the --concurrent Markdown files."""
+        if getattr(config.phmdoctest_changed, "recorder", None) is not None:
+            return  # Record each test case's project files.
+        outfiles: Dict[Path, Path] = config.phmdoctest_outfiles
+        concurrent: Set[Path] = config.phmdoctest_concurrent
+        for item in items:
+            outfile = Path(str(item.fspath))
+            if outfiles.get(outfile) in concurrent and can_run(item):
+                self.files.setdefault(outfile, []).append(item)
+                self.nodeids.add(item.nodeid)
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem) -> Optional[bool]:
+        """pytest hook. Log the reports of a test case run in a thread."""
+        if item.nodeid not in self.nodeids:
+            return None
+        if not self.started:
+            self.started = True
+            self.run_all()
+        called = self.called[item.nodeid]
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for call in (called.setup, called.call, called.teardown):
+            if call.when == "call":
+                if called.output.out:
+                    item.add_report_section("call", "stdout", called.output.out)
+                if called.output.err:
+                    item.add_report_section("call", "stderr", called.output.err)
+            report = item.ihook.pytest_runtest_makereport(item=item, call=call)
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+    def run_all(self) -> None:
+        """Run every file in the thread pool. Wait for all of them."""
+        local = threading.local()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = ThreadStream(stdout, local, "stdout")  # type: ignore
+        sys.stderr = ThreadStream(stderr, local, "stderr")  # type: ignore
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                futures = [
+                    executor.submit(self.run_file, file_items, local)
+                    for file_items in self.files.values()
+                ]
+                for future in futures:
+                    self.called.update(future.result())
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    @staticmethod
+    def run_file(
+        file_items: List[pytest.Function], local: threading.local
+    ) -> Dict[str, Called]:
+        """Call the test functions of one file in order."""
+        return {item.nodeid: call_function(item, local) for item in file_items}
+
+
+def configure(config) -> Optional[ThreadRunner]:
+    """Register the thread pool plugin for the --concurrent Markdown files.
+
+    Not used when the test cases run in other processes.
+    """
+    if config.phmdoctest_isolate is not None or config.phmdoctest_checkpoint:
+        return None
+    count = settings.ini_number(config, "phmdoctest-concurrent-threads", "a count")
+    runner = ThreadRunner(config, threads=count or None)
+    config.pluginmanager.register(runner, "phmdoctest-threads")
+    return runner
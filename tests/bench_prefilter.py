@@ -0,0 +1,84 @@
+"""Compare the Python fence pre-filter to phmdoctest detection.
+
+Run this command from the root of the repository:
+python tests/bench_prefilter.py
+
+A synthetic corpus of Markdown files is written to a temporary
+directory. Most of the files have no Python fenced code blocks.
+Prints the time to check the corpus with
+phmdoctest.tool.detect_python_examples() alone and with
+may_have_python() rejecting files first.
+"""
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+import time
+
+import phmdoctest.tool
+
+from pytest_phmdoctest.fences import may_have_python
+
+
+NUM_FILES = 500
+PYTHON_EVERY = 20  # One file in PYTHON_EVERY has Python examples.
+
+PROSE = (
+    "## Section {n}\n\n"
+    "Some text with *emphasis*, `inline code`, and a [link](#section).\n"
+    "- a list item\n- another list item\n\n"
+    "```bash\npip install something\n```\n\n"
+)
+
+PYTHON = "```python\nprint('hello')\n```\n\n```\nhello\n```\n\n"
+
+
+def make_corpus(directory: Path) -> None:
+    """Write NUM_FILES Markdown files to directory."""
+    for i in range(NUM_FILES):
+        text = "".join(PROSE.format(n=n) for n in range(40))
+        if i % PYTHON_EVERY == 0:
+            text += PYTHON
+        (directory / "doc{:04d}.md".format(i)).write_text(text, encoding="utf-8")
+
+
+def detect_all(paths) -> int:
+    count = 0
+    for path in paths:
+        examples = phmdoctest.tool.detect_python_examples(path)
+        count += examples.has_code or examples.has_session
+    return count
+
+
+def prefilter_then_detect_all(paths) -> int:
+    count = 0
+    for path in paths:
+        if may_have_python(path):
+            examples = phmdoctest.tool.detect_python_examples(path)
+            count += examples.has_code or examples.has_session
+    return count
+
+
+def main() -> int:
+    with TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        make_corpus(directory)
+        paths = sorted(directory.glob("*.md"))
+        results = []
+        for function in [detect_all, prefilter_then_detect_all]:
+            start = time.perf_counter()
+            count = function(paths)
+            elapsed = time.perf_counter() - start
+            results.append(count)
+            print(
+                "{:28} {:7.3f} sec  {} files with Python examples".format(
+                    function.__name__, elapsed, count
+                )
+            )
+    if results[0] != results[1]:
+        print("Error- the pre-filter rejected a file with Python examples.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
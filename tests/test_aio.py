@@ -0,0 +1,169 @@
+"""Test cases for top level await in code blocks and sessions."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+import pytest
+
+from pytest_phmdoctest.aio import EventLoop
+from pytest_phmdoctest.aio import rewrite_awaits
+from pytest_phmdoctest.aio import rewrite_session
+
+
+needs_38 = pytest.mark.skipif(
+    sys.version_info < (3, 8), reason="top level await needs Python 3.8"
+)
+
+
+POOL = """\
+# Async
+
+<!--phmdoctest-setup-->
+```python
+import asyncio
+
+
+class Pool:
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    async def fetch(self, n):
+        assert asyncio.get_running_loop() is self.loop
+        await asyncio.sleep(0)
+        return n * 2
+
+
+pool = await Pool().open()
+```
+
+```python
+result = await pool.fetch(await pool.fetch(1))
+print(result, [await pool.fetch(i) for i in range(2)])
+```
+
+```
+4 [0, 2]
+```
+
+```python
+>>> await pool.fetch(21)
+42
+>>> async def double(n):
+...     return await pool.fetch(n)
+>>> await double(
+...     5)
+10
+```
+
+<!--phmdoctest-teardown-->
+```python
+await pool.fetch(0)
+```
+"""
+
+
+@needs_38
+def test_rewrite_awaits():
+    """Top level awaits become calls. Awaits in async functions stay."""
+    assert rewrite_awaits("x = await f(await g())\n") == (
+        "x = _phm_await(f(_phm_await(g())))\n"
+    )
+    assert rewrite_awaits('s = "é"; y = await  h(s)\n') == (
+        's = "é"; y = _phm_await(h(s))\n'
+    )
+    source = "async def a():\n    await b()\n"
+    assert rewrite_awaits(source) == source
+    assert rewrite_awaits("print(1)\n") == "print(1)\n"
+
+
+@needs_38
+def test_rewrite_session():
+    """Only the source after the prompts changes."""
+    session = ">>> await f(1)\n2\n>>> x = [\n...   await g()]\n"
+    assert rewrite_session(session) == (
+        ">>> _phm_await(f(1))\n2\n>>> x = [\n...   _phm_await(g())]\n"
+    )
+
+
+@needs_38
+@pytest.mark.parametrize("event_loop", ["file", "session"])
+def test_top_level_await(pytester, event_loop):
+    """Setup, code, session, and teardown blocks share the event loop."""
+    pytester.makeini(
+        f"""
+        [pytest]
+        phmdoctest-event-loop = {event_loop}
+        phmdoctest-collect =
+            *.md --setup-doctest
+        """
+    )
+    pytester.makefile(".md", pool=POOL)
+    rr = pytester.runpytest("-v", "--phmdoctest-docmod")
+    rr.assert_outcomes(passed=3)
+
+
+@needs_38
+def test_await_graph(pytester):
+    """The event loop code doesn't shift the names of the test functions."""
+    pytester.makefile(
+        ".md",
+        sleeps="""\
+        <!--phmdoctest-setup-->
+        ```python
+        import asyncio
+        ```
+
+        ```python
+        await asyncio.sleep(0)
+        ```
+
+        ```python
+        print(await asyncio.sleep(0, "done"))
+        ```
+
+        ```
+        done
+        ```
+        """,
+    )
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-graph")
+    rr.assert_outcomes(passed=2)
+    rr.stdout.fnmatch_lines(
+        [
+            "sleeps.md: 2 examples, *",
+            "  line 7 test_code_7*",
+            "  line 11 test_code_11_output_15*",
+        ]
+    )
+
+
+def test_event_loop_per_thread():
+    """Threads sharing the session loop each run their own asyncio loop."""
+    event_loop = EventLoop()
+
+    async def running_loop():
+        await asyncio.sleep(0.05)
+        return asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(event_loop.run, running_loop()) for _ in "ab"]
+        loops = [future.result() for future in futures]
+    assert loops[0] is not loops[1]
+    assert event_loop.run(running_loop()) not in loops
+    event_loop.close()
+    assert all(loop.is_closed() for loop in loops)
+
+
+def test_bad_event_loop(pytester):
+    """The phmdoctest-event-loop ini option is checked."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-event-loop = thread
+        """
+    )
+    pytester.makefile(".md", pool=POOL)
+    rr = pytester.runpytest("--phmdoctest")
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*phmdoctest-event-loop must be file or session*"])
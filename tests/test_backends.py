@@ -0,0 +1,141 @@
+"""Test cases for the cache backends and cache export and import."""
+import pytest
+
+from pytest_phmdoctest import backends
+
+
+@pytest.mark.parametrize("kind", backends.BACKEND_CHOICES)
+def test_backend(tmp_path, kind):
+    """Values are saved, replaced, listed, and cleared."""
+    backend = backends.make_backend(kind, tmp_path, "generated")
+    assert backend.get("abc") is None
+    assert not backend.contains("abc")
+    backend.set("abc", "one")
+    backend.set("abc", "two")
+    backend.set_json("def", {"x": 1})
+    assert backend.get("abc") == "two"
+    assert backend.contains("abc")
+    assert backend.get_json("def", {}) == {"x": 1}
+    assert sorted(backend.keys()) == ["abc", "def"]
+    other = backends.make_backend(kind, tmp_path, "state")
+    assert list(other.keys()) == []
+    backend.clear()
+    assert list(backend.keys()) == []
+    backend.close()
+    other.close()
+
+
+def test_export_import(tmp_path):
+    """Imported values don't replace values already saved."""
+    source = {"generated": backends.make_backend("dir", tmp_path / "a", "generated")}
+    source["generated"].set("k1", "one")
+    source["generated"].set("k2", "two")
+    archive = tmp_path / "cache.zip"
+    assert backends.export_archive(archive, source) == 2
+    target = {"generated": backends.make_backend("sqlite", tmp_path / "b", "generated")}
+    target["generated"].set("k1", "kept")
+    assert backends.import_archive(archive, target) == 1
+    assert target["generated"].get("k1") == "kept"
+    assert target["generated"].get("k2") == "two"
+    target["generated"].close()
+
+
+def test_sqlite_backend_run(pytester):
+    """The second run finds the generated test file in the SQLite database."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-cache-backend = sqlite
+        """
+    )
+    pytester.copy_example("tests/sample/README.md")
+    args = ["-v", "--phmdoctest"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["phmdoctest cache: 1 hits, 0 misses"])
+    assert (pytester.path / ".pytest_cache/d/phmdoctest/cache.sqlite3").exists()
+
+
+def test_shared_backend_run(pytester):
+    """Cache entries are saved in phmdoctest-shared-cache-dir."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-cache-backend = shared
+        phmdoctest-shared-cache-dir = shared
+        """
+    )
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest("--phmdoctest", "-p", "no:cacheprovider")
+    rr.assert_outcomes(passed=1)
+    assert list((pytester.path / "shared/generated").glob("*/*.json"))
+
+
+def test_shared_backend_state(pytester):
+    """The saved state of a run stays in the local pytest cache."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-cache-backend = shared
+        phmdoctest-shared-cache-dir = shared
+        """
+    )
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-cache-results")
+    rr.assert_outcomes(passed=1)
+    assert not (pytester.path / "shared/state").exists()
+    state = pytester.path / ".pytest_cache/d/phmdoctest/state"
+    assert (state / "results.json").exists()
+
+
+def test_export_then_import(pytester):
+    """A fresh checkout starts with the exported cache entries."""
+    pytester.copy_example("tests/sample/README.md")
+    archive = pytester.path / "phmdoctest-cache.zip"
+    rr1 = pytester.runpytest("--phmdoctest", f"--phmdoctest-cache-export={archive}")
+    rr1.assert_outcomes(passed=1)
+    assert archive.exists()
+
+    rr2 = pytester.runpytest(
+        "-v",
+        "--phmdoctest",
+        "--cache-clear",
+        f"--phmdoctest-cache-import={archive}",
+    )
+    rr2.assert_outcomes(passed=1)
+    rr2.stdout.fnmatch_lines(
+        [
+            "phmdoctest cache import: 1 entries added",
+            "phmdoctest cache: 1 hits, 0 misses",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "ini, message",
+    [
+        ("phmdoctest-cache-backend = redis", "*phmdoctest-cache-backend must be*"),
+        ("phmdoctest-cache-backend = shared", "*needs phmdoctest-shared-cache-dir*"),
+    ],
+)
+def test_backend_usage_errors(pytester, ini, message):
+    """The backend must be known. shared needs a directory."""
+    pytester.makeini(
+        f"""
+        [pytest]
+        addopts = --phmdoctest
+        {ini}
+        """
+    )
+    rr = pytester.runpytest()
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines([message])
+
+
+def test_import_bad_archive(pytester):
+    """The archive must be a zip file."""
+    pytester.makefile(".zip", bad="not a zip file")
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-cache-import=bad.zip")
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*Can't read cache archive*"])
@@ -0,0 +1,98 @@
+"""Test cases for the generated test file cache."""
+from pathlib import Path
+
+import pytest
+
+from pytest_phmdoctest.cache import distribution_version
+from pytest_phmdoctest.cache import key_kwargs
+from pytest_phmdoctest.cache import versions_fingerprint
+
+
+def test_cache_hits_and_misses(pytester, file_creator):
+    """Second run finds the Markdown files in the cache.
+
+    doc/nocode.md has no Python fences so it is rejected before the cache.
+    """
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_doc(pytester_object=pytester)
+    rr1 = pytester.runpytest("-v")
+    rr1.assert_outcomes(passed=7)
+    rr1.stdout.fnmatch_lines(["phmdoctest cache: 0 hits, 2 misses"])
+
+    rr2 = pytester.runpytest("-v")
+    rr2.assert_outcomes(passed=7)
+    rr2.stdout.fnmatch_lines(["phmdoctest cache: 2 hits, 0 misses"])
+
+
+def test_cache_changed_markdown(pytester):
+    """Edited Markdown file is not found in the cache and is tested again."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest\n")
+    pytester.copy_example("tests/sample/README.md")
+    rr1 = pytester.runpytest("-v")
+    rr1.assert_outcomes(passed=1)
+
+    text = Path("README.md").read_text(encoding="utf-8")
+    edited = text.replace("output block pair", "and output block pair")
+    assert edited != text
+    Path("README.md").write_text(edited, encoding="utf-8")
+    rr2 = pytester.runpytest("-v")
+    rr2.assert_outcomes(passed=1)
+    rr2.stdout.fnmatch_lines(["phmdoctest cache: 0 hits, 1 misses"])
+
+
+def test_cache_changed_settings(pytester):
+    """A different phmdoctest-collect line generates a different test file."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    pytester.copy_example("tests/sample/README.md")
+    rr1 = pytester.runpytest("-v")
+    rr1.assert_outcomes(passed=2)
+
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-collect =
+            README.md --skip greeting
+        """
+    )
+    rr2 = pytester.runpytest("-v")
+    rr2.assert_outcomes(passed=1)
+    rr2.stdout.fnmatch_lines(["phmdoctest cache: 0 hits, 1 misses"])
+
+
+def test_cache_clear(pytester):
+    """The --phmdoctest-cache-clear option empties the cache."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest\n")
+    pytester.copy_example("tests/sample/README.md")
+    rr1 = pytester.runpytest("-v")
+    rr1.assert_outcomes(passed=1)
+    rr2 = pytester.runpytest("-v", "--phmdoctest-cache-clear")
+    rr2.assert_outcomes(passed=1)
+    rr2.stdout.fnmatch_lines(["phmdoctest cache: 0 hits, 1 misses"])
+
+
+def test_no_cacheprovider(pytester):
+    """The plugin works when the pytest cacheprovider plugin is disabled."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest\n")
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest("-v", "-p", "no:cacheprovider")
+    assert rr.ret == pytest.ExitCode.OK
+    rr.assert_outcomes(passed=1)
+    rr.stdout.no_fnmatch_line("phmdoctest cache:*")
+
+
+def test_versions_fingerprint():
+    """The commonmark version is part of the cache key."""
+    version = distribution_version("commonmark")
+    assert version
+    assert version in versions_fingerprint().split()
+    assert distribution_version("no-such-distribution-phmdoctest") == ""
+
+
+def test_key_kwargs():
+    """The absolute Markdown file path is not part of the cache key."""
+    kwargs = dict(markdown_file=Path("/a/doc/x.md"), built_from="doc/x.md")
+    other = dict(kwargs, markdown_file=Path("/b/doc/x.md"))
+    assert key_kwargs(kwargs, False) == key_kwargs(other, False)
+    assert key_kwargs(kwargs, False) == dict(built_from="doc/x.md")
+    assert key_kwargs(kwargs, True) == dict(built_from="doc/x.md", streamed=True)
@@ -0,0 +1,139 @@
+"""Test cases for the --phmdoctest-changed option."""
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from pytest_phmdoctest import deps
+
+
+def test_changed_last_run(pytester, file_creator):
+    """Only Markdown files changed since the last passing run are collected."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    args = ["-v", "--phmdoctest-changed=last-run", "--ignore=src"]
+    pytester.runpytest(*args).assert_outcomes(passed=10)
+
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["*tests/test_example.py::test_example*"])
+
+    # Touched but not modified.
+    os.utime("README.md")
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+
+    project = Path("doc/project.md")
+    project.write_text(project.read_text(encoding="utf-8") + "\nMore.\n")
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=5)
+    rr.stdout.no_fnmatch_line("*README*")
+
+
+def test_changed_last_run_failed(pytester):
+    """A Markdown file with failed tests is not recorded. The others are."""
+    pytester.makefile(
+        ".md",
+        failing="```python\nassert False\n```\n",
+        passing="```python\nassert True\n```\n",
+    )
+    args = ["--phmdoctest", "--phmdoctest-changed=last-run"]
+    pytester.runpytest(*args).assert_outcomes(passed=1, failed=1)
+    pytester.runpytest(*args).assert_outcomes(failed=1)
+
+
+@pytest.mark.parametrize(
+    "options", [["--collect-only"], ["-k", "nomatch"], ["-k", "test_code_2"]]
+)
+def test_changed_last_run_not_run(pytester, options):
+    """A Markdown file is not recorded unless all its tests ran."""
+    pytester.makefile(
+        ".md",
+        failing="```python\nassert True\n```\n\n```python\nassert False\n```\n",
+    )
+    args = ["--phmdoctest", "--phmdoctest-changed=last-run"]
+    pytester.runpytest(*args, *options)
+    pytester.runpytest(*args).assert_outcomes(passed=1, failed=1)
+
+
+def test_changed_last_run_no_cacheprovider(pytester):
+    """--phmdoctest-changed=last-run needs the pytest cache."""
+    rr = pytester.runpytest(
+        "--phmdoctest", "--phmdoctest-changed=last-run", "-p", "no:cacheprovider"
+    )
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*needs the pytest cache*"])
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_changed_git_ref(pytester, file_creator):
+    """Only Markdown files changed since the git ref or untracked are collected."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(git + ["init", "-q"], check=True)
+    subprocess.run(git + ["add", "README.md", "doc"], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "docs"], check=True)
+    project = Path("doc/project.md")
+    project.write_text(project.read_text(encoding="utf-8") + "\nMore.\n")
+    rr = pytester.runpytest("-v", "--phmdoctest-changed", "HEAD", "--ignore=src")
+    rr.assert_outcomes(passed=5)
+    rr.stdout.no_fnmatch_line("*README*")
+    rr.stdout.no_fnmatch_line("*directive2*")
+
+
+class FakeMonitoring:
+    """Stands in for sys.monitoring with some tool ids in use."""
+
+    def __init__(self, used):
+        self.tools = {tool_id: "other" for tool_id in used}
+
+    def get_tool(self, tool_id):
+        return self.tools.get(tool_id)
+
+    def use_tool_id(self, tool_id, name):
+        self.tools[tool_id] = name
+
+
+def test_make_recorder_tool_ids(monkeypatch, tmp_path):
+    """Only the unreserved tool ids are used. The import hook is the fallback."""
+    monitoring = FakeMonitoring(used=[3])
+    monkeypatch.setattr(sys, "monitoring", monitoring, raising=False)
+    recorder = deps.make_recorder(tmp_path)
+    assert isinstance(recorder, deps.MonitoringRecorder)
+    assert recorder.tool_id == 4
+    assert monitoring.tools[4] == "pytest-phmdoctest"
+    monkeypatch.setattr(sys, "monitoring", FakeMonitoring(used=[3, 4]))
+    assert isinstance(deps.make_recorder(tmp_path), deps.ImportRecorder)
+
+
+@pytest.mark.parametrize("modules", ["tempdir", "cache"])
+def test_changed_deps(pytester, modules):
+    """Markdown files are collected again when a module their tests use changes."""
+    pytester.makeini(
+        f"""
+        [pytest]
+        addopts = --phmdoctest --phmdoctest-modules={modules}
+        pythonpath = .
+        """
+    )
+    pytester.makepyfile(mylib="VALUE = 1\n", other="OTHER = 1\n")
+    pytester.makefile(
+        ".md",
+        uses_mylib="```python\nimport mylib\nprint(mylib.VALUE)\n```\n\n```\n1\n```\n",
+        no_imports="```python\nprint(2)\n```\n\n```\n2\n```\n",
+    )
+    args = ["-v", "--phmdoctest-changed=deps"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    pytester.runpytest(*args).assert_outcomes()
+
+    Path("other.py").write_text("OTHER = 2\n")
+    pytester.runpytest(*args).assert_outcomes()
+
+    Path("mylib.py").write_text("VALUE = 1\nMORE = 2\n")
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["*uses_mylib*PASSED*"])
+    pytester.runpytest(*args).assert_outcomes()
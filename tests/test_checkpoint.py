@@ -0,0 +1,166 @@
+"""Test cases for the --phmdoctest-checkpoint option."""
+import os
+
+import pytest
+
+from pytest_phmdoctest.generate import generate
+from pytest_phmdoctest.sharing import group_examples
+
+
+needs_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+
+
+TUTORIAL = """\
+# Tutorial
+
+<!--phmdoctest-setup-->
+```python
+import os
+data = [1]
+other = 2
+setup_pid = os.getpid()
+```
+
+```python
+data.append(2)
+print(data)
+```
+
+```
+[1, 2]
+```
+
+```python
+print(data)
+```
+
+```
+[1, 2]
+```
+
+```python
+print(other, os.getpid() != setup_pid)
+```
+
+```
+2 True
+```
+
+```python
+print(1)
+```
+
+```
+2
+```
+
+<!--phmdoctest-teardown-->
+```python
+print("teardown ran in", "setup" if os.getpid() == setup_pid else "child")
+```
+"""
+
+
+def test_group_examples():
+    """Examples that share a name assigned by the setup block are grouped."""
+    generated = generate(TUTORIAL, dict(markdown_file="tutorial.md"))
+    assert group_examples(generated.graph) == (
+        ("test_code_12_output_17", "test_code_21_output_25"),
+        ("test_code_29_output_33",),
+        ("test_code_37_output_41",),
+    )
+
+
+@needs_fork
+def test_checkpoint(pytester):
+    """The groups run in forked processes. The teardown block runs once."""
+    pytester.makefile(".md", tutorial=TUTORIAL)
+    rr = pytester.runpytest("-v", "-s", "--phmdoctest", "--phmdoctest-checkpoint")
+    rr.assert_outcomes(passed=3, failed=1)
+    rr.stdout.fnmatch_lines(
+        [
+            "*tutorial.py::test_code_12_output_17 PASSED*",
+            "*tutorial.py::test_code_21_output_25 PASSED*",
+            "*tutorial.py::test_code_29_output_33 PASSED*",
+            "*tutorial.py::test_code_37_output_41 *",
+        ]
+    )
+    assert rr.stdout.str().count("teardown ran in setup") == 1
+
+
+@needs_fork
+def test_checkpoint_setup_fails(pytester):
+    """When the setup block fails every test case errors."""
+    pytester.makefile(
+        ".md",
+        broken=TUTORIAL.replace("other = 2", "other = 1 / 0"),
+    )
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-checkpoint")
+    rr.assert_outcomes(errors=4)
+
+
+@needs_fork
+def test_checkpoint_setup_subprocess(pytester):
+    """A child process started by the setup block is not mistaken for a group."""
+    setup = "import subprocess, sys\nsubprocess.Popen([sys.executable, '-c', ''])\n"
+    slow = TUTORIAL.replace("import os\n", setup + "import os, time\n").replace(
+        "print(data)\n```", "time.sleep(0.5)\nprint(data)\n```"
+    )
+    pytester.makefile(".md", tutorial=slow)
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-checkpoint")
+    rr.assert_outcomes(passed=3, failed=1)
+
+
+@needs_fork
+def test_checkpoint_with_isolate(pytester):
+    """The checkpoint and the worker processes can't be used together."""
+    pytester.makefile(".md", tutorial=TUTORIAL)
+    rr = pytester.runpytest(
+        "--phmdoctest", "--phmdoctest-checkpoint", "--phmdoctest-isolate=subprocess"
+    )
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*Cannot use --phmdoctest-checkpoint with*"])
+
+
+@needs_fork
+def test_checkpoint_changed_deps(pytester):
+    """The forked processes report the project files their test cases used."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest --phmdoctest-checkpoint
+        pythonpath = .
+        """
+    )
+    pytester.makepyfile(mylib="VALUE = 1\n")
+    pytester.makefile(
+        ".md",
+        uses_mylib="""\
+        <!--phmdoctest-setup-->
+        ```python
+        data = [1]
+        ```
+
+        ```python
+        print(data)
+        ```
+
+        ```
+        [1]
+        ```
+
+        ```python
+        import mylib
+        print(mylib.VALUE)
+        ```
+
+        ```
+        1
+        ```
+        """,
+    )
+    args = ["--phmdoctest-changed=deps"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    pytester.runpytest(*args).assert_outcomes()
+    pytester.path.joinpath("mylib.py").write_text("VALUE = 1\nMORE = 2\n")
+    pytester.runpytest(*args).assert_outcomes(passed=2)
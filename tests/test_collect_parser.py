@@ -145,7 +145,7 @@ def test_bad_argument():
         "pytest-phmdoctest parse error on the following line:",
         "myglob --bogus --skip Floats --setup MyTEXT --setup-doctest",
         "usage: FileSettings [-h] [--skip TEXT] [--fail-nocode] [--setup TEXT]",
-        "                      [--teardown TEXT] [--setup-doctest]",
+        "                      [--teardown TEXT] [--setup-doctest] [--concurrent]",
         "                      file_glob",
     ]
     expected_lines2 = [
@@ -160,6 +160,7 @@ def test_bad_argument():
         "  --setup TEXT, -u TEXT",
         "  --teardown TEXT, -d TEXT",
         "  --setup-doctest",
+        "  --concurrent",
     ]
     # Replace all run of whitespace including newlines with spaces.
     got = re.sub(r"\s+", " ", parsed["ini-error"])
@@ -361,3 +361,57 @@ def test_collect_section_parse_failure(pytester, file_creator):
         consecutive=False,
     )
     rr.assert_outcomes(failed=2, passed=3)
+
+
+def test_prune_directories(pytester, file_creator):
+    """Directories where no glob can match are not searched."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-collect =
+            doc/project.md
+        phmdoctest-prune = true
+        """
+    )
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest("-v")
+    rr.assert_outcomes(passed=4)
+    rr.stdout.fnmatch_lines(
+        [
+            "*::doc__project.py::doc__project.session_00001_line_31*",
+            "*::doc__project.py::doc__project.session_00002_line_46*",
+            "*::doc__project.py::doc__project.session_00003_line_55*",
+            "*::doc__project.py::test_code_12_output_19*",
+        ],
+        consecutive=True,
+    )
+    # The tests folder can't contain doc/project.md.
+    rr.stdout.no_fnmatch_line("*tests/test_example.py*")
+
+
+def test_ignore_section(pytester, file_creator):
+    """Markdown files and directories matching phmdoctest-ignore are skipped."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest
+        phmdoctest-ignore =
+            doc
+            README.md
+        """
+    )
+    file_creator.populate_all(pytester_object=pytester)
+    pytester.mkdir("vendor")
+    pytester.copy_example("tests/sample/README.md")
+    Path("README.md").rename("vendor/README.md")
+    file_creator.populate_root(pytester_object=pytester)
+    rr = pytester.runpytest("-v")
+    rr.assert_outcomes(passed=2)
+    rr.stdout.fnmatch_lines(
+        [
+            "*tests/test_example.py::test_example*",
+            "*::vendor__README.py::test_code_10_output_17*",
+        ],
+        consecutive=True,
+    )
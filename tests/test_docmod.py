@@ -155,3 +155,35 @@ def test_bad_doctest_skip_session_code_example(pytester, monkeypatch):
         ],
         consecutive=True,
     )
+
+
+@pytest.mark.skipif(PYTEST_LT_7, reason="n/a pytest < 7")
+def test_bad_doctest_raw_string_in_code(pytester, monkeypatch):
+    """A raw string with >>> in a code example is not mistaken for a session."""
+    monkeypatch.setattr(_pytest.doctest, "DoctestModule", MockDoctestModule())
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    pytester.makefile(
+        ".md",
+        raw='''\
+        ```python
+        text = r"""
+        >>> 1 + 1
+        2
+        """
+        print(len(text.splitlines()))
+        ```
+
+        ```
+        4
+        ```
+
+        <!--phmdoctest-skip-->
+        ```py
+        >>> 1 + 1
+        2
+        ```
+        ''',
+    )
+    rr = pytester.runpytest("-v")
+    rr.assert_outcomes(passed=1)
+    rr.stdout.no_fnmatch_line("*test_unable_to_collect_doctests*")
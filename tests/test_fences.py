@@ -0,0 +1,129 @@
+"""Test cases for the Python fence pre-filter and line scanner."""
+from pathlib import Path
+
+import pytest
+
+import phmdoctest.tool
+
+from pytest_phmdoctest.fences import may_have_python
+from pytest_phmdoctest.fences import stream_fenced_nodes
+from pytest_phmdoctest.generate import decode
+from pytest_phmdoctest.generate import generate
+from pytest_phmdoctest.generate import generate_streamed
+
+
+MARKDOWN_FILES = sorted(Path(".").glob("*.md")) + sorted(Path("tests").glob("**/*.md"))
+
+
+@pytest.mark.parametrize("path", MARKDOWN_FILES, ids=str)
+def test_never_rejects_examples(path):
+    """A file with Python examples is never rejected."""
+    examples = phmdoctest.tool.detect_python_examples(path)
+    if examples.has_code or examples.has_session:
+        assert may_have_python(path)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", False),
+        ("# Title\n\nJust text.\n", False),
+        ("```\nprint('x')\n```\n", False),
+        ("```txt\nhello\n```\n", False),
+        ("```python\nprint('x')\n```\n", True),
+        ("~~~py3\nprint('x')\n~~~\n", True),
+        ("````  pycon\n>>> 1\n1\n````\n", True),
+        ("> ```python\n> print('x')\n> ```\n", True),
+        ("- item\n\n  ```\tpython\n  print('x')\n  ```\n", True),
+        ("```&#112;ython\nprint('x')\n```\n", True),
+    ],
+)
+def test_may_have_python(tmp_path, text, expected):
+    """Check files with and without Python fence openers."""
+    path = tmp_path / "example.md"
+    path.write_text(text, encoding="utf-8")
+    assert may_have_python(path) is expected
+
+
+@pytest.mark.parametrize("path", MARKDOWN_FILES, ids=str)
+def test_streamed_same_as_parsed(path):
+    """The line scanner finds the same Python examples as the parser."""
+    kwargs = {"markdown_file": path, "built_from": path.as_posix()}
+    parsed = generate(decode(path.read_bytes()), kwargs)
+    streamed = generate_streamed(path, kwargs)
+    assert streamed == parsed
+
+
+def test_stream_fenced_nodes():
+    """Check the blocks kept, line numbers, and directives."""
+    text = """\
+# Title
+
+<!--phmdoctest-label my_label-->
+<!--phmdoctest-skip-->
+Some text.
+```bash
+ls
+```
+
+<!--phmdoctest-label
+my_other_label-->
+
+  ```python
+  print("hello")
+    print("indented")
+  ```
+```
+hello
+```
+~~~ py3
+>>> 1 + 1
+2
+~~~~
+    ```python
+    not a fence
+    ```
+```bash
+ls
+```
+```python
+unclosed
+"""
+    nodes = list(stream_fenced_nodes(text.splitlines(keepends=True)))
+    assert [node.info for node in nodes] == ["python", "", "py3", "bash", "python"]
+    assert [node.sourcepos[0][0] for node in nodes] == [13, 17, 20, 27, 30]
+    assert nodes[0].literal == 'print("hello")\n  print("indented")\n'
+    assert nodes[0].prv.literal == "<!--phmdoctest-label\nmy_other_label-->"
+    assert nodes[0].prv.prv is None  # text separates the comments
+    assert nodes[1].literal == "hello\n"
+    assert nodes[2].literal == ">>> 1 + 1\n2\n"
+    assert nodes[3].literal == ""  # not kept
+    assert nodes[4].literal == "unclosed\n"
+
+
+def test_stream_threshold(pytester, file_creator):
+    """Files larger than phmdoctest-stream-threshold are read line by line."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-stream-threshold = 0
+        """
+    )
+    file_creator.populate_doc(pytester_object=pytester)
+    rr = pytester.runpytest("-v")
+    rr.assert_outcomes(passed=7)
+
+
+def test_stream_threshold_bad_value(pytester):
+    """phmdoctest-stream-threshold must be a number of bytes."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest
+        phmdoctest-stream-threshold = 10MB
+        """
+    )
+    rr = pytester.runpytest()
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*phmdoctest-stream-threshold must be*"])
@@ -0,0 +1,176 @@
+"""Test cases for the compiled phmdoctest-collect glob matcher."""
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from pytest_phmdoctest.settings import FileSettings
+from pytest_phmdoctest.settings import translate_glob
+
+
+DIRECTORIES = [
+    "doc",
+    "doc/api",
+    "doc/api/v1",
+    "node_modules",
+    "node_modules/pkg",
+    "src",
+]
+
+
+TREE = [
+    "README.md",
+    "CONTRIBUTING.md",
+    ".hidden.md",
+    "doc/project.md",
+    "doc/README.md",
+    "doc/api/index.md",
+    "doc/api/v1/deep.md",
+    "doc/a[1].md",
+    "node_modules/pkg/README.md",
+    "src/notes.txt",
+]
+
+
+GLOBS = [
+    "README.md",
+    "./README.md",
+    "*.md",
+    "**/*.md",
+    "doc/*.md",
+    "doc/**/*.md",
+    "**/README.md",
+    "doc/**/index.md",
+    "**/api/**/*.md",
+    "doc/?????.md",
+    "doc/[pR]*.md",
+    "doc/[!p]*.md",
+    "doc/a[[]1].md",
+    "doc/a[1.md",
+    "*/*.md",
+    "**",
+    "doc/**",
+    "../README.md",
+]
+
+
+class FakeConfig:
+    """Just enough of pytest Config for FileSettings."""
+
+    def __init__(self, invoke_dir: Path, section, ignore=(), prune=False):
+        self.invocation_params = SimpleNamespace(dir=invoke_dir)
+        self.ini = {
+            "phmdoctest-collect": section,
+            "phmdoctest-ignore": list(ignore),
+            "phmdoctest-prune": prune,
+        }
+
+    def getini(self, name):
+        return self.ini[name]
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    """Populate tmp_path with the files in TREE."""
+    for name in TREE:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("text", encoding="utf-8")
+    return tmp_path
+
+
+@pytest.mark.parametrize("glob", GLOBS)
+def test_same_as_path_glob(tree, glob):
+    """The compiled glob matches the same files that Path.glob() finds."""
+    files = [tree / name for name in TREE]
+    found = set(tree.glob(glob))
+    settings = FileSettings(FakeConfig(tree, [glob]))
+    for path in files:
+        expected = path in found
+        got = settings.match_glob(path) is not None
+        assert got == expected, "{} {}".format(glob, path)
+
+
+def test_absolute_glob_never_matches():
+    """Path.glob() does not support absolute patterns."""
+    assert translate_glob("/doc/*.md") == "(?!)"
+
+
+def test_first_match_wins(tree):
+    """The options come from the first line with a matching glob."""
+    section = [
+        "doc/project.md --skip greeting",
+        "doc/**/*.md --fail-nocode",
+        "**/*.md -s other",
+    ]
+    settings = FileSettings(FakeConfig(tree, section))
+    assert settings.match_glob(tree / "doc/project.md")["skips"] == ["greeting"]
+    assert settings.match_glob(tree / "doc/api/index.md")["fail_nocode"] is True
+    assert settings.match_glob(tree / "README.md")["skips"] == ["other"]
+    assert settings.match_glob(tree / "src/notes.txt") is None
+    assert "file_glob" not in settings.match_glob(tree / "README.md")
+
+
+def test_ini_error_line(tree):
+    """A line that does not parse matches files not matched by earlier lines."""
+    section = [
+        "doc/project.md --skip greeting",
+        "**/*.md --bogus",
+        "README.md",
+    ]
+    settings = FileSettings(FakeConfig(tree, section))
+    assert settings.match_glob(tree / "doc/project.md")["skips"] == ["greeting"]
+    assert "ini-error" in settings.match_glob(tree / "README.md")
+    assert "ini-error" in settings.match_glob(tree.parent / "elsewhere.md")
+
+
+def test_outside_invocation_dir(tree):
+    """A file outside the invocation directory never matches a glob."""
+    settings = FileSettings(FakeConfig(tree / "doc", ["**/*.md"]))
+    assert settings.match_glob(tree / "README.md") is None
+    assert settings.match_glob(tree / "doc/project.md") is not None
+
+
+@pytest.mark.parametrize("glob", GLOBS)
+def test_may_contain_match(tree, glob):
+    """A directory is pruned only if Path.glob() finds nothing below it."""
+    found = set(tree.glob(glob))
+    settings = FileSettings(FakeConfig(tree, [glob]))
+    assert settings.may_contain_match(tree)
+    for name in DIRECTORIES:
+        directory = tree / name
+        below = any(directory in path.parents for path in found if path.is_file())
+        if below:
+            assert settings.may_contain_match(directory), "{} {}".format(glob, name)
+
+
+def test_prune_exact():
+    """Check which directories are pruned for a few globs."""
+    tree = Path("/project")
+    settings = FileSettings(FakeConfig(tree, ["doc/*.md", "README.md"]))
+    assert settings.may_contain_match(tree / "doc")
+    assert not settings.may_contain_match(tree / "doc/api")
+    assert not settings.may_contain_match(tree / "src")
+    settings = FileSettings(FakeConfig(tree, ["doc/**/index.md"]))
+    assert settings.may_contain_match(tree / "doc/api/v1")
+    assert not settings.may_contain_match(tree / "node_modules")
+    settings = FileSettings(FakeConfig(tree, ["*/api/*.md"]))
+    assert settings.may_contain_match(tree / "doc")
+    assert settings.may_contain_match(tree / "doc/api")
+    assert not settings.may_contain_match(tree / "doc/other")
+    assert not settings.may_contain_match(tree / "doc/api/v1")
+    settings = FileSettings(FakeConfig(tree, ["README.md", "doc/*.md --bogus"]))
+    assert settings.may_contain_match(tree / "src")
+
+
+def test_is_ignored():
+    """Check paths matched by the phmdoctest-ignore globs."""
+    tree = Path("/project")
+    settings = FileSettings(FakeConfig(tree, [], ignore=["**/node_modules", "*.md"]))
+    assert settings.is_ignored(tree / "node_modules")
+    assert settings.is_ignored(tree / "doc/node_modules")
+    assert settings.is_ignored(tree / "README.md")
+    assert not settings.is_ignored(tree / "doc/README.md")
+    assert not settings.is_ignored(Path("/elsewhere/README.md"))
+    settings = FileSettings(FakeConfig(tree, []))
+    assert not settings.is_ignored(tree / "README.md")
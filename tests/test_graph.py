@@ -0,0 +1,157 @@
+"""Test cases for the example dependency graph and --phmdoctest-graph."""
+import os
+
+import pytest
+
+from pytest_phmdoctest.generate import generate
+from pytest_phmdoctest.sharing import analyze
+from pytest_phmdoctest.sharing import group_examples
+
+
+needs_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+
+
+SHARED = """\
+# Shared names
+
+<!--phmdoctest-share-names-->
+```python
+total = 1
+```
+
+```python
+print(total)
+```
+
+```
+1
+```
+
+```python
+with open("out.txt", "w") as f:
+    f.write("x")
+```
+
+```python
+print(2)
+```
+
+```
+2
+```
+
+```python
+print(open("out.txt").read())
+```
+
+```
+x
+```
+"""
+
+
+def test_analyze():
+    """Changed names include method call receivers and function arguments."""
+    names = analyze("data.append(1)\nshow(items)\nprint(count)\n")
+    assert names.refs == {"data", "show", "items", "count"}
+    assert names.writes == {"data", "items"}
+    assert not names.io
+    assert analyze("import os\n").io
+    assert analyze("open('f')\n").io
+    assert not analyze("import random\n").io
+    assert analyze("import random\nrandom.seed(1)\n").io
+    assert analyze("from random import seed\nseed(1)\n").io
+    assert analyze("seed(1)\n", {"seed"}).io
+    assert not analyze("seed(1)\n").io
+
+
+MODULE_STATE = """\
+# Module state
+
+<!--phmdoctest-setup-->
+```python
+from random import random
+```
+
+```python
+import random as r
+r.seed(1)
+```
+
+```python
+print(round(random(), 3))
+```
+
+```
+0.134
+```
+
+```python
+print(3)
+```
+
+```
+3
+```
+"""
+
+
+def test_module_state_graph():
+    """Examples that use imported module state run in order."""
+    graph = generate(MODULE_STATE, dict(markdown_file="state.md")).graph
+    assert [(node.line, node.after, node.io) for node in graph] == [
+        (9, (), True),
+        (14, (9,), True),
+        (22, (), False),
+    ]
+
+
+def test_dependency_graph():
+    """Shared names and I/O order the examples."""
+    graph = generate(SHARED, dict(markdown_file="shared.md")).graph
+    assert [(node.line, node.after, node.io) for node in graph] == [
+        (5, (), False),
+        (9, (5,), False),
+        (17, (), True),
+        (22, (), False),
+        (30, (17,), True),
+    ]
+    assert group_examples(graph) == (
+        ("test_code_5", "test_code_9_output_13"),
+        ("test_code_17", "test_code_30_output_34"),
+        ("test_code_22_output_26",),
+    )
+
+
+def test_graph_report(pytester):
+    """--phmdoctest-graph shows the dependencies in the terminal summary."""
+    pytester.makefile(".md", shared=SHARED)
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-graph")
+    rr.assert_outcomes(passed=5)
+    rr.stdout.fnmatch_lines(
+        [
+            "*= phmdoctest graph =*",
+            "shared.md: 5 examples, 3 groups",
+            "  line 5 test_code_5",
+            "  line 9 test_code_9_output_13 after 5",
+            "  line 17 test_code_17 [io]",
+            "  line 22 test_code_22_output_26",
+            "  line 30 test_code_30_output_34 after 17 [io]",
+        ]
+    )
+
+
+@needs_fork
+def test_graph_checkpoint(pytester):
+    """Each group runs in a forked process in dependency order."""
+    pytester.makefile(".md", shared=SHARED)
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-checkpoint")
+    rr.assert_outcomes(passed=5)
+
+
+@needs_fork
+def test_module_state_checkpoint(pytester):
+    """The seeded example runs in the same process as the example after it."""
+    pytester.makefile(".md", state=MODULE_STATE)
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-checkpoint")
+    rr.assert_outcomes(passed=3)
@@ -0,0 +1,97 @@
+"""Test cases for the --phmdoctest-incremental option."""
+import json
+
+import pytest
+
+
+def test_incremental(pytester, file_creator):
+    """Only changed test files are written. Orphans are removed."""
+    file_creator.populate_all(pytester_object=pytester)
+    args = ["--phmdoctest-generate=.gendir", "--phmdoctest-incremental"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    gendir = pytester.path / ".gendir"
+    names = ["test_README.py", "test_doc__directive2.py", "test_doc__project.py"]
+    assert sorted(p.name for p in gendir.glob("*.py")) == names
+    manifest = json.loads((gendir / ".phmdoctest-generate.json").read_text())
+    assert sorted(manifest) == names
+    assert manifest["test_doc__project.py"]["markdown"] == "doc/project.md"
+    mtimes = {p.name: p.stat().st_mtime_ns for p in gendir.glob("*.py")}
+
+    # Unchanged Markdown files are not written again.
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    assert {p.name: p.stat().st_mtime_ns for p in gendir.glob("*.py")} == mtimes
+
+    # Change one Markdown file, remove another.
+    project = pytester.path / "doc/project.md"
+    project.write_text(
+        project.read_text(encoding="utf-8") + "\nMore text.\n", encoding="utf-8"
+    )
+    (pytester.path / "doc/directive2.md").unlink()
+    (gendir / "test_mine.py").write_text("def test_mine():\n    pass\n")
+    rr = pytester.runpytest(*args, "-v", ".", ".gendir")
+    rr.assert_outcomes(passed=4)
+    assert sorted(p.name for p in gendir.glob("*.py")) == [
+        "test_README.py",
+        "test_doc__project.py",
+        "test_mine.py",
+    ]
+    assert (gendir / "test_README.py").stat().st_mtime_ns == mtimes["test_README.py"]
+    manifest = json.loads((gendir / ".phmdoctest-generate.json").read_text())
+    assert sorted(manifest) == ["test_README.py", "test_doc__project.py"]
+
+
+def test_incremental_first_run_cleans(pytester):
+    """Without a manifest DIR is cleaned the same as --phmdoctest-generate."""
+    pytester.copy_example("tests/sample/README.md")
+    gendir = pytester.mkdir(".gendir")
+    (gendir / "test_old.py").write_text("def test_old():\n    assert False\n")
+    rr = pytester.runpytest(
+        "--phmdoctest-generate=.gendir", "--phmdoctest-incremental", ".", ".gendir"
+    )
+    rr.assert_outcomes(passed=1)
+    assert (gendir / "notest_old.sav").exists()
+
+
+def test_incremental_requires_generate(pytester):
+    """--phmdoctest-incremental is only for --phmdoctest-generate."""
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-incremental")
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*--phmdoctest-incremental requires*"])
+
+
+def test_incremental_unchanged_registered(pytester):
+    """An unchanged Markdown file still reports its graph."""
+    pytester.copy_example("tests/sample/README.md")
+    args = ["--phmdoctest-generate=.gendir", "--phmdoctest-incremental"]
+    args += ["--phmdoctest-graph", ".", ".gendir"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["*= phmdoctest graph =*", "README.md: * examples*"])
+
+
+def test_incremental_prunes_unmatched(pytester):
+    """Test files of Markdown files no longer collected are removed."""
+    pytester.copy_example("tests/sample/README.md")
+    pytester.makefile(".md", other="```python\nprint(1)\n```\n\n```\n1\n```\n")
+    args = ["--phmdoctest-generate=.gendir", "--phmdoctest-incremental"]
+    pytester.runpytest(*args, ".", ".gendir").assert_outcomes(passed=2)
+    gendir = pytester.path / ".gendir"
+    assert (gendir / "test_other.py").exists()
+
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-collect =
+            README.md
+        """
+    )
+    rr = pytester.runpytest(*args, ".", ".gendir")
+    rr.assert_outcomes(passed=1, deselected=1)
+    assert not (gendir / "test_other.py").exists()
+    manifest = json.loads((gendir / ".phmdoctest-generate.json").read_text())
+    assert sorted(manifest) == ["test_README.py"]
+
+    # Markdown files outside the paths on the command line are kept.
+    pytester.runpytest(*args, ".gendir").assert_outcomes(passed=1)
+    assert (gendir / "test_README.py").exists()
@@ -0,0 +1,131 @@
+"""Test cases for the --phmdoctest-index option and the index query tool."""
+import sqlite3
+
+from pytest_phmdoctest import index
+
+
+EXAMPLES = """\
+# Examples
+
+```python
+print("one")
+```
+
+```
+one
+```
+
+```py
+>>> 1 + 1
+2
+```
+"""
+
+
+def rows(database):
+    """Return the index rows ordered by Markdown file and line."""
+    connection = sqlite3.connect(str(database))
+    try:
+        return connection.execute(
+            "SELECT markdown, line, kind, test_name, last_status, runs, flips"
+            " FROM blocks ORDER BY markdown, line"
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def test_index(pytester):
+    """Each block is indexed with its test case and last result."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-collect =
+            **/*.md
+        """
+    )
+    pytester.makefile(".md", examples=EXAMPLES)
+    database = pytester.path / "index.sqlite3"
+    args = ["--phmdoctest-docmod", f"--phmdoctest-index={database}"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    assert rows(database) == [
+        ("examples.md", 4, "code", "test_code_4_output_8", "passed", 1, 0),
+        ("examples.md", 8, "output", "", None, 0, 0),
+        ("examples.md", 12, "session", "session_00001_line_12", "passed", 1, 0),
+    ]
+    connection = sqlite3.connect(str(database))
+    assert connection.execute(
+        "SELECT DISTINCT collect_line FROM blocks"
+    ).fetchall() == [("**/*.md",)]
+    connection.close()
+
+    # The example moves down and fails. It keeps its history.
+    pytester.makefile(
+        ".md",
+        examples=EXAMPLES.replace("# Examples\n", "# Examples\n\n").replace(
+            "2\n```", "3\n```"
+        ),
+    )
+    pytester.runpytest(*args).assert_outcomes(passed=1, failed=1)
+    assert rows(database) == [
+        ("examples.md", 5, "code", "test_code_5_output_9", "passed", 2, 0),
+        ("examples.md", 9, "output", "", None, 0, 0),
+        ("examples.md", 13, "session", "session_00001_line_13", "failed", 1, 0),
+    ]
+
+
+def test_index_removed_file(pytester):
+    """The rows of a deleted Markdown file are removed."""
+    pytester.makefile(".md", examples=EXAMPLES, other="```python\nprint(1)\n```\n")
+    database = pytester.path / "index.sqlite3"
+    args = ["--phmdoctest", f"--phmdoctest-index={database}"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    assert {row[0] for row in rows(database)} == {"examples.md", "other.md"}
+    pytester.path.joinpath("other.md").unlink()
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    assert {row[0] for row in rows(database)} == {"examples.md"}
+
+
+def test_index_flaky(pytester):
+    """A test case that passes then fails is flaky."""
+    pytester.makefile(".md", examples=EXAMPLES)
+    database = pytester.path / "index.sqlite3"
+    args = ["--phmdoctest", f"--phmdoctest-index={database}"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    pytester.makefile(
+        ".md", examples=EXAMPLES.replace("one\n```\n\n```py", "two\n```\n\n```py", 1)
+    )
+    pytester.runpytest(*args).assert_outcomes(failed=1)
+    pytester.makefile(".md", examples=EXAMPLES)
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    assert rows(database)[0] == (
+        "examples.md",
+        4,
+        "code",
+        "test_code_4_output_8",
+        "passed",
+        3,
+        2,
+    )
+
+
+def test_query(tmp_path, capsys):
+    """The command line tool prints canned queries and SQL."""
+    database = tmp_path / "index.sqlite3"
+    connection = index.connect(database)
+    connection.execute(
+        "INSERT INTO blocks (markdown, line, end_line, kind, digest, collect_line,"
+        " test_name, last_status, last_duration, runs, failures, flips)"
+        " VALUES ('a.md', 3, 4, 'code', 'x', '', 'test_code_3', 'failed', 1.5,"
+        " 4, 2, 3)"
+    )
+    connection.close()
+    assert index.main([str(database), "slowest", "-n", "5"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "markdown\tline\tkind\tlast_status\tlast_duration",
+        "a.md\t3\tcode\tfailed\t1.5",
+    ]
+    assert index.main([str(database), "flaky"]) == 0
+    assert capsys.readouterr().out.splitlines()[1] == "a.md\t3\tcode\t3\t2\t4"
+    assert index.main([str(database), "sql", "SELECT COUNT(*) AS n FROM blocks"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["n", "1"]
+    assert index.main([str(database), "sql", "SELECT nope"]) == 1
@@ -0,0 +1,155 @@
+"""Test cases for the --phmdoctest-isolate option."""
+import pytest
+
+
+def test_isolate(pytester, file_creator):
+    """The Markdown test cases run in worker processes."""
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest(
+        "-v",
+        "--phmdoctest-docmod",
+        "--phmdoctest-isolate=subprocess",
+        "--phmdoctest-isolate-workers=2",
+        "--ignore=src",
+    )
+    rr.assert_outcomes(passed=10)
+    rr.stdout.fnmatch_lines(
+        [
+            "*README.py::README.session_00001_line_24 PASSED*",
+            "*README.py::test_code_10_output_17 PASSED*",
+        ]
+    )
+    rr.stdout.fnmatch_lines(["phmdoctest isolate: * worker processes started*"])
+
+
+def test_isolate_recycle(pytester):
+    """Workers are replaced after phmdoctest-isolate-max-files files."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest --phmdoctest-isolate=subprocess
+        phmdoctest-isolate-max-files = 1
+        """
+    )
+    pytester.makefile(
+        ".md",
+        first="""\
+        ```python
+        import builtins
+        builtins.phmdoctest_leak = 1
+        ```
+        """,
+        second="""\
+        ```python
+        import builtins
+        assert not hasattr(builtins, "phmdoctest_leak")
+        ```
+        """,
+    )
+    rr = pytester.runpytest("-v", "--phmdoctest-isolate-workers=1")
+    rr.assert_outcomes(passed=2)
+    rr.stdout.fnmatch_lines(
+        ["phmdoctest isolate: 2 worker processes started, 2 recycled"]
+    )
+
+
+def test_isolate_worker_exits(pytester):
+    """A test case that ends the worker process errors. The others still run."""
+    pytester.makefile(
+        ".md",
+        exits="""\
+        ```python
+        print("hello")
+        ```
+
+        ```
+        hello
+        ```
+
+        ```python
+        import os
+        os._exit(3)
+        ```
+        """,
+    )
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest("-v", "--phmdoctest", "--phmdoctest-isolate=subprocess")
+    rr.assert_outcomes(passed=2, failed=1)
+    rr.stdout.fnmatch_lines(["*worker process exited while running exits*"])
+
+
+def test_isolate_bad_max_rss(pytester):
+    """phmdoctest-isolate-max-rss must be a number of megabytes."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest --phmdoctest-isolate=subprocess
+        phmdoctest-isolate-max-rss = 1GB
+        """
+    )
+    rr = pytester.runpytest()
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*phmdoctest-isolate-max-rss must be megabytes*"])
+
+
+def test_isolate_conftest_and_ini(pytester):
+    """Workers use the conftest.py files, ini options, and cache results."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod --phmdoctest-isolate=subprocess
+        doctest_optionflags = ELLIPSIS
+        """
+    )
+    pytester.makeconftest(
+        """
+        import builtins
+        import pytest
+
+        @pytest.fixture(autouse=True)
+        def answer():
+            builtins.answer = 42
+        """
+    )
+    pytester.makefile(
+        ".md",
+        answer="""\
+        ```python
+        print(answer)
+        ```
+
+        ```
+        42
+        ```
+
+        ```python
+        >>> print("answer", answer)
+        answer ...
+        ```
+        """,
+    )
+    args = ["-v", "--phmdoctest-cache-results"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    pytester.runpytest(*args).assert_outcomes(skipped=2)
+    assert not list(pytester.path.glob(".phmdoctest-isolate-*"))
+
+
+def test_isolate_changed_deps(pytester):
+    """The workers report the project files the test cases used."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest --phmdoctest-isolate=subprocess
+        pythonpath = .
+        """
+    )
+    pytester.makepyfile(mylib="VALUE = 1\n")
+    pytester.makefile(
+        ".md",
+        uses_mylib="```python\nimport mylib\nprint(mylib.VALUE)\n```\n\n```\n1\n```\n",
+    )
+    args = ["--phmdoctest-changed=deps"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    pytester.runpytest(*args).assert_outcomes()
+    pytester.path.joinpath("mylib.py").write_text("VALUE = 1\nMORE = 2\n")
+    pytester.runpytest(*args).assert_outcomes(passed=1)
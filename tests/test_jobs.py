@@ -0,0 +1,53 @@
+"""Test cases for the --phmdoctest-jobs option."""
+import pytest
+
+
+def test_jobs(pytester, file_creator):
+    """Test files are generated by the process pool."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest("-v", "--phmdoctest-jobs=2", "--ignore=src")
+    rr.assert_outcomes(passed=10)
+    # doc/nocode.md, CONTRIBUTING.md, and doc/README.md
+    # have no Python fences.
+    rr.stdout.fnmatch_lines(
+        [
+            "phmdoctest jobs: 2 processes generated 3 files",
+            "phmdoctest cache: 0 hits, 3 misses",
+        ]
+    )
+
+    # Files found in the cache are not generated again.
+    rr2 = pytester.runpytest("-v", "--phmdoctest-jobs=2", "--ignore=src")
+    rr2.assert_outcomes(passed=10)
+    rr2.stdout.fnmatch_lines(
+        [
+            "phmdoctest jobs: 2 processes generated 0 files",
+            "phmdoctest cache: 3 hits, 0 misses",
+        ]
+    )
+
+
+def test_jobs_collect_section(pytester, file_creator):
+    """Only files selected by the phmdoctest-collect section are generated."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-collect =
+            doc/project.md --skip greeting
+        """
+    )
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest(
+        "-v", "--phmdoctest-jobs=2", "-p", "no:cacheprovider", "--ignore=src"
+    )
+    rr.assert_outcomes(passed=4)
+    rr.stdout.fnmatch_lines(["phmdoctest jobs: 2 processes generated 1 files"])
+
+
+def test_jobs_usage_error(pytester):
+    """The number of jobs can't be negative."""
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-jobs=-1")
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*--phmdoctest-jobs must be 0 or more*"])
@@ -0,0 +1,84 @@
+"""Test cases for collecting Markdown files from a manifest or git ls-files."""
+from pathlib import Path
+import shutil
+import subprocess
+
+import pytest
+
+
+def test_manifest(pytester, file_creator):
+    """Only the Markdown files listed in the manifest are collected."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    Path("markdown.txt").write_text(
+        "# Markdown files to test\n\nREADME.md\ndoc/project.md\n", encoding="utf-8"
+    )
+    rr = pytester.runpytest("-v", "--phmdoctest-manifest", "markdown.txt")
+    rr.assert_outcomes(passed=7)
+    rr.stdout.no_fnmatch_line("*CONTRIBUTING*")
+    rr.stdout.no_fnmatch_line("*directive2*")
+    # Without command line arguments Python tests are still collected.
+    rr.stdout.fnmatch_lines(["*tests/test_example.py::test_example PASSED*"])
+
+
+def test_manifest_with_args(pytester, file_creator):
+    """Directories on the command line are searched for Python tests only."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    Path("markdown.txt").write_text("README.md\n", encoding="utf-8")
+    rr = pytester.runpytest("-v", "--phmdoctest-manifest", "markdown.txt", ".")
+    rr.assert_outcomes(passed=3)
+    rr.stdout.fnmatch_lines(
+        [
+            "*::README.py::README.session_00001_line_24*",
+            "*::README.py::test_code_10_output_17*",
+            "*tests/test_example.py::test_example*",
+        ],
+        consecutive=True,
+    )
+
+
+def test_manifest_uses_collect_section(pytester, file_creator):
+    """Options from the phmdoctest-collect section apply to listed files."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-collect =
+            **/*.md --skip greeting
+        """
+    )
+    file_creator.populate_root(pytester_object=pytester)
+    Path("markdown.txt").write_text("README.md\n", encoding="utf-8")
+    rr = pytester.runpytest("-v", "--phmdoctest-manifest", "markdown.txt")
+    rr.assert_outcomes(passed=1)
+
+
+def test_manifest_missing(pytester):
+    """A manifest that can't be read is a usage error."""
+    rr = pytester.runpytest("--phmdoctest", "--phmdoctest-manifest", "missing.txt")
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*Can't read manifest*"])
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_git(pytester, file_creator):
+    """Only the Markdown files tracked by git are collected."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest-docmod\n")
+    file_creator.populate_all(pytester_object=pytester)
+    subprocess.run(["git", "init", "-q"], check=True)
+    subprocess.run(["git", "add", "README.md", "doc/project.md"], check=True)
+    rr = pytester.runpytest("-v", "--phmdoctest-git")
+    rr.assert_outcomes(passed=7)
+    rr.stdout.no_fnmatch_line("*CONTRIBUTING*")
+    rr.stdout.fnmatch_lines(["*tests/test_example.py::test_example PASSED*"])
+
+
+def test_git_not_a_repository(pytester):
+    """Outside a git repository --phmdoctest-git is a usage error."""
+    pytester.makeini("[pytest]\naddopts = --phmdoctest\n")
+    rr = pytester.runpytest("--phmdoctest-git", "-p", "no:cacheprovider")
+    if rr.ret == pytest.ExitCode.USAGE_ERROR:
+        rr.stderr.fnmatch_lines(["*git ls-files*"])
+    else:
+        pytest.skip("pytester directory is inside a git repository")
@@ -0,0 +1,79 @@
+"""Test cases for the phmdoctest-preimport ini option."""
+import multiprocessing
+
+import pytest
+
+
+WARM = """\
+```python
+import sys
+print("warm" in sys.modules)
+```
+
+```
+True
+```
+"""
+
+
+@pytest.mark.parametrize("isolate", ["none", "subprocess"])
+def test_preimport(pytester, isolate):
+    """The modules are imported before the test cases run."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-preimport =
+            json
+            warm
+        """
+    )
+    pytester.syspathinsert()
+    pytester.makepyfile(warm="VALUE = 1")
+    pytester.makefile(".md", example=WARM)
+    rr = pytester.runpytest(
+        "--phmdoctest", f"--phmdoctest-isolate={isolate}", "--ignore=warm.py"
+    )
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["phmdoctest preimport: json *s, warm *s"])
+
+
+@pytest.mark.skipif(
+    "forkserver" not in multiprocessing.get_all_start_methods(),
+    reason="needs the forkserver start method",
+)
+def test_preimport_isolate_once(pytester):
+    """Replaced isolate workers don't import the modules again."""
+    pytester.makeini(
+        """
+        [pytest]
+        pythonpath = .
+        phmdoctest-preimport = warm
+        phmdoctest-isolate-max-files = 1
+        """
+    )
+    pytester.makepyfile(warm="with open('imports.txt', 'a') as f:\n    f.write('x')\n")
+    for name in "abc":
+        pytester.makefile(".md", **{name: WARM})
+    rr = pytester.runpytest_subprocess(
+        "--phmdoctest",
+        "--phmdoctest-isolate=subprocess",
+        "--phmdoctest-isolate-workers=1",
+        "--ignore=warm.py",
+    )
+    rr.assert_outcomes(passed=3)
+    # Imported by pytest and by the forkserver.
+    assert pytester.path.joinpath("imports.txt").read_text() == "xx"
+
+
+def test_preimport_missing(pytester):
+    """A module that can't be imported is a usage error."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest
+        phmdoctest-preimport = no_such_module_xyz
+        """
+    )
+    rr = pytester.runpytest()
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*phmdoctest-preimport can't import no_such_module_xyz*"])
@@ -0,0 +1,121 @@
+"""Test cases for the --phmdoctest-cache-results option."""
+from pathlib import Path
+
+import pytest
+
+
+EXAMPLES = """\
+# Examples
+
+```python
+print("one")
+```
+
+```
+one
+```
+
+```python
+print("two")
+```
+
+```
+two
+```
+
+```py
+>>> 1 + 1
+2
+```
+"""
+
+
+@pytest.mark.parametrize("modules", ["tempdir", "memory"])
+def test_cached_pass(pytester, modules):
+    """Examples that passed are skipped until they change."""
+    pytester.makefile(".md", examples=EXAMPLES)
+    args = [
+        "-v",
+        "--phmdoctest-docmod",
+        "--phmdoctest-cache-results",
+        f"--phmdoctest-modules={modules}",
+    ]
+    pytester.runpytest(*args).assert_outcomes(passed=3)
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(skipped=3)
+    rr.stdout.fnmatch_lines(["phmdoctest cached passes: 3 skipped"])
+
+    # Change the expected output of one example.
+    Path("examples.md").write_text(
+        EXAMPLES.replace("two\n```\n\n```py", "2\n```\n\n```py")
+    )
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(failed=1, skipped=2)
+    # The failed example runs again.
+    pytester.runpytest(*args).assert_outcomes(failed=1, skipped=2)
+
+
+def test_setup_changed(pytester):
+    """Changing the setup block runs all the examples again."""
+    setup = """\
+        <!--phmdoctest-setup-->
+        ```python
+        x = {}
+        ```
+
+        ```python
+        print(x)
+        ```
+
+        ```
+        1
+        ```
+        """
+    pytester.makefile(".md", setup=setup.format(1))
+    args = ["--phmdoctest", "--phmdoctest-cache-results"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    pytester.runpytest(*args).assert_outcomes(skipped=1)
+    pytester.makefile(".md", setup=setup.format(2))
+    pytester.runpytest(*args).assert_outcomes(failed=1)
+
+
+def test_share_names(pytester):
+    """Examples that share names run together unless all of them passed."""
+    pytester.makefile(
+        ".md",
+        shared="""\
+        <!--phmdoctest-share-names-->
+        ```python
+        x = 1
+        ```
+
+        ```python
+        print(x)
+        ```
+
+        ```
+        1
+        ```
+
+        ```python
+        print("other")
+        ```
+
+        ```
+        changes
+        ```
+        """,
+    )
+    args = ["--phmdoctest", "--phmdoctest-cache-results"]
+    pytester.runpytest(*args).assert_outcomes(passed=2, failed=1)
+    # The failing example would run alone without x defined.
+    pytester.runpytest(*args).assert_outcomes(passed=2, failed=1)
+
+
+def test_cache_results_no_cacheprovider(pytester):
+    """--phmdoctest-cache-results needs the pytest cache."""
+    rr = pytester.runpytest(
+        "--phmdoctest", "--phmdoctest-cache-results", "-p", "no:cacheprovider"
+    )
+    assert rr.ret == pytest.ExitCode.USAGE_ERROR
+    rr.stderr.fnmatch_lines(["*needs the pytest cache*"])
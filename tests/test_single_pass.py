@@ -0,0 +1,73 @@
+"""Test cases for detection and generation from a single parse."""
+from pathlib import Path
+
+import pytest
+
+import phmdoctest.main
+import phmdoctest.tool
+
+from pytest_phmdoctest.generate import decode
+from pytest_phmdoctest.generate import generate
+from pytest_phmdoctest.generate import NO_SURVIVORS
+
+
+MARKDOWN_FILES = sorted(Path(".").glob("*.md")) + sorted(Path("tests").glob("**/*.md"))
+
+
+@pytest.mark.parametrize("path", MARKDOWN_FILES, ids=str)
+def test_same_as_phmdoctest(path):
+    """Same results as detect_python_examples() and testfile()."""
+    kwargs = {"markdown_file": path, "built_from": path.as_posix()}
+    generated = generate(decode(path.read_bytes()), kwargs)
+    examples = phmdoctest.tool.detect_python_examples(path)
+    assert generated.examples == examples
+    if examples.has_code or examples.has_session:
+        assert generated.test_file == phmdoctest.main.testfile(**kwargs)
+    else:
+        assert generated.test_file == ""
+
+
+def test_same_with_options():
+    """Same test file when phmdoctest-collect options are given."""
+    path = Path("tests/markdown/setup.md")
+    kwargs = {
+        "markdown_file": path,
+        "built_from": "setup.md",
+        "skips": ["mylist.append(4)"],
+        "setup": "FIRST",
+        "teardown": "LAST",
+        "setup_doctest": True,
+    }
+    generated = generate(decode(path.read_bytes()), kwargs)
+    assert generated.test_file == phmdoctest.main.testfile(**kwargs)
+
+
+def test_survivors():
+    """Report the examples left after skip directives and --skip."""
+    path = Path("tests/markdown/setup.md")
+    kwargs = {"markdown_file": path, "built_from": "setup.md"}
+    generated = generate(decode(path.read_bytes()), kwargs)
+    all_code = generated.survivors.code
+    assert generated.survivors.sessions == ()
+    kwargs["skips"] = ["mylist.append(4)"]
+    generated = generate(decode(path.read_bytes()), kwargs)
+    assert len(generated.survivors.code) == len(all_code) - 1
+    path = Path("tests/markdown/one_skipped_session.md")
+    kwargs = {"markdown_file": path, "built_from": "one_skipped_session.md"}
+    generated = generate(decode(path.read_bytes()), kwargs)
+    assert generated.examples.has_session
+    assert generated.survivors == NO_SURVIVORS
+
+
+def test_ini_error():
+    """A phmdoctest-collect parse error generates a failing test file."""
+    path = Path("tests/sample/README.md")
+    kwargs = {"markdown_file": path, "built_from": "README.md", "ini-error": "oops"}
+    generated = generate(decode(path.read_bytes()), kwargs)
+    assert "def test_ini_failed():" in generated.test_file
+    assert "oops" in generated.test_file
+
+
+def test_decode_newlines():
+    """Line endings are translated the same as reading in text mode."""
+    assert decode(b"a\r\nb\rc\n") == "a\nb\nc\n"
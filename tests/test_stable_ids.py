@@ -0,0 +1,94 @@
+"""Test cases for the phmdoctest-stable-ids ini option."""
+import pytest
+
+
+EXAMPLES = """\
+# Examples
+
+```python
+print("passes")
+```
+
+```
+passes
+```
+
+```python
+print("fails")
+```
+
+```
+oops
+```
+
+<!--phmdoctest-label test_my_label-->
+```python
+print("labelled")
+```
+
+```py
+>>> 1 + 1
+2
+```
+"""
+
+
+@pytest.mark.parametrize("modules", ["tempdir", "memory"])
+def test_last_failed_after_edit(pytester, modules):
+    """--lf reruns the failed example after lines are added above it."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest-docmod
+        phmdoctest-stable-ids = true
+        """
+    )
+    pytester.makefile(".md", examples=EXAMPLES)
+    args = ["-v", f"--phmdoctest-modules={modules}"]
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=3, failed=1)
+    rr.stdout.fnmatch_lines(
+        [
+            "*::examples.session_*",
+            "*::test_code_* PASSED*",
+            "*::test_code_* FAILED*",
+            "*::test_my_label PASSED*",
+        ]
+    )
+    rr.stdout.no_fnmatch_line("*test_code_3_*")
+    failed = [line.split()[1] for line in rr.outlines if line.startswith("FAILED")]
+
+    pytester.makefile(".md", examples="New paragraph.\n\n" + EXAMPLES)
+    rr2 = pytester.runpytest(*args, "--lf")
+    outcomes = rr2.parseoutcomes()
+    assert outcomes["failed"] == 1
+    assert "passed" not in outcomes
+    assert [line.split()[1] for line in rr2.outlines if line.startswith("FAILED")] == (
+        failed
+    )
+
+
+def test_repeated_examples(pytester):
+    """Examples with the same contents get numbered names."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest
+        phmdoctest-stable-ids = true
+        """
+    )
+    pytester.makefile(
+        ".md",
+        repeated="""\
+        ```python
+        print("same")
+        ```
+
+        ```python
+        print("same")
+        ```
+        """,
+    )
+    rr = pytester.runpytest("-v")
+    rr.assert_outcomes(passed=2)
+    rr.stdout.fnmatch_lines(["*::test_code_* PASSED*", "*::test_code_*_2 PASSED*"])
@@ -0,0 +1,117 @@
+"""Test cases for the --phmdoctest-modules option."""
+import os
+import time
+
+
+def test_memory_docmod(pytester, file_creator):
+    """Generated test modules are imported from memory."""
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest(
+        "-v", "--phmdoctest-docmod", "--phmdoctest-modules=memory", "--ignore=src"
+    )
+    rr.assert_outcomes(passed=10)
+    rr.stdout.fnmatch_lines(
+        [
+            "README.md::README.session_00001_line_24*",
+            "README.md::test_code_10_output_17*",
+            "doc/directive2.md::test_code_25_output_32*",
+            "doc/directive2.md::test_code_42_output_47*",
+            "doc/directive2.md::test_code_52_output_56*",
+            "doc/project.md::doc__project.session_00001_line_31*",
+            "doc/project.md::doc__project.session_00002_line_46*",
+            "doc/project.md::doc__project.session_00003_line_55*",
+            "doc/project.md::test_code_12_output_19*",
+            "tests/test_example.py::test_example*",
+        ],
+        consecutive=True,
+    )
+    rr.stdout.no_fnmatch_line("*::README.py::*")
+
+
+def test_memory_phmdoctest(pytester):
+    """Code and expected output examples are collected from memory."""
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest("-v", "--phmdoctest", "--phmdoctest-modules=memory")
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["README.md::test_code_10_output_17*"])
+
+
+def test_memory_failures_name_markdown(pytester):
+    """Failing tests show the generated lines and name the Markdown file."""
+    pytester.makefile(
+        ".md",
+        failing="""\
+        # Failing examples
+        ```python
+        x = 1
+        assert x == 2
+        ```
+
+        ```py
+        >>> 1 + 1
+        3
+        ```
+        """,
+    )
+    rr = pytester.runpytest("-v", "--phmdoctest-docmod", "--phmdoctest-modules=memory")
+    rr.assert_outcomes(failed=2)
+    rr.stdout.fnmatch_lines(
+        [
+            ">       assert x == 2",
+            "failing.md:*: AssertionError",
+        ]
+    )
+    rr.stdout.fnmatch_lines(
+        [
+            "*>>> 1 + 1",
+            "Expected:",
+            "    3",
+            "Got:",
+            "    2",
+            "*failing.md:*: DocTestFailure",
+        ]
+    )
+
+
+def test_cache_modules_reused(pytester):
+    """Unchanged generated test files are not written again."""
+    pytester.copy_example("tests/sample/README.md")
+    args = ["-v", "--phmdoctest-docmod", "--phmdoctest-modules=cache"]
+    rr1 = pytester.runpytest(*args)
+    rr1.assert_outcomes(passed=2)
+    rr1.stdout.fnmatch_lines(["README.md::README.session_00001_line_24*"])
+    modules = pytester.path / ".pytest_cache/d/phmdoctest/modules"
+    files = list(modules.glob("*/README.py"))
+    assert len(files) == 1
+    mtime = files[0].stat().st_mtime_ns
+
+    rr2 = pytester.runpytest(*args)
+    rr2.assert_outcomes(passed=2)
+    assert list(modules.glob("*/README.py")) == files
+    assert files[0].stat().st_mtime_ns == mtime
+
+
+def test_cache_modules_evicted(pytester):
+    """Generated test files not used for a week are removed."""
+    pytester.copy_example("tests/sample/README.md")
+    args = ["--phmdoctest", "--phmdoctest-modules=cache"]
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    modules = pytester.path / ".pytest_cache/d/phmdoctest/modules"
+    stale = modules / ("0" * 64)
+    stale.mkdir()
+    (stale / "old.py").write_text("", encoding="utf-8")
+    eight_days_ago = time.time() - 8 * 24 * 60 * 60
+    os.utime(stale, (eight_days_ago, eight_days_ago))
+    pytester.runpytest(*args).assert_outcomes(passed=1)
+    assert not stale.exists()
+    assert len(list(modules.glob("*/README.py"))) == 1
+
+
+def test_cache_modules_no_cacheprovider(pytester):
+    """Use the temporary directory when the pytest cache is disabled."""
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest(
+        "-v", "--phmdoctest", "--phmdoctest-modules=cache", "-p", "no:cacheprovider"
+    )
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["*::README.py::test_code_10_output_17*"])
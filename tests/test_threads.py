@@ -0,0 +1,114 @@
+"""Test cases for the --concurrent phmdoctest-collect option."""
+import time
+
+
+def slow_file(name: str) -> str:
+    """Return Markdown that prints while other files run."""
+    return f"""\
+# {name}
+
+```python
+import time
+for i in range(3):
+    print("{name}", i)
+    time.sleep(0.2)
+```
+
+```
+{name} 0
+{name} 1
+{name} 2
+```
+
+```python
+>>> print("{name}")
+{name}
+```
+"""
+
+
+def test_concurrent(pytester):
+    """Files run at the same time. Each thread's output is compared."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-collect =
+            *.md --concurrent
+        """
+    )
+    for name in "abcd":
+        pytester.makefile(".md", **{name: slow_file(name)})
+    start = time.perf_counter()
+    rr = pytester.runpytest("-v", "--phmdoctest-docmod")
+    elapsed = time.perf_counter() - start
+    rr.assert_outcomes(passed=8)
+    rr.stdout.fnmatch_lines(
+        [
+            "*a.py::a.session_00001_line_17 PASSED*",
+            "*a.py::test_code_4_output_11 PASSED*",
+            "*b.py::b.session_00001_line_17 PASSED*",
+            "*b.py::test_code_4_output_11 PASSED*",
+            "*c.py::c.session_00001_line_17 PASSED*",
+            "*c.py::test_code_4_output_11 PASSED*",
+            "*d.py::d.session_00001_line_17 PASSED*",
+            "*d.py::test_code_4_output_11 PASSED*",
+        ]
+    )
+    assert elapsed < 4 * 0.6
+
+
+def test_concurrent_failure(pytester):
+    """A failing example shows its output. Other files are not affected."""
+    pytester.makeini(
+        """
+        [pytest]
+        phmdoctest-collect =
+            fails.md --concurrent
+            *.md
+        """
+    )
+    pytester.makefile(
+        ".md",
+        fails="""\
+        ```python
+        print("expected")
+        print("got")
+        ```
+
+        ```
+        expected
+        wanted
+        ```
+        """,
+    )
+    pytester.makefile(".md", sequential=slow_file("sequential"))
+    rr = pytester.runpytest(
+        "--phmdoctest-docmod", "-o", "phmdoctest-concurrent-threads=2"
+    )
+    rr.assert_outcomes(passed=2, failed=1)
+    rr.stdout.fnmatch_lines(["*Captured stdout call*", "  expected", "- wanted"])
+
+
+def test_concurrent_changed_deps(pytester):
+    """With --phmdoctest-changed=deps the files run one at a time."""
+    pytester.makeini(
+        """
+        [pytest]
+        addopts = --phmdoctest
+        pythonpath = .
+        phmdoctest-collect =
+            *.md --concurrent
+        """
+    )
+    pytester.makepyfile(mylib="VALUE = 1\n")
+    pytester.makefile(".md", a="```python\nprint(1)\n```\n\n```\n1\n```\n")
+    pytester.makefile(
+        ".md", b="```python\nimport mylib\nprint(mylib.VALUE)\n```\n\n```\n1\n```\n"
+    )
+    args = ["-v", "--phmdoctest-changed=deps"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    pytester.runpytest(*args).assert_outcomes()
+    pytester.path.joinpath("mylib.py").write_text("VALUE = 1\nMORE = 2\n")
+    rr = pytester.runpytest(*args)
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(["*b.py::test_code_2_output_7 PASSED*"])
@@ -0,0 +1,76 @@
+"""Test cases for generating once on the pytest-xdist controller."""
+import pytest
+
+pytest.importorskip("xdist")
+
+
+def test_xdist_docmod(pytester, file_creator):
+    """The controller generates the test files and the workers reuse them."""
+    file_creator.populate_all(pytester_object=pytester)
+    rr = pytester.runpytest(
+        "-v", "-n", "2", "--dist=loadfile", "--phmdoctest-docmod", "--ignore=src"
+    )
+    rr.assert_outcomes(passed=10)
+    rr.stdout.fnmatch_lines(
+        ["phmdoctest xdist controller: 1 processes generated 3 files"]
+    )
+    entries = list((pytester.path / ".pytest_cache/d/phmdoctest/generated").iterdir())
+    assert len(entries) == 3
+    assert not [entry for entry in entries if entry.suffix != ".json"]
+
+
+def test_xdist_no_cacheprovider(pytester):
+    """Share a temporary directory when the pytest cache is disabled."""
+    pytester.copy_example("tests/sample/README.md")
+    rr = pytester.runpytest(
+        "-v", "-n", "2", "--dist=loadfile", "--phmdoctest", "-p", "no:cacheprovider"
+    )
+    rr.assert_outcomes(passed=1)
+    rr.stdout.fnmatch_lines(
+        ["phmdoctest xdist controller: 1 processes generated 1 files"]
+    )
+
+
+def test_xdist_generate(pytester, file_creator):
+    """Only the controller cleans DIR. The workers collect the same files."""
+    file_creator.populate_all(pytester_object=pytester)
+    gendir = pytester.mkdir(".gendir")
+    stale = gendir / "test_stale.py"
+    stale.write_text("def test_stale():\n    assert False\n", encoding="utf-8")
+    rr = pytester.runpytest(
+        "-v",
+        "-n",
+        "2",
+        "--dist=loadfile",
+        "--phmdoctest-generate=.gendir",
+        ".",
+        ".gendir",
+    )
+    rr.assert_outcomes(passed=6)
+    assert not stale.exists()
+    assert (gendir / "notest_stale.sav").exists()
+    assert sorted(p.name for p in gendir.glob("*.py")) == [
+        "test_README.py",
+        "test_doc__directive2.py",
+        "test_doc__project.py",
+    ]
+
+
+def test_xdist_cache_results(pytester):
+    """The controller saves the passes reported by the workers."""
+    pytester.copy_example("tests/sample/README.md")
+    args = ["-n", "2", "--phmdoctest-docmod", "--phmdoctest-cache-results"]
+    pytester.runpytest(*args).assert_outcomes(passed=2)
+    pytester.runpytest(*args).assert_outcomes(skipped=2)
+
+
+def test_xdist_changed(pytester):
+    """The controller saves the Markdown files the workers reported."""
+    pytester.makefile(
+        ".md",
+        failing="```python\nassert False\n```\n",
+        passing="```python\nassert True\n```\n",
+    )
+    args = ["-n", "2", "--phmdoctest", "--phmdoctest-changed=last-run"]
+    pytester.runpytest(*args).assert_outcomes(passed=1, failed=1)
+    pytester.runpytest(*args).assert_outcomes(failed=1)